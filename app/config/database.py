@@ -1,29 +1,97 @@
 import os
+import httpx
 from supabase import create_client, Client
 from dotenv import load_dotenv
 
 load_dotenv()
 
+FAKE_SUPABASE_URL = "http://fake-supabase"
+
+
 class DatabaseConfig:
     def __init__(self):
         self.SUPABASE_URL = os.getenv("Supabase_Project_URL")
         self.SUPABASE_KEY = os.getenv("Supabase_API_Key")
-        
-        if not self.SUPABASE_URL or not self.SUPABASE_KEY:
-            raise ValueError("Supabase URL and API Key must be set in environment variables")
-        
+
+        # SUPABASE_FAKE=true: PostgREST giả lập in-process (app/models/fake_postgrest.py) cho
+        # benchmark / chạy thử không cần project Supabase; dữ liệu chỉ nằm trong bộ nhớ
+        self.FAKE = os.getenv("SUPABASE_FAKE", "false").lower() == "true"
+        self.FAKE_LATENCY_MS = float(os.getenv("SUPABASE_FAKE_LATENCY_MS", "0"))
+        self.fake_app = None
+
+        # Connection pool dùng chung cho toàn bộ worker (PostgREST qua HTTP)
+        self.POOL_MAX_CONNECTIONS = int(os.getenv("SUPABASE_POOL_MAX_CONNECTIONS", "50"))
+        self.POOL_MAX_KEEPALIVE = int(os.getenv("SUPABASE_POOL_MAX_KEEPALIVE", "20"))
+        self.POOL_KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_POOL_KEEPALIVE_EXPIRY", "30"))
+        self.HTTP_TIMEOUT = float(os.getenv("SUPABASE_HTTP_TIMEOUT", "10"))
+
         self._client = None
-    
+        self._async_client = None
+
+    def _require_credentials(self):
+        """Kiểm tra cấu hình lúc dùng lần đầu (không raise lúc import)"""
+        if not self.SUPABASE_URL or not self.SUPABASE_KEY:
+            raise ValueError("Supabase URL and API Key must be set in environment variables (hoặc SUPABASE_FAKE=true)")
+
     @property
     def client(self) -> Client:
         """Get Supabase client instance (singleton pattern)"""
+        if self.FAKE:
+            raise RuntimeError("SUPABASE_FAKE chỉ hỗ trợ async_client (PostgREST qua httpx)")
+        self._require_credentials()
         if self._client is None:
             self._client = create_client(self.SUPABASE_URL, self.SUPABASE_KEY)
         return self._client
 
+    @property
+    def rest_url(self) -> str:
+        """Base URL của PostgREST"""
+        if self.FAKE:
+            return f"{FAKE_SUPABASE_URL}/rest/v1"
+        self._require_credentials()
+        return f"{self.SUPABASE_URL.rstrip('/')}/rest/v1"
+
+    def _create_fake_client(self) -> httpx.AsyncClient:
+        from app.models.fake_postgrest import create_fake_postgrest
+
+        self.fake_app = create_fake_postgrest(latency_ms=self.FAKE_LATENCY_MS)
+        return httpx.AsyncClient(
+            base_url=self.rest_url,
+            transport=httpx.ASGITransport(app=self.fake_app),
+            timeout=self.HTTP_TIMEOUT,
+        )
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        """Get async HTTP client với connection pool giới hạn + HTTP/2 keep-alive (singleton)"""
+        if self._async_client is None and self.FAKE:
+            self._async_client = self._create_fake_client()
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                base_url=self.rest_url,
+                headers={
+                    "apikey": self.SUPABASE_KEY,
+                    "Authorization": f"Bearer {self.SUPABASE_KEY}",
+                },
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=self.POOL_MAX_CONNECTIONS,
+                    max_keepalive_connections=self.POOL_MAX_KEEPALIVE,
+                    keepalive_expiry=self.POOL_KEEPALIVE_EXPIRY,
+                ),
+                timeout=self.HTTP_TIMEOUT,
+            )
+        return self._async_client
+
+    async def aclose(self):
+        """Đóng connection pool khi shutdown"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
 # Global database instance
 db_config = DatabaseConfig()
 
 def get_supabase() -> Client:
     """Dependency function to get Supabase client"""
-    return db_config.client
\ No newline at end of file
+    return db_config.client
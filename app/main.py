@@ -1,28 +1,61 @@
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from datetime import datetime
 
 from app.routers import auth, chat, uploadfile
 from app.config.database import db_config
+from app.models.repository import repository
+from app.models.security import password_hasher, require_stats_token, token_cache
+from app.models.api_keys import api_key_store
+from app.models.write_behind import write_behind
+from app.models.revocation import revocation_list
+from app.models.metrics import CONTENT_TYPE, METRICS_ENABLED, MetricsMiddleware, loop_lag_monitor, render_metrics
+from app.models.generation import get_generation_scheduler
+from app.models.ingestion import ingestion_queue
+from app.models.blob_store import blob_store
+from app.models.retrieval import get_retriever
+from app.models.rate_limit import RATE_LIMIT_ENABLED, RateLimitMiddleware, get_rate_limiter
+from app.models.serialization import DefaultJSONResponse
+from app.models.conditional import response_cache
+from app.models.answer_cache import answer_cache
+from app.models.websocket import websocket_hub
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     print("Starting up Chat API...")
-    print(f"Supabase connection initialized: {bool(db_config.client)}")
+    print(f"Supabase REST: {db_config.rest_url}" + (" (fake in-process)" if db_config.FAKE else ""))
+    await loop_lag_monitor.start()
+    await ingestion_queue.start()
+    await write_behind.start()
+    await revocation_list.start()
+    await websocket_hub.start()
     yield
     # Shutdown
     print("Shutting down Chat API...")
+    await websocket_hub.drain()  # chờ các lượt chat WebSocket đang chạy xong trước khi đóng pool
+    await ingestion_queue.stop()
+    await revocation_list.stop()
+    await write_behind.stop()  # ghi nốt last_login/last_used đang chờ trước khi đóng pool
+    await db_config.aclose()
+    password_hasher.shutdown()
+    await loop_lag_monitor.stop()
 
 app = FastAPI(
     title="Secure Chat API",
     description="API bảo mật để quản lý chat với Supabase và JWT Authentication",
     version="2.0.0",
+    default_response_class=DefaultJSONResponse,
     lifespan=lifespan
 )
 
+# Rate limiting (thêm trước CORS để response 429 vẫn có header CORS); tạo limiter ngay
+# để backend cấu hình sai (thiếu package `redis`...) làm app lỗi lúc khởi động
+if RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware, limiter=get_rate_limiter())
+
 # CORS Middleware
 app.add_middleware(
     CORSMiddleware,
@@ -30,8 +63,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "X-RateLimit-Limit", "X-RateLimit-Remaining", "X-RateLimit-Reset", "Retry-After"],
 )
 
+# Metrics (ngoài cùng: đo cả thời gian của rate limit + CORS)
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(chat.router)
@@ -47,6 +85,31 @@ async def health_check():
         "version": "2.0.0"
     }
 
+@app.get("/stats", dependencies=[Depends(require_stats_token)])
+async def stats():
+    """Thống kê cache in-process của worker hiện tại (cần header X-Stats-Token)"""
+    return {
+        "ownership_cache": repository.cache_stats(),
+        "password_hasher": password_hasher.stats(),
+        "token_cache": token_cache.stats(),
+        "api_keys": api_key_store.stats(),
+        "write_behind": write_behind.stats(),
+        "revocation": revocation_list.stats(),
+        "response_cache": response_cache.stats(),
+        "websocket": websocket_hub.stats(),
+        "generation": get_generation_scheduler().stats(),
+        "answer_cache": answer_cache.stats(),
+        "ingestion": ingestion_queue.stats(),
+        "blob_store": blob_store.stats(),
+        "retrieval": get_retriever().stats(),
+        "rate_limit": get_rate_limiter().stats(),
+    }
+
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(require_stats_token)])
+async def metrics():
+    """Metrics của worker hiện tại theo định dạng Prometheus (cần `X-Stats-Token` như /stats)"""
+    return Response(render_metrics(), media_type=CONTENT_TYPE)
+
 @app.get("/")
 async def root():
     """Root endpoint với thông tin API"""
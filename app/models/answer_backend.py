@@ -0,0 +1,106 @@
+"""
+Backend sinh câu trả lời cho chatbot.
+
+Mọi backend cài đặt `stream(question, context)` dạng async generator trả về
+từng token; `generate(question, context)` mặc định gom toàn bộ stream thành một
+chuỗi và `generate_batch(questions, contexts)` mặc định gọi `generate` cho từng
+câu. Backend hỗ trợ batch thật (một lần gọi model cho nhiều prompt) override
+`generate_batch`. `context` là các đoạn tài liệu retrieval tìm được, backend
+gọi model thật dựng prompt bằng `build_prompt`.
+"""
+import asyncio
+import os
+import re
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Type
+
+ANSWER_BACKEND = os.getenv("ANSWER_BACKEND", "fake")
+FAKE_ANSWER_TOKEN_DELAY_MS = float(os.getenv("FAKE_ANSWER_TOKEN_DELAY_MS", "0"))
+FAKE_ANSWER_CALL_LATENCY_MS = float(os.getenv("FAKE_ANSWER_CALL_LATENCY_MS", "0"))
+
+
+def build_prompt(question: str, context: Sequence[str] = ()) -> str:
+    """Prompt cho model: các đoạn tài liệu liên quan (nếu có) + câu hỏi"""
+    if not context:
+        return question
+    sources = "\n\n".join(f"[{index}] {text}" for index, text in enumerate(context, start=1))
+    return (
+        "Trả lời câu hỏi dựa trên các đoạn tài liệu sau (nếu liên quan).\n\n"
+        f"{sources}\n\nCâu hỏi: {question}"
+    )
+
+
+class AnswerBackend(ABC):
+    """Interface backend sinh câu trả lời"""
+
+    name = "chatbot"
+
+    @abstractmethod
+    def stream(self, question: str, context: Sequence[str] = ()) -> AsyncIterator[str]:
+        """Sinh câu trả lời theo từng token (async generator)"""
+        yield  # để hàm là async generator
+
+    async def generate(self, question: str, context: Sequence[str] = ()) -> str:
+        return "".join([token async for token in self.stream(question, context)])
+
+    async def generate_batch(self, questions: List[str],
+                             contexts: Optional[List[Sequence[str]]] = None) -> List[str]:
+        contexts = contexts or [()] * len(questions)
+        return list(await asyncio.gather(
+            *(self.generate(question, context) for question, context in zip(questions, contexts))
+        ))
+
+
+class FakeAnswerBackend(AnswerBackend):
+    """
+    Backend giả, kết quả xác định (deterministic) để test offline:
+    - mỗi lần gọi model (một câu hoặc cả batch) chờ `call_latency` giây
+    - khi stream, mỗi token chờ thêm `token_delay` giây
+    """
+
+    def __init__(
+        self,
+        token_delay: float = FAKE_ANSWER_TOKEN_DELAY_MS / 1000,
+        call_latency: float = FAKE_ANSWER_CALL_LATENCY_MS / 1000,
+    ):
+        self.token_delay = token_delay
+        self.call_latency = call_latency
+
+    @staticmethod
+    def answer(question: str, context: Sequence[str] = ()) -> str:
+        answer = f"Đây là câu trả lời mẫu từ chatbot cho câu hỏi: {question}"
+        if context:
+            answer += f" (tham khảo {len(context)} đoạn tài liệu)"
+        return answer
+
+    async def stream(self, question: str, context: Sequence[str] = ()) -> AsyncIterator[str]:
+        if self.call_latency:
+            await asyncio.sleep(self.call_latency)
+        for token in re.findall(r"\S+\s*", self.answer(question, context)):
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            yield token
+
+    async def generate(self, question: str, context: Sequence[str] = ()) -> str:
+        return (await self.generate_batch([question], [context]))[0]
+
+    async def generate_batch(self, questions: List[str],
+                             contexts: Optional[List[Sequence[str]]] = None) -> List[str]:
+        if self.call_latency:
+            await asyncio.sleep(self.call_latency)
+        contexts = contexts or [()] * len(questions)
+        return [self.answer(question, context) for question, context in zip(questions, contexts)]
+
+
+BACKENDS: Dict[str, Type[AnswerBackend]] = {
+    "fake": FakeAnswerBackend,
+}
+
+_backend: Optional[AnswerBackend] = None
+
+def get_answer_backend() -> AnswerBackend:
+    """Dependency function to get answer backend (chọn qua biến môi trường ANSWER_BACKEND)"""
+    global _backend
+    if _backend is None:
+        _backend = BACKENDS[ANSWER_BACKEND]()
+    return _backend
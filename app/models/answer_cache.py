@@ -0,0 +1,276 @@
+"""
+Cache câu trả lời cho `POST /chat/`, `POST /chat/batch`, `POST /chat/stream` và WebSocket chat.
+
+- Key: câu hỏi đã chuẩn hoá (chữ thường, bỏ dấu tiếng Việt, bỏ dấu câu, gộp
+  khoảng trắng) + fingerprint của các đoạn tài liệu retrieval trả về. Cùng câu
+  hỏi nhưng tài liệu khác (user khác, user upload thêm file) là key khác, nên
+  câu trả lời dựng từ tài liệu của user này không lộ sang user khác
+- Tầng gần trùng (tuỳ chọn, `ANSWER_CACHE_NEAR_DUPLICATES`): feature là từng
+  từ + cặp từ liền nhau của câu hỏi sau khi bỏ hư từ / từ đệm (`FILLER_WORDS`);
+  MinHash + LSH theo band để lấy ứng viên, rồi tính Jaccard thật trên tập
+  feature, ứng viên giống nhất đạt `ANSWER_CACHE_SIMILARITY` là hit. Chỉ so
+  trong cùng fingerprint tài liệu. Đổi một từ nội dung mất cả từ đó lẫn các
+  cặp từ quanh nó ("bảo hành" -> "bảo hiểm"), nên ngưỡng cao giữ câu khác
+  nghĩa ở ngoài; thêm / bớt hư từ không đổi feature
+- LRU + TTL, giới hạn theo tổng số byte ước lượng (`ANSWER_CACHE_MAX_BYTES`)
+- User trong `ANSWER_CACHE_OPT_OUT` không đọc cũng không ghi cache
+- Mỗi worker một cache riêng (như các cache in-process khác)
+"""
+import hashlib
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Hashable, Iterable, List, Optional, Sequence, Set, Tuple
+
+from app.models.metrics import Counter, Gauge
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_MAX_BYTES = int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+ANSWER_CACHE_NEAR_DUPLICATES = os.getenv("ANSWER_CACHE_NEAR_DUPLICATES", "false").lower() == "true"
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.7"))
+# Danh sách user_id (phân tách bằng dấu phẩy) không dùng cache
+ANSWER_CACHE_OPT_OUT = os.getenv("ANSWER_CACHE_OPT_OUT", "")
+
+# `generated_by` của answer lấy từ cache
+CACHE_GENERATED_BY = "cache"
+
+# MinHash: 30 hàm băm chia 10 band x 3 dòng -> Jaccard 0.7 gần như chắc chắn
+# thành ứng viên (~98%), Jaccard 0.3 chỉ ~24% (rồi bị loại khi tính Jaccard thật)
+MINHASH_BANDS = 10
+MINHASH_ROWS = 3
+_MERSENNE_PRIME = (1 << 61) - 1
+_PERMUTATIONS = [
+    (
+        int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), "big") % (_MERSENNE_PRIME - 1) + 1,
+        int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE_PRIME,
+    )
+    for i in range(MINHASH_BANDS * MINHASH_ROWS)
+]
+
+# Ước lượng phần bộ nhớ cố định của một entry (object, key, index LSH)
+ENTRY_OVERHEAD_BYTES = 512
+FEATURE_OVERHEAD_BYTES = 64
+
+ANSWER_CACHE_LOOKUPS = Counter(
+    "answer_cache_lookups_total", "Lần tra cache câu trả lời theo kết quả", ("result",),
+)
+ANSWER_CACHE_SAVED_SECONDS = Counter(
+    "answer_cache_saved_generation_seconds_total", "Thời gian sinh câu trả lời tiết kiệm được nhờ cache",
+)
+
+_WORD = re.compile(r"\w+")
+
+# Hư từ / từ đệm (giữ dấu: bỏ dấu thì "bạn" trùng "bán", "về" trùng "vé"...)
+FILLER_WORDS = frozenset(
+    "cho tôi hỏi xin vui lòng giúp mình em bạn ơi ạ nhé nha vậy thế nào gì là của trong về với thì mà được như".split()
+)
+
+
+def normalize_question(text: str) -> str:
+    """'  Điều KHOẢN thanh toán?? ' -> 'dieu khoan thanh toan'"""
+    text = unicodedata.normalize("NFD", text.lower()).replace("đ", "d")
+    text = "".join(char for char in text if unicodedata.category(char) != "Mn")
+    return " ".join(_WORD.findall(text))
+
+
+def content_words(question: str) -> List[str]:
+    """Các từ không phải hư từ (giữ thứ tự), đã chuẩn hoá như `normalize_question`"""
+    words = _WORD.findall(unicodedata.normalize("NFC", question.lower()))
+    return [normalize_question(word) for word in words if word not in FILLER_WORDS]
+
+
+def context_fingerprint(context: Sequence[str]) -> bytes:
+    digest = hashlib.blake2b(digest_size=16)
+    for text in context:
+        digest.update(text.encode())
+        digest.update(b"\x1f")
+    return digest.digest()
+
+
+def shingles(words: Sequence[str]) -> FrozenSet[str]:
+    """Feature cho tầng gần trùng: từng từ + từng cặp từ liền nhau (giữ một phần thứ tự)"""
+    return frozenset([*words, *(f"{first} {second}" for first, second in zip(words, words[1:]))])
+
+
+def minhash_bands(features: Iterable[str]) -> Tuple[Tuple[int, ...], ...]:
+    hashes = [int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "big")
+              for feature in features]
+    if not hashes:
+        return ()
+    signature = [min((a * value + b) % _MERSENNE_PRIME for value in hashes) for a, b in _PERMUTATIONS]
+    return tuple(
+        tuple(signature[band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS]) for band in range(MINHASH_BANDS)
+    )
+
+
+def jaccard(first: FrozenSet[str], second: FrozenSet[str]) -> float:
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+class _Entry:
+    __slots__ = ("answer", "features", "bands", "size", "expires_at", "generation_seconds")
+
+    def __init__(self, answer: str, features: FrozenSet[str], bands: tuple, size: int,
+                 expires_at: float, generation_seconds: float):
+        self.answer = answer
+        self.features = features
+        self.bands = bands
+        self.size = size
+        self.expires_at = expires_at
+        self.generation_seconds = generation_seconds
+
+
+class AnswerCache:
+    """LRU + TTL câu trả lời theo (fingerprint tài liệu, câu hỏi đã chuẩn hoá)"""
+
+    def __init__(self, enabled: bool = ANSWER_CACHE_ENABLED, ttl: float = ANSWER_CACHE_TTL,
+                 max_bytes: int = ANSWER_CACHE_MAX_BYTES, near_duplicates: bool = ANSWER_CACHE_NEAR_DUPLICATES,
+                 similarity: float = ANSWER_CACHE_SIMILARITY, opt_out: Iterable[str] = ()):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.near_duplicates = near_duplicates
+        self.similarity = similarity
+        self.opt_out: Set[str] = {user_id.strip() for user_id in opt_out if user_id.strip()}
+        self.bytes = 0
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.evictions = 0
+        self.expired = 0
+        self.saved_seconds = 0.0
+        self._data: "OrderedDict[Tuple[bytes, str], _Entry]" = OrderedDict()
+        # (fingerprint, band, giá trị band) -> key các entry
+        self._bands: Dict[Hashable, Set[Tuple[bytes, str]]] = {}
+
+    def usable(self, user_id: Optional[str]) -> bool:
+        return self.enabled and user_id not in self.opt_out
+
+    def get(self, user_id: Optional[str], question: str, context: Sequence[str]) -> Optional[str]:
+        """Câu trả lời đã cache hoặc None; user opt-out luôn None"""
+        if not self.usable(user_id):
+            self.skipped += 1
+            return None
+        fingerprint = context_fingerprint(context)
+        normalized = normalize_question(question)
+        key = (fingerprint, normalized)
+        now = time.monotonic()
+
+        entry = self._live(key, now)
+        result = "exact"
+        if entry is None and self.near_duplicates:
+            entry = self._nearest(fingerprint, shingles(content_words(question)), now)
+            result = "near"
+        if entry is None:
+            self.misses += 1
+            ANSWER_CACHE_LOOKUPS.labels("miss").inc()
+            return None
+
+        if result == "exact":
+            self.exact_hits += 1
+        else:
+            self.near_hits += 1
+        ANSWER_CACHE_LOOKUPS.labels(result).inc()
+        self.saved_seconds += entry.generation_seconds
+        ANSWER_CACHE_SAVED_SECONDS.inc(entry.generation_seconds)
+        return entry.answer
+
+    def put(self, user_id: Optional[str], question: str, context: Sequence[str], answer: str,
+            generation_seconds: float = 0.0):
+        if not self.usable(user_id):
+            return
+        fingerprint = context_fingerprint(context)
+        normalized = normalize_question(question)
+        key = (fingerprint, normalized)
+        features = shingles(content_words(question)) if self.near_duplicates else frozenset()
+        bands = minhash_bands(features) if features else ()
+        size = (ENTRY_OVERHEAD_BYTES + len(answer.encode()) + len(normalized)
+                + sum(len(feature) + FEATURE_OVERHEAD_BYTES for feature in features))
+        if size > self.max_bytes:
+            return
+
+        self._pop(key)
+        self._data[key] = _Entry(answer, features, bands, size, time.monotonic() + self.ttl, generation_seconds)
+        self.bytes += size
+        for band, value in enumerate(bands):
+            self._bands.setdefault((fingerprint, band, value), set()).add(key)
+        while self.bytes > self.max_bytes and self._data:
+            self._pop(next(iter(self._data)))
+            self.evictions += 1
+
+    def _live(self, key: Tuple[bytes, str], now: float) -> Optional[_Entry]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= now:
+            self._pop(key)
+            self.expired += 1
+            return None
+        self._data.move_to_end(key)
+        return entry
+
+    def _nearest(self, fingerprint: bytes, features: FrozenSet[str], now: float) -> Optional[_Entry]:
+        candidates: Set[Tuple[bytes, str]] = set()
+        for band, value in enumerate(minhash_bands(features)):
+            candidates.update(self._bands.get((fingerprint, band, value), ()))
+        best_key, best_score = None, self.similarity
+        for key in candidates:
+            score = jaccard(features, self._data[key].features)
+            if score >= best_score:
+                best_key, best_score = key, score
+        return self._live(best_key, now) if best_key is not None else None
+
+    def _pop(self, key: Tuple[bytes, str]):
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return
+        self.bytes -= entry.size
+        for band, value in enumerate(entry.bands):
+            index_key = (key[0], band, value)
+            keys = self._bands.get(index_key)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._bands[index_key]
+
+    def clear(self):
+        self._data.clear()
+        self._bands.clear()
+        self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.exact_hits + self.near_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "near_duplicates": self.near_duplicates,
+            "size": len(self._data),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "exact_hits": self.exact_hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "skipped": self.skipped,
+            "hit_ratio": round((self.exact_hits + self.near_hits) / lookups, 4) if lookups else 0.0,
+            "saved_generation_seconds": round(self.saved_seconds, 3),
+            "evictions": self.evictions,
+            "expired": self.expired,
+        }
+
+
+# Global answer cache
+answer_cache = AnswerCache(opt_out=ANSWER_CACHE_OPT_OUT.split(","))
+
+def get_answer_cache() -> AnswerCache:
+    """Dependency function to get answer cache"""
+    return answer_cache
+
+Gauge("answer_cache_bytes", "Dung lượng ước lượng của cache câu trả lời", lambda: answer_cache.bytes)
@@ -0,0 +1,113 @@
+"""
+API key cho client máy (service-to-service), thay cho việc login lại mỗi 30 phút.
+
+- Key chỉ hiển thị một lần lúc tạo; DB lưu sha256(key) (key ngẫu nhiên đủ
+  dài nên không cần bcrypt) và vài ký tự đầu để nhận diện
+- Tra cứu qua TTLCache theo digest; key không tồn tại cũng được cache (TTL
+  ngắn hơn) để key rác không đập thẳng vào DB
+- `last_used` không ghi mỗi request mà đi qua write-behind (gộp theo key,
+  ghi theo lô)
+"""
+import hashlib
+import os
+import secrets
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional
+
+from app.models.cache import TTLCache
+from app.models.repository import SupabaseRepository, get_repository
+from app.models.write_behind import WriteBehindQueue, get_write_behind_queue
+from app.schemas.security import RateLimitConfig
+
+API_KEY_PREFIX = "sk_"
+API_KEY_DISPLAY_CHARS = 8
+API_KEY_CACHE_SIZE = int(os.getenv("API_KEY_CACHE_SIZE", "10000"))
+API_KEY_CACHE_TTL = float(os.getenv("API_KEY_CACHE_TTL", "60"))
+API_KEY_NEGATIVE_CACHE_TTL = float(os.getenv("API_KEY_NEGATIVE_CACHE_TTL", "30"))
+
+# Đánh dấu "key không tồn tại" trong cache (None = chưa có trong cache)
+_UNKNOWN = object()
+
+
+def generate_api_key() -> str:
+    return API_KEY_PREFIX + secrets.token_urlsafe(32)
+
+
+def hash_api_key(key: str) -> str:
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def mask_api_key(key_prefix: str) -> str:
+    """Dạng hiển thị của key đã lưu (chỉ còn phần đầu)"""
+    return f"{key_prefix}…"
+
+
+@dataclass
+class APIKeyRecord:
+    id: str
+    user_id: str
+    is_active: bool
+    rate_limit: Optional[RateLimitConfig] = None
+
+    @classmethod
+    def from_row(cls, row: dict) -> "APIKeyRecord":
+        rate_limit = row.get("rate_limit")
+        return cls(
+            id=row["id"],
+            user_id=row["user_id"],
+            is_active=row.get("is_active", True),
+            rate_limit=RateLimitConfig(**rate_limit) if rate_limit else None,
+        )
+
+
+class APIKeyStore:
+    """Tra cứu key có cache; `last_used` ghi qua write-behind"""
+
+    def __init__(self, repo: Optional[SupabaseRepository] = None, writes: Optional[WriteBehindQueue] = None):
+        self._repo = repo
+        self._writes = writes
+        self.cache = TTLCache(API_KEY_CACHE_SIZE, API_KEY_CACHE_TTL)
+
+    @property
+    def repo(self) -> SupabaseRepository:
+        return self._repo or get_repository()
+
+    @property
+    def writes(self) -> WriteBehindQueue:
+        return self._writes or get_write_behind_queue()
+
+    async def resolve(self, key: str) -> Optional[APIKeyRecord]:
+        """Key -> record (kể cả key đã thu hồi, is_active=False); None nếu không tồn tại"""
+        digest = hash_api_key(key)
+        cached = self.cache.get(digest)
+        if cached is _UNKNOWN:
+            return None
+        if cached is not None:
+            return cached
+
+        row = await self.repo.get_api_key_by_hash(digest)
+        if row is None:
+            self.cache.set(digest, _UNKNOWN, ttl=API_KEY_NEGATIVE_CACHE_TTL)
+            return None
+        record = APIKeyRecord.from_row(row)
+        self.cache.set(digest, record)
+        return record
+
+    def invalidate(self, key_hash: str):
+        """Bỏ key khỏi cache của worker hiện tại (worker khác hết hạn theo TTL)"""
+        self.cache.pop(key_hash)
+
+    def touch(self, record: APIKeyRecord):
+        self.writes.enqueue("api_keys", record.id, {"last_used": datetime.now(timezone.utc).isoformat()})
+
+    def stats(self) -> dict:
+        return {"cache": self.cache.stats()}
+
+
+# Global API key store
+api_key_store = APIKeyStore()
+
+def get_api_key_store() -> APIKeyStore:
+    """Dependency function to get API key store"""
+    return api_key_store
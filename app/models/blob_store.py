@@ -0,0 +1,268 @@
+"""
+Kho file upload theo nội dung (content-addressed).
+
+- Mỗi file được lưu một lần tại `blobs/<2 ký tự đầu>/<sha256><đuôi file>`;
+  SHA-256 được tính trong lúc nhận upload, blob đã tồn tại thì bỏ qua ghi đĩa
+- Mỗi user giữ tham chiếu (user_id, filename) -> blob, dung lượng đã dùng được
+  cộng dồn trong bảng `usage` nên kiểm tra quota không cần quét thư mục
+- Job ingest đang chờ/chạy giữ thêm một tham chiếu (`commit(pin=True)` ... `unpin`):
+  user upload đè filename trong lúc đó thì blob chưa bị xoá khỏi đĩa
+- Cache kết quả trích xuất theo blob, giới hạn tổng dung lượng, xoá LRU
+
+Metadata nằm trong SQLite (thư viện chuẩn) để nhiều uvicorn worker dùng chung.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from fastapi import UploadFile
+
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", "uploads"))
+USER_UPLOAD_QUOTA_BYTES = int(os.getenv("USER_UPLOAD_QUOTA_BYTES", str(100 * 1024 * 1024)))
+EXTRACTION_CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+RECEIVE_CHUNK_SIZE = 256 * 1024
+
+SCHEMA = """
+create table if not exists blobs (
+    id text primary key,
+    size integer not null,
+    refcount integer not null default 0,
+    created_at real not null
+);
+create table if not exists refs (
+    user_id text not null,
+    filename text not null,
+    blob_id text not null,
+    size integer not null,
+    content_type text,
+    uploaded_at real not null,
+    primary key (user_id, filename)
+);
+create table if not exists usage (
+    user_id text primary key,
+    bytes integer not null default 0
+);
+create table if not exists extracted (
+    blob_id text primary key,
+    size integer not null,
+    last_access real not null
+);
+create index if not exists extracted_last_access on extracted (last_access);
+"""
+
+
+class FileTooLarge(ValueError):
+    pass
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+@dataclass
+class ReceivedUpload:
+    digest: str
+    data: bytes
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+
+@dataclass
+class StoredBlob:
+    blob_id: str
+    path: Path
+    size: int
+    deduplicated: bool
+
+
+class BlobStore:
+    def __init__(
+        self,
+        root: Path = UPLOAD_DIR,
+        quota_bytes: int = USER_UPLOAD_QUOTA_BYTES,
+        cache_max_bytes: int = EXTRACTION_CACHE_MAX_BYTES,
+    ):
+        self.root = Path(root)
+        self.quota_bytes = quota_bytes
+        self.cache_max_bytes = cache_max_bytes
+        self.dedup_hits = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_evictions = 0
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+    # SQLite
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            self.root.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(
+                self.root / "store.db", timeout=30, isolation_level=None, check_same_thread=False
+            )
+            self._db.execute("pragma journal_mode=wal")
+            self._db.executescript(SCHEMA)
+        return self._db
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self.db.execute("begin immediate")
+            try:
+                yield self.db
+            except BaseException:
+                self.db.execute("rollback")
+                raise
+            self.db.execute("commit")
+
+    def blob_path(self, blob_id: str) -> Path:
+        return self.root / "blobs" / blob_id[:2] / blob_id
+
+    def extracted_path(self, blob_id: str) -> Path:
+        return self.root / "extracted" / f"{blob_id}.txt"
+
+    # Upload
+    async def receive(self, file: UploadFile, max_size: int) -> ReceivedUpload:
+        """Đọc upload theo chunk, tính SHA-256 song song; giữ nội dung trong RAM (tối đa max_size)"""
+        hasher = hashlib.sha256()
+        chunks = []
+        size = 0
+        while chunk := await file.read(RECEIVE_CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_size:
+                raise FileTooLarge(f"File too large. Max size is {max_size / (1024 * 1024)}MB.")
+            hasher.update(chunk)
+            chunks.append(chunk)
+        return ReceivedUpload(hasher.hexdigest(), b"".join(chunks))
+
+    def commit(
+        self, user_id: str, filename: str, content_type: Optional[str], upload: ReceivedUpload, pin: bool = False
+    ) -> StoredBlob:
+        """
+        Gắn upload vào user: kiểm tra quota, ghi blob nếu chưa có, cập nhật refcount/usage.
+        `pin`: giữ thêm một tham chiếu cho job xử lý file, trả lại bằng `unpin(blob_id)`.
+        Chạy blocking -> gọi qua threadpool.
+        """
+        blob_id = upload.digest + Path(filename).suffix.lower()
+        path = self.blob_path(blob_id)
+
+        with self._transaction() as db:
+            old = db.execute(
+                "select blob_id, size from refs where user_id = ? and filename = ?", (user_id, filename)
+            ).fetchone()
+            row = db.execute("select bytes from usage where user_id = ?", (user_id,)).fetchone()
+            used = row[0] if row else 0
+            new_usage = used - (old[1] if old else 0) + upload.size
+            if new_usage > self.quota_bytes:
+                raise QuotaExceeded(
+                    f"Vượt quá dung lượng lưu trữ ({self.quota_bytes / (1024 * 1024):g}MB)"
+                )
+
+            exists = db.execute("select 1 from blobs where id = ?", (blob_id,)).fetchone() is not None
+            if exists and path.exists():
+                self.dedup_hits += 1
+            else:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+                tmp_path.write_bytes(upload.data)
+                os.replace(tmp_path, path)
+                db.execute(
+                    "insert or ignore into blobs (id, size, refcount, created_at) values (?, ?, 0, ?)",
+                    (blob_id, upload.size, time.time()),
+                )
+
+            db.execute("update blobs set refcount = refcount + ? where id = ?", (2 if pin else 1, blob_id))
+            db.execute(
+                "insert or replace into refs (user_id, filename, blob_id, size, content_type, uploaded_at) "
+                "values (?, ?, ?, ?, ?, ?)",
+                (user_id, filename, blob_id, upload.size, content_type, time.time()),
+            )
+            db.execute(
+                "insert into usage (user_id, bytes) values (?, ?) "
+                "on conflict (user_id) do update set bytes = excluded.bytes",
+                (user_id, new_usage),
+            )
+            if old:
+                self._release(db, old[0])
+
+        return StoredBlob(blob_id, path, upload.size, deduplicated=exists)
+
+    def _release(self, db: sqlite3.Connection, blob_id: str):
+        db.execute("update blobs set refcount = refcount - 1 where id = ?", (blob_id,))
+        orphan = db.execute("select 1 from blobs where id = ? and refcount <= 0", (blob_id,)).fetchone()
+        if orphan:
+            db.execute("delete from blobs where id = ?", (blob_id,))
+            self.blob_path(blob_id).unlink(missing_ok=True)
+
+    def unpin(self, blob_id: str):
+        """Trả tham chiếu do `commit(pin=True)` giữ; xoá blob nếu không còn ai dùng"""
+        with self._transaction() as db:
+            self._release(db, blob_id)
+
+    def usage(self, user_id: str) -> int:
+        with self._lock:
+            row = self.db.execute("select bytes from usage where user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    # Extraction cache
+    def get_extracted(self, blob_id: str) -> Optional[str]:
+        with self._lock:
+            row = self.db.execute("select 1 from extracted where blob_id = ?", (blob_id,)).fetchone()
+            if row:
+                self.db.execute("update extracted set last_access = ? where blob_id = ?", (time.time(), blob_id))
+        try:
+            content = self.extracted_path(blob_id).read_text(encoding="utf-8") if row else None
+        except FileNotFoundError:
+            content = None
+        with self._lock:
+            if content is None:
+                self.cache_misses += 1
+            else:
+                self.cache_hits += 1
+        return content
+
+    def put_extracted(self, blob_id: str, content: str):
+        path = self.extracted_path(blob_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(content, encoding="utf-8")
+        os.replace(tmp_path, path)
+        size = path.stat().st_size
+
+        with self._transaction() as db:
+            db.execute(
+                "insert or replace into extracted (blob_id, size, last_access) values (?, ?, ?)",
+                (blob_id, size, time.time()),
+            )
+            total = db.execute("select coalesce(sum(size), 0) from extracted").fetchone()[0]
+            while total > self.cache_max_bytes:
+                oldest = db.execute(
+                    "select blob_id, size from extracted order by last_access limit 1"
+                ).fetchone()
+                if oldest is None or oldest[0] == blob_id:
+                    break
+                db.execute("delete from extracted where blob_id = ?", (oldest[0],))
+                self.extracted_path(oldest[0]).unlink(missing_ok=True)
+                self.cache_evictions += 1
+                total -= oldest[1]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "dedup_hits": self.dedup_hits,
+                "extraction_cache_hits": self.cache_hits,
+                "extraction_cache_misses": self.cache_misses,
+                "extraction_cache_evictions": self.cache_evictions,
+            }
+
+
+# Global blob store
+blob_store = BlobStore()
@@ -0,0 +1,147 @@
+"""
+ETag / conditional GET cho danh sách session và lịch sử chat.
+
+- ETag lấy từ version do DB tự tăng (trigger, xem
+  supabase/migrations/*_resource_versions.sql): `sessions.version` cho
+  conversation/questions/answers của một session, `users.sessions_version`
+  cho danh sách session. Version được repository cache (VERSION_CACHE_TTL)
+  nên request có `If-None-Match` khớp trả 304 mà không gọi DB
+- Worker nào ghi (chat, sửa/xoá session) thì cập nhật version ngay; version
+  giống nhau giữa các worker nên ETag từ worker này vẫn dùng được ở worker khác
+- ETag chứa loại, id tài nguyên (user với danh sách session, session /
+  question với lịch sử), version và hash của query: ETag của user khác không
+  bao giờ khớp. Kèm `Vary: Authorization, X-API-Key`
+- Response đã render được cache theo (loại, id, version, hash query), LRU
+  giới hạn theo tổng số byte; version mới là key mới nên không cần invalidate,
+  bản cũ tự bị đẩy ra
+- `Cache-Control: private, no-cache`: trình duyệt giữ bản sao và tự gửi
+  `If-None-Match` mỗi lần fetch, frontend không phải đổi gì
+"""
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from fastapi import Request, Response
+
+from app.models.serialization import JSON_MEDIA_TYPE
+
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Response lớn hơn ngưỡng này không cache (một lịch sử khổng lồ không đẩy hết các bản khác ra)
+RESPONSE_CACHE_MAX_ITEM_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_ITEM_BYTES", str(8 * 1024 * 1024)))
+
+CACHE_CONTROL = "private, no-cache"
+# Response khác nhau theo người gọi: cache dùng chung (proxy, trình duyệt nhiều tài khoản) phải tách theo credential
+VARY = "Authorization, X-API-Key"
+
+# (body, header riêng của response như X-Next-Cursor)
+Rendered = Tuple[bytes, Optional[Dict[str, str]]]
+
+
+def query_digest(query: str) -> str:
+    """Hash ngắn của query string (phân trang) cho ETag"""
+    return hashlib.blake2b(query.encode(), digest_size=6).hexdigest()
+
+
+def make_etag(kind: str, resource_id: str, version: int, query: str = "") -> str:
+    """ETag gắn với tài nguyên cụ thể (user/session/question), version và query:
+    ETag của user này không bao giờ khớp response của user khác"""
+    return f'"{kind}-{resource_id}-{version}-{query_digest(query)}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """So sánh weak theo RFC 9110: bỏ tiền tố W/, `*` khớp mọi ETag"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class RenderedResponseCache:
+    """LRU body JSON đã render, giới hạn theo tổng số byte"""
+
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+                 max_item_bytes: int = RESPONSE_CACHE_MAX_ITEM_BYTES):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.not_modified = 0
+        self._data: "OrderedDict[Hashable, Tuple[bytes, Dict[str, str]]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Tuple[bytes, Dict[str, str]]]:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def set(self, key: Hashable, body: bytes, headers: Optional[Dict[str, str]] = None):
+        if len(body) > self.max_item_bytes:
+            return
+        self.pop(key)
+        self._data[key] = (body, headers or {})
+        self.bytes += len(body)
+        while self.bytes > self.max_bytes and self._data:
+            _, (evicted, _) = self._data.popitem(last=False)
+            self.bytes -= len(evicted)
+            self.evictions += 1
+
+    def pop(self, key: Hashable):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.bytes -= len(entry[0])
+
+    def clear(self):
+        self._data.clear()
+        self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    async def respond(self, request: Request, kind: str, resource_id: str, version: int,
+                      render: Callable[[], Awaitable[Rendered]]) -> Response:
+        """304 nếu `If-None-Match` khớp; không thì body từ cache hoặc `render()` (chỉ gọi DB khi miss)"""
+        query = request.url.query
+        etag = make_etag(kind, resource_id, version, query)
+        headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL, "Vary": VARY}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+
+        key = (kind, resource_id, version, query_digest(query))
+        entry = self.get(key)
+        if entry is None:
+            body, extra = await render()
+            entry = (body, extra or {})
+            self.set(key, body, extra)
+        body, extra = entry
+        return Response(body, media_type=JSON_MEDIA_TYPE, headers={**extra, **headers})
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "not_modified": self.not_modified,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Global rendered response cache
+response_cache = RenderedResponseCache()
+
+def get_response_cache() -> RenderedResponseCache:
+    """Dependency function to get rendered response cache"""
+    return response_cache
@@ -0,0 +1,89 @@
+"""
+Embedder cho retrieval.
+
+Mọi embedder cài đặt `embed(texts)` trả về ma trận float32 (len(texts), dim)
+đã chuẩn hoá L2. Mặc định dùng `HashingEmbedder` (hashing trick: unigram +
+bigram băm vào `dim` chiều, có dấu) — chạy offline, kết quả xác định, không
+cần tải model. Embedder khác (model thật) đăng ký trong EMBEDDERS.
+"""
+import os
+import re
+import zlib
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Type
+
+import numpy as np
+
+EMBEDDER = os.getenv("EMBEDDER", "hashing")
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "256"))
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class Embedder(ABC):
+    """Interface embedder"""
+
+    dim: int
+
+    @abstractmethod
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Ma trận (len(texts), dim), mỗi hàng một vector"""
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Chuẩn hoá L2 từng dòng (dòng toàn 0 giữ nguyên)"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class HashingEmbedder(Embedder):
+    """
+    Hashing trick: mỗi token (và cặp token liền nhau) được băm CRC32 thành
+    (chỉ số chiều, dấu ±1); mỗi chiều lấy dấu của tổng các đóng góp (binary
+    tf: từ phổ biến lặp nhiều lần không lấn át từ hiếm) rồi chuẩn hoá L2.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM, bigrams: bool = True):
+        self.dim = dim
+        self.bigrams = bigrams
+        # Cache token -> mã (chiều * 2 + bit dấu); từ vựng lặp lại nhiều nên hit rate cao
+        self._code = lru_cache(maxsize=1 << 18)(self._hash)
+
+    def _hash(self, feature: str) -> int:
+        h = zlib.crc32(feature.encode("utf-8"))
+        return (h % self.dim) * 2 + (h >> 31)
+
+    def features(self, text: str) -> List[str]:
+        tokens = TOKEN_PATTERN.findall(text.lower())
+        if self.bigrams and len(tokens) > 1:
+            return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        return tokens
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        features = [self.features(text) for text in texts]
+        lengths = np.fromiter(map(len, features), dtype=np.int64, count=len(features))
+        codes = np.fromiter(
+            (self._code(feature) for row in features for feature in row),
+            dtype=np.int64, count=int(lengths.sum()),
+        )
+        rows = np.repeat(np.arange(len(texts), dtype=np.int64), lengths)
+        signs = 1.0 - 2.0 * (codes & 1)
+        flat = rows * self.dim + (codes >> 1)
+        counts = np.bincount(flat, weights=signs, minlength=len(texts) * self.dim)
+        return normalize(np.sign(counts).reshape(len(texts), self.dim).astype(np.float32))
+
+
+EMBEDDERS: Dict[str, Type[Embedder]] = {
+    "hashing": HashingEmbedder,
+}
+
+_embedder: Optional[Embedder] = None
+
+def get_embedder() -> Embedder:
+    """Dependency function to get embedder (chọn qua biến môi trường EMBEDDER)"""
+    global _embedder
+    if _embedder is None:
+        _embedder = EMBEDDERS[EMBEDDER]()
+    return _embedder
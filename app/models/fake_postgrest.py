@@ -0,0 +1,379 @@
+"""
+Fake PostgREST server (in-memory) để benchmark/test offline.
+
+Chỉ hỗ trợ phần API mà repository dùng: select (kèm embed lồng nhau như
+`answers(...)`), filter eq/neq/lt/lte/gt/gte/in/is, or/and, order, limit,
+insert/update/delete với `Prefer: return=representation` và `/rpc/<fn>`.
+"""
+import asyncio
+import re
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+# Cột mặc định khi insert (giống default của bảng trên Supabase)
+TABLE_DEFAULTS: Dict[str, Dict[str, Callable[[], Any]]] = {
+    "users": {"created_at": lambda: _now(), "is_active": lambda: True, "sessions_version": lambda: 1},
+    "sessions": {"started_at": lambda: _now(), "is_active": lambda: True, "version": lambda: 1},
+    "questions": {"created_at": lambda: _now()},
+    "answers": {"created_at": lambda: _now(), "generated_by": lambda: "chatbot"},
+    "api_keys": {"created_at": lambda: _now(), "is_active": lambda: True, "rate_limit": lambda: None,
+                 "last_used": lambda: None},
+    "revoked_tokens": {"revoked_at": lambda: _now()},
+}
+
+# Xoá cascade theo foreign key: bảng cha -> (bảng con, cột FK)
+CASCADES: Dict[str, List[Tuple[str, str]]] = {
+    "users": [("sessions", "user_id"), ("api_keys", "user_id"), ("revoked_tokens", "user_id")],
+    "sessions": [("questions", "session_id")],
+    "questions": [("answers", "question_id")],
+}
+
+
+_last_now = datetime.min.replace(tzinfo=timezone.utc)
+
+
+def _now() -> str:
+    """Tăng ngặt (như created_at của các dòng insert liên tiếp trong lô) để order by ổn định"""
+    global _last_now
+    _last_now = max(datetime.now(timezone.utc), _last_now + timedelta(microseconds=1))
+    return _last_now.strftime("%Y-%m-%dT%H:%M:%S.%f+00:00")
+
+
+class FakePostgrestError(Exception):
+    def __init__(self, status_code: int, message: str, code: str = "PGRST000"):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+        self.code = code
+
+
+class FakeStore:
+    """Bảng in-memory: table -> {id: row}"""
+
+    def __init__(self):
+        self.tables: Dict[str, Dict[str, dict]] = {}
+
+    def table(self, name: str) -> Dict[str, dict]:
+        return self.tables.setdefault(name, {})
+
+    def insert(self, name: str, row: dict) -> dict:
+        new_row = {column: factory() for column, factory in TABLE_DEFAULTS.get(name, {}).items()}
+        new_row.update(row)
+        new_row.setdefault("id", str(uuid.uuid4()))
+        self.table(name)[new_row["id"]] = new_row
+        self._bump_versions(name, new_row)
+        return new_row
+
+    def update(self, name: str, row: dict, changes: dict):
+        row.update(changes)
+        if name != "sessions" or set(changes) - {"version"}:
+            if name == "sessions":
+                row["version"] += 1
+            self._bump_versions(name, row)
+
+    def delete(self, name: str, row_ids: List[str]):
+        for child, column in CASCADES.get(name, []):
+            child_ids = [r["id"] for r in self.table(child).values() if r.get(column) in row_ids]
+            self.delete(child, child_ids)
+        table = self.table(name)
+        for row_id in row_ids:
+            row = table.pop(row_id, None)
+            if row is not None:
+                self._bump_versions(name, row)
+
+    def _bump_versions(self, name: str, row: dict):
+        """Giống trigger trong supabase/migrations/*_resource_versions.sql"""
+        if name == "sessions":
+            user = self.table("users").get(row.get("user_id"))
+            if user is not None:
+                user["sessions_version"] += 1
+            return
+        if name == "answers":
+            row = self.table("questions").get(row.get("question_id"), {})
+        elif name != "questions":
+            return
+        session = self.table("sessions").get(row.get("session_id"))
+        if session is not None:
+            session["version"] += 1
+
+
+# RPC functions: name -> fn(store, params) -> JSON-able result
+RPC_FUNCTIONS: Dict[str, Callable[[FakeStore, dict], Any]] = {}
+
+
+def rpc_function(name: str):
+    def decorator(fn):
+        RPC_FUNCTIONS[name] = fn
+        return fn
+    return decorator
+
+
+@rpc_function("chat_turn")
+def _chat_turn(store: FakeStore, params: dict) -> dict:
+    """Test double của supabase/migrations/*_chat_turn.sql"""
+    session = store.table("sessions").get(params["p_session_id"])
+    if session is None:
+        raise FakePostgrestError(404, "Session không tồn tại", "PT404")
+    if session["user_id"] != params["p_user_id"]:
+        raise FakePostgrestError(403, "Không có quyền truy cập session này", "PT403")
+
+    question = store.insert("questions", {"session_id": session["id"], "content": params["p_question"]})
+    answer = store.insert("answers", {
+        "question_id": question["id"],
+        "content": params["p_answer"],
+        "generated_by": params.get("p_generated_by", "chatbot"),
+    })
+    return {
+        "question_id": question["id"],
+        "answer_id": answer["id"],
+        "created_at": question["created_at"],
+        "answer_created_at": answer["created_at"],
+        "version": session["version"],
+    }
+
+
+@rpc_function("chat_turns")
+def _chat_turns(store: FakeStore, params: dict) -> dict:
+    """Test double của supabase/migrations/*_chat_turns.sql"""
+    session = store.table("sessions").get(params["p_session_id"])
+    if session is None:
+        raise FakePostgrestError(404, "Session không tồn tại", "PT404")
+    if session["user_id"] != params["p_user_id"]:
+        raise FakePostgrestError(403, "Không có quyền truy cập session này", "PT403")
+
+    turns = []
+    for turn in params["p_turns"]:
+        question = store.insert("questions", {"session_id": session["id"], "content": turn["question"]})
+        answer = store.insert("answers", {
+            "question_id": question["id"],
+            "content": turn["answer"],
+            "generated_by": turn.get("generated_by") or "chatbot",
+        })
+        turns.append({
+            "question_id": question["id"],
+            "answer_id": answer["id"],
+            "created_at": question["created_at"],
+            "answer_created_at": answer["created_at"],
+        })
+    return {"turns": turns, "version": session["version"]}
+
+
+# Khớp với danh sách cột cho phép trong supabase/migrations/*_apply_deferred_updates.sql
+DEFERRED_UPDATE_COLUMNS = {"users": ("last_login",), "api_keys": ("last_used",)}
+
+
+@rpc_function("apply_deferred_updates")
+def _apply_deferred_updates(store: FakeStore, params: dict) -> int:
+    """Test double của supabase/migrations/*_apply_deferred_updates.sql"""
+    allowed = DEFERRED_UPDATE_COLUMNS.get(params["p_table"])
+    if allowed is None:
+        raise FakePostgrestError(400, f"Bảng {params['p_table']} không hỗ trợ write-behind", "PT400")
+    # Kiểm tra cột của cả lô một lần trước khi ghi (như hàm SQL)
+    columns = sorted({column for row in params["p_rows"] for column in row} - {"id"} - set(allowed))
+    if columns:
+        raise FakePostgrestError(400, f"Cột {', '.join(columns)} không hỗ trợ write-behind", "PT400")
+    table = store.table(params["p_table"])
+    updated = 0
+    for row in params["p_rows"]:
+        changes = {column: value for column, value in row.items() if column != "id"}
+        if changes and row["id"] in table:
+            table[row["id"]].update(changes)
+            updated += 1
+    return updated
+
+
+# Query parsing
+def _split_top_level(text: str) -> List[str]:
+    parts, depth, quoted, escaped, current = [], 0, False, False, ""
+    for char in text:
+        if escaped:
+            escaped = False
+        elif quoted and char == "\\":
+            escaped = True
+        elif char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and char == "," and depth == 0:
+            parts.append(current)
+            current = ""
+            continue
+        current += char
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _unquote(value: str) -> str:
+    """Bỏ ngoặc kép và escape `\\"` / `\\\\` như PostgREST"""
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return re.sub(r"\\(.)", r"\1", value[1:-1])
+    return value
+
+
+def _coerce(value: str, sample: Any) -> Any:
+    if isinstance(sample, bool):
+        return value == "true"
+    if isinstance(sample, (int, float)):
+        return float(value)
+    return value
+
+
+def _compare(row: dict, column: str, operator: str, raw: str) -> bool:
+    negate = operator == "not"
+    if negate:
+        operator, raw = raw.split(".", 1)
+    current = row.get(column)
+
+    if operator == "is":
+        result = current is {"null": None, "true": True, "false": False}[raw]
+    elif current is None:
+        result = False
+    elif operator == "in":
+        options = [_unquote(v) for v in _split_top_level(raw.strip("()"))]
+        result = current in [_coerce(v, current) for v in options]
+    else:
+        value = _coerce(_unquote(raw), current)
+        result = {
+            "eq": lambda: current == value,
+            "neq": lambda: current != value,
+            "lt": lambda: current < value,
+            "lte": lambda: current <= value,
+            "gt": lambda: current > value,
+            "gte": lambda: current >= value,
+        }[operator]()
+    return not result if negate else result
+
+
+def _logic(expression: str, combine) -> Callable[[dict], bool]:
+    """Parse `(a.eq.1,and(b.lt.2,c.gt.3))` của or/and"""
+    predicates = []
+    for item in _split_top_level(expression.strip()[1:-1]):
+        if item.startswith(("and(", "or(")):
+            name, rest = item.split("(", 1)
+            predicates.append(_logic("(" + rest, all if name == "and" else any))
+        else:
+            column, operator, raw = item.split(".", 2)
+            predicates.append(lambda row, c=column, o=operator, r=raw: _compare(row, c, o, r))
+    return lambda row: combine(p(row) for p in predicates)
+
+
+def _parse_filters(items: List[Tuple[str, str]]) -> Callable[[dict], bool]:
+    predicates = []
+    for key, value in items:
+        if key in ("select", "order", "limit", "offset", "columns", "on_conflict"):
+            continue
+        if key in ("or", "and"):
+            predicates.append(_logic(value, any if key == "or" else all))
+        else:
+            operator, raw = value.split(".", 1)
+            predicates.append(lambda row, c=key, o=operator, r=raw: _compare(row, c, o, r))
+    return lambda row: all(p(row) for p in predicates)
+
+
+def _parse_select(columns: str) -> List[Tuple[str, Optional[str]]]:
+    """`id,answers(id,content)` -> [("id", None), ("answers", "id,content")]"""
+    fields = []
+    for item in _split_top_level("".join(columns.split())):
+        if "(" in item:
+            name, inner = item.split("(", 1)
+            fields.append((name.split(":")[-1].split("!")[0], inner[:-1]))
+        else:
+            fields.append((item, None))
+    return fields
+
+
+def _project(store: FakeStore, table: str, row: dict, columns: str) -> dict:
+    result = {}
+    for name, inner in _parse_select(columns or "*"):
+        if inner is None:
+            if name == "*":
+                result.update(row)
+            else:
+                result[name] = row.get(name)
+        else:
+            foreign_key = f"{table[:-1]}_id"
+            children = [r for r in store.table(name).values() if r.get(foreign_key) == row["id"]]
+            result[name] = [_project(store, name, child, inner) for child in children]
+    return result
+
+
+def _order(rows: List[dict], order: Optional[str]) -> List[dict]:
+    if not order:
+        return rows
+    for term in reversed(order.split(",")):
+        column, _, direction = term.partition(".")
+        rows = sorted(
+            rows,
+            key=lambda r: (r.get(column) is None, r.get(column) or ""),
+            reverse=direction.startswith("desc"),
+        )
+    return rows
+
+
+def create_fake_postgrest(latency_ms: float = 0.0, store: Optional[FakeStore] = None) -> FastAPI:
+    """Tạo ASGI app giả lập PostgREST, mỗi request chờ thêm `latency_ms`"""
+    app = FastAPI(title="Fake PostgREST")
+    app.state.store = store or FakeStore()
+    app.state.latency = latency_ms / 1000
+
+    def _representation(request: Request, table: str, rows: List[dict], status_code: int) -> Response:
+        if "return=representation" in request.headers.get("prefer", ""):
+            select = request.query_params.get("select", "*")
+            return JSONResponse([_project(app.state.store, table, r, select) for r in rows], status_code)
+        return Response(status_code=status_code)
+
+    @app.middleware("http")
+    async def inject_latency(request: Request, call_next):
+        if app.state.latency:
+            await asyncio.sleep(app.state.latency)
+        return await call_next(request)
+
+    @app.exception_handler(FakePostgrestError)
+    async def postgrest_error(request: Request, e: FakePostgrestError):
+        return JSONResponse({"code": e.code, "message": e.message, "details": None, "hint": None}, e.status_code)
+
+    @app.post("/rest/v1/rpc/{function}")
+    async def rpc(function: str, request: Request):
+        if function not in RPC_FUNCTIONS:
+            raise FakePostgrestError(404, f"Could not find the function public.{function}", "PGRST202")
+        params = await request.json() if await request.body() else {}
+        return JSONResponse(RPC_FUNCTIONS[function](app.state.store, params))
+
+    @app.api_route("/rest/v1/{table}", methods=["GET", "POST", "PATCH", "DELETE"])
+    async def table_endpoint(table: str, request: Request):
+        store = app.state.store
+        params = request.query_params
+        matches = _parse_filters(list(params.multi_items()))
+
+        if request.method == "POST":
+            body = await request.json()
+            rows = [store.insert(table, row) for row in (body if isinstance(body, list) else [body])]
+            return _representation(request, table, rows, 201)
+
+        rows = [row for row in store.table(table).values() if matches(row)]
+
+        if request.method == "GET":
+            rows = _order(rows, params.get("order"))
+            offset = int(params.get("offset", 0))
+            limit = int(params["limit"]) if "limit" in params else None
+            rows = rows[offset:offset + limit if limit is not None else None]
+            return JSONResponse([_project(store, table, row, params.get("select", "*")) for row in rows])
+
+        if request.method == "PATCH":
+            changes = await request.json()
+            for row in rows:
+                store.update(table, row, changes)
+            return _representation(request, table, rows, 200)
+
+        deleted = [dict(row) for row in rows]
+        store.delete(table, [row["id"] for row in rows])
+        return _representation(request, table, deleted, 200)
+
+    return app
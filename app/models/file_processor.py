@@ -1,39 +1,144 @@
 import PyPDF2
 import docx
 import os
+from itertools import islice
 from pathlib import Path
+from typing import Iterable, Iterator, List, Optional
 
 ALLOWED_EXTENSIONS = {".pdf", ".doc", ".docx", ".txt"}
 
+MAX_CONTENT_CHARS = 1000000  # Giới hạn 1,000,000 ký tự để test
+TXT_CHUNK_SIZE = 64 * 1024
+
+# PDF có từ PDF_PARALLEL_MIN_PAGES trang trở lên được ingestion queue chia thành
+# các khoảng (ít nhất PDF_PAGES_PER_RANGE trang, khoảng PDF_RANGES_PER_WORKER khoảng
+# mỗi process) và trích xuất song song trên pool của nó, dừng khi đủ MAX_CONTENT_CHARS
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+PDF_PAGES_PER_RANGE = int(os.getenv("PDF_PAGES_PER_RANGE", "16"))
+PDF_RANGES_PER_WORKER = int(os.getenv("PDF_RANGES_PER_WORKER", "4"))
+
+# Chia nội dung thành các đoạn (ký tự) có phần chồng lấn để index retrieval
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "800"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
+
 # Hàm kiểm tra định dạng file
 def allowed_file(filename: str) -> bool:
     return Path(filename).suffix.lower() in ALLOWED_EXTENSIONS
 
+# Gom các đoạn text cho đến khi đủ max_chars rồi dừng generator (không đọc tiếp phần còn lại)
+def take_chars(chunks: Iterable[str], max_chars: int = MAX_CONTENT_CHARS) -> str:
+    parts = []
+    remaining = max_chars
+    for chunk in chunks:
+        if len(chunk) >= remaining:
+            parts.append(chunk[:remaining])
+            break
+        parts.append(chunk)
+        remaining -= len(chunk)
+    if hasattr(chunks, "close"):
+        chunks.close()
+    return "".join(parts)
+
+# Generator: text từng trang PDF trong khoảng [start, stop)
+def iter_pdf_text(file_path: Path, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+    with open(file_path, "rb") as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        for page in islice(pdf_reader.pages, start, stop):
+            yield page.extract_text() or ""
+
+# Generator: từng đoạn (paragraph) DOC/DOCX, ngăn cách bằng "\n"
+def iter_docx_text(file_path: Path) -> Iterator[str]:
+    doc = docx.Document(file_path)
+    first = True
+    for para in doc.paragraphs:
+        if para.text:
+            yield para.text if first else "\n" + para.text
+            first = False
+
+# Generator: đọc file TXT theo từng chunk
+def iter_txt_text(file_path: Path, chunk_size: int = TXT_CHUNK_SIZE) -> Iterator[str]:
+    with open(file_path, "r", encoding="utf-8") as file:
+        while chunk := file.read(chunk_size):
+            yield chunk
+
+# Số trang PDF (hàm top-level để chạy được trong process pool)
+def pdf_page_count(file_path: str) -> int:
+    with open(file_path, "rb") as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+# Chia page_count trang thành tối đa `parts` khoảng liên tiếp [start, stop); mỗi khoảng
+# mở và parse lại file một lần nên không nhỏ hơn PDF_PAGES_PER_RANGE trang
+def pdf_page_ranges(page_count: int, parts: int) -> List[tuple]:
+    size = max(PDF_PAGES_PER_RANGE, -(-page_count // max(parts, 1)))
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+# Trích xuất một khoảng trang (hàm top-level để chạy được trong process pool)
+def extract_pdf_range(file_path: str, start: int, stop: int, max_chars: int = MAX_CONTENT_CHARS) -> str:
+    try:
+        return take_chars(iter_pdf_text(Path(file_path), start, stop), max_chars)
+    except Exception as e:
+        return f"Error extracting PDF content: {str(e)}"
+
 # Hàm trích xuất nội dung từ file PDF
-def extract_pdf_content(file_path: Path) -> str:
+def extract_pdf_content(file_path: Path, max_chars: int = MAX_CONTENT_CHARS) -> str:
     try:
-        with open(file_path, "rb") as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() or ""
-            return text[:1000000]  # Giới hạn 1,000,000 ký tự để test
+        return take_chars(iter_pdf_text(file_path), max_chars)
     except Exception as e:
         return f"Error extracting PDF content: {str(e)}"
 
 # Hàm trích xuất nội dung từ file DOC/DOCX
-def extract_docx_content(file_path: Path) -> str:
+def extract_docx_content(file_path: Path, max_chars: int = MAX_CONTENT_CHARS) -> str:
     try:
-        doc = docx.Document(file_path)
-        text = "\n".join([para.text for para in doc.paragraphs if para.text])
-        return text[:1000000]  # Giới hạn 1,000,000 ký tự để test
+        return take_chars(iter_docx_text(file_path), max_chars)
     except Exception as e:
         return f"Error extracting DOCX content: {str(e)}"
 
 # Hàm trích xuất nội dung từ file TXT
-def extract_txt_content(file_path: Path) -> str:
+def extract_txt_content(file_path: Path, max_chars: int = MAX_CONTENT_CHARS) -> str:
     try:
-        with open(file_path, "r", encoding="utf-8") as file:
-            return file.read()[:1000000]  # Giới hạn 1,000,000 ký tự để test
+        return take_chars(iter_txt_text(file_path), max_chars)
     except Exception as e:
         return f"Error extracting TXT content: {str(e)}"
+
+# Các extractor trả về chuỗi lỗi thay vì raise -> dùng để không cache kết quả lỗi
+def is_extraction_error(content: str) -> bool:
+    return content.startswith("Error extracting ")
+
+# Vị trí khoảng trắng cuối cùng trong text[start:end], -1 nếu không có
+def _last_space(text: str, start: int, end: int) -> int:
+    return max(text.rfind(" ", start, end), text.rfind("\n", start, end))
+
+# Chia text thành các đoạn tối đa chunk_size ký tự, đoạn sau lặp lại ~overlap ký tự
+# cuối của đoạn trước; ưu tiên cắt tại khoảng trắng để không cắt giữa từ
+def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    overlap = min(overlap, chunk_size // 2)
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            space = _last_space(text, start + overlap + 1, end)
+            if space != -1:
+                end = space
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+        # Bắt đầu đoạn sau tại đầu một từ
+        while start < end and not text[start - 1].isspace():
+            start += 1
+    return chunks
+
+# Hàm trích xuất nội dung theo đuôi file (hàm top-level để chạy được trong process pool)
+def extract_file_content(file_path) -> str:
+    file_path = Path(file_path)
+    suffix = file_path.suffix.lower()
+    if suffix == ".pdf":
+        return extract_pdf_content(file_path)
+    if suffix in [".doc", ".docx"]:
+        return extract_docx_content(file_path)
+    if suffix == ".txt":
+        return extract_txt_content(file_path)
+    return ""
@@ -0,0 +1,273 @@
+"""
+Điều phối các lần gọi answer backend.
+
+- Giới hạn số lần gọi backend đồng thời (toàn cục) và số câu hỏi đang xử lý
+  đồng thời của mỗi user
+- Hàng đợi có giới hạn + timeout chờ; vượt giới hạn -> GenerationOverloaded
+- Micro-batching: các câu hỏi đến trong vòng `batch_window` giây được gom
+  thành một lần gọi `generate_batch` (tối đa `max_batch_size` câu)
+"""
+import asyncio
+import os
+import time
+from contextlib import aclosing, asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Set, Union
+
+from app.models.answer_backend import AnswerBackend, get_answer_backend
+from app.models.metrics import Gauge, Histogram
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_CONCURRENCY_PER_USER = int(os.getenv("LLM_MAX_CONCURRENCY_PER_USER", "2"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "256"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "10"))
+LLM_BATCH_WINDOW_MS = float(os.getenv("LLM_BATCH_WINDOW_MS", "5"))
+LLM_MAX_BATCH_SIZE = int(os.getenv("LLM_MAX_BATCH_SIZE", "16"))
+
+GENERATION_QUEUE_SECONDS = Histogram(
+    "generation_queue_wait_seconds", "Thời gian chờ slot backend (kể cả cửa sổ gom batch)", ("mode",),
+)
+GENERATION_SECONDS = Histogram(
+    "generation_duration_seconds", "Thời gian một lần gọi answer backend (batch) hoặc cả luồng stream", ("mode",),
+)
+GENERATION_FIRST_TOKEN_SECONDS = Histogram(
+    "generation_first_token_seconds", "Thời gian từ lúc có slot tới token đầu tiên (stream)",
+)
+GENERATION_BATCH_SIZE = Histogram(
+    "generation_batch_size", "Số câu hỏi trong một lần gọi generate_batch", buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+
+
+class GenerationOverloaded(Exception):
+    """Hàng đợi sinh câu trả lời đã đầy hoặc chờ quá lâu"""
+
+
+@dataclass
+class _PendingPrompt:
+    question: str
+    context: Sequence[str]
+    started: asyncio.Future
+    result: asyncio.Future
+    abandoned: bool = False
+
+
+class GenerationScheduler:
+    def __init__(
+        self,
+        backend: AnswerBackend,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_concurrency_per_user: int = LLM_MAX_CONCURRENCY_PER_USER,
+        max_queue: int = LLM_MAX_QUEUE,
+        queue_timeout: float = LLM_QUEUE_TIMEOUT_SECONDS,
+        batch_window: float = LLM_BATCH_WINDOW_MS / 1000,
+        max_batch_size: int = LLM_MAX_BATCH_SIZE,
+    ):
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.max_concurrency_per_user = max_concurrency_per_user
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.batch_window = batch_window
+        self.max_batch_size = max(1, max_batch_size)
+
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._users: Dict[str, list] = {}  # user_id -> [Semaphore, số request đang giữ]
+        self._pending: List[_PendingPrompt] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.queued = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.batches = 0
+        self.batched_prompts = 0
+
+    # Hàng đợi + giới hạn đồng thời
+    def _admit(self) -> float:
+        """Nhận request vào hàng đợi, trả về deadline chờ"""
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise GenerationOverloaded("Hệ thống đang quá tải, vui lòng thử lại sau")
+        self.queued += 1
+        return asyncio.get_running_loop().time() + self.queue_timeout
+
+    async def _wait(self, awaitable, deadline: float):
+        timeout = max(0.0, deadline - asyncio.get_running_loop().time())
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise GenerationOverloaded("Hết thời gian chờ sinh câu trả lời, vui lòng thử lại sau")
+
+    @asynccontextmanager
+    async def _user_slot(self, user_id: str, deadline: float):
+        entry = self._users.setdefault(user_id, [asyncio.Semaphore(self.max_concurrency_per_user), 0])
+        entry[1] += 1
+        try:
+            await self._wait(entry[0].acquire(), deadline)
+            try:
+                yield
+            finally:
+                entry[0].release()
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._users[user_id]
+
+    # Micro-batching
+    def _submit(self, question: str, context: Sequence[str]) -> _PendingPrompt:
+        loop = asyncio.get_running_loop()
+        prompt = _PendingPrompt(question, context, loop.create_future(), loop.create_future())
+        self._pending.append(prompt)
+
+        if len(self._pending) >= self.max_batch_size or self.batch_window <= 0:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window, self._flush)
+        return prompt
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        while self._pending:
+            batch = self._pending[:self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size:]
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[_PendingPrompt]):
+        async with self._slots:
+            batch = [prompt for prompt in batch if not prompt.abandoned]
+            if not batch:
+                return
+
+            for prompt in batch:
+                prompt.started.set_result(None)
+            self.batches += 1
+            self.batched_prompts += len(batch)
+
+            GENERATION_BATCH_SIZE.observe(len(batch))
+            try:
+                with GENERATION_SECONDS.time("batch"):
+                    answers = await self.backend.generate_batch(
+                        [prompt.question for prompt in batch], [prompt.context for prompt in batch]
+                    )
+            except Exception as e:
+                for prompt in batch:
+                    if not prompt.result.done():
+                        prompt.result.set_exception(e)
+                return
+
+            for prompt, answer in zip(batch, answers):
+                if not prompt.result.done():
+                    prompt.result.set_result(answer)
+
+    # Public API
+    async def generate(self, question: str, user_id: str, context: Sequence[str] = ()) -> str:
+        """Sinh câu trả lời đầy đủ (đi qua micro-batching)"""
+        deadline = self._admit()
+        admitted_at = time.perf_counter()
+        started = False
+        try:
+            async with self._user_slot(user_id, deadline):
+                prompt = self._submit(question, context)
+                try:
+                    await self._wait(asyncio.shield(prompt.started), deadline)
+                except BaseException:
+                    prompt.abandoned = True
+                    raise
+                self.queued -= 1
+                started = True
+                GENERATION_QUEUE_SECONDS.labels("batch").observe(time.perf_counter() - admitted_at)
+                return await prompt.result
+        finally:
+            if not started:
+                self.queued -= 1
+
+    async def generate_many(
+        self, questions: Sequence[str], user_id: str, contexts: Sequence[Sequence[str]]
+    ) -> List[Union[str, BaseException]]:
+        """
+        Sinh nhiều câu trả lời của một user (batch endpoint): chiếm một slot của
+        user cho cả lô và đưa mọi câu vào micro-batching cùng lúc. Kết quả theo
+        thứ tự câu hỏi; câu nào lỗi (vd quá hạn chờ) trả về exception thay vì chuỗi
+        """
+        if self.queued + len(questions) > self.max_queue:
+            self.rejected += 1
+            raise GenerationOverloaded("Hệ thống đang quá tải, vui lòng thử lại sau")
+        self.queued += len(questions)
+        waiting = len(questions)
+        deadline = asyncio.get_running_loop().time() + self.queue_timeout
+        admitted_at = time.perf_counter()
+
+        async def one(prompt: _PendingPrompt) -> str:
+            nonlocal waiting
+            try:
+                await self._wait(asyncio.shield(prompt.started), deadline)
+            except BaseException:
+                prompt.abandoned = True
+                raise
+            waiting -= 1
+            self.queued -= 1
+            GENERATION_QUEUE_SECONDS.labels("batch").observe(time.perf_counter() - admitted_at)
+            return await prompt.result
+
+        try:
+            async with self._user_slot(user_id, deadline):
+                prompts = [self._submit(question, context) for question, context in zip(questions, contexts)]
+                return await asyncio.gather(*(one(prompt) for prompt in prompts), return_exceptions=True)
+        finally:
+            self.queued -= waiting
+
+    async def stream(self, question: str, user_id: str, context: Sequence[str] = ()) -> AsyncIterator[str]:
+        """Stream từng token (không batch, nhưng vẫn tính vào giới hạn đồng thời)"""
+        deadline = self._admit()
+        admitted_at = time.perf_counter()
+        started = False
+        try:
+            async with self._user_slot(user_id, deadline):
+                await self._wait(self._slots.acquire(), deadline)
+                self.queued -= 1
+                started = True
+                slot_at = time.perf_counter()
+                GENERATION_QUEUE_SECONDS.labels("stream").observe(slot_at - admitted_at)
+                first = True
+                try:
+                    async with aclosing(self.backend.stream(question, context)) as tokens:
+                        async for token in tokens:
+                            if first:
+                                GENERATION_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - slot_at)
+                                first = False
+                            yield token
+                finally:
+                    self._slots.release()
+                    GENERATION_SECONDS.labels("stream").observe(time.perf_counter() - slot_at)
+        finally:
+            if not started:
+                self.queued -= 1
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "queued": self.queued,
+            "active_users": len(self._users),
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "batches": self.batches,
+            "avg_batch_size": round(self.batched_prompts / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+_scheduler: Optional[GenerationScheduler] = None
+
+def get_generation_scheduler() -> GenerationScheduler:
+    """Dependency function to get generation scheduler"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = GenerationScheduler(get_answer_backend())
+    return _scheduler
+
+Gauge("generation_queued", "Số câu hỏi đang chờ slot backend", lambda: _scheduler.queued if _scheduler else 0)
@@ -0,0 +1,365 @@
+"""
+Pipeline ingest file chạy nền.
+
+Upload chỉ lưu file rồi đưa job vào hàng đợi có giới hạn; các worker lấy
+job ra và trích xuất nội dung trong process pool với timeout cho từng job.
+Job quá thời gian -> kill các process của pool và tạo pool mới (process con
+không tự dừng khi bị huỷ); job khác đang chạy trên pool cũ được đưa lại vào
+hàng đợi một lần. Process con được tạo qua forkserver (không fork process web
+đang có thread/event loop) và tự báo PID khi khởi động, để kill được mà không
+dựa vào thuộc tính private của ProcessPoolExecutor. PDF lớn được chia khoảng
+trang và chạy song song trên chính pool này (không tạo pool lồng trong process con).
+Hàng đợi đầy -> IngestionQueueFull (router trả 503) thay vì nhận thêm việc.
+Kết quả trích xuất được cache theo blob (nội dung file), upload lại cùng tài
+liệu thì job hoàn tất ngay mà không parse lại. Nội dung được index vào
+retriever của user trước khi job chuyển sang "done".
+"""
+import asyncio
+import multiprocessing
+from collections import deque
+import os
+import signal
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import List, Optional, Set
+
+from app.models.blob_store import blob_store
+from app.models.cache import TTLCache
+from app.models.file_processor import (
+    MAX_CONTENT_CHARS,
+    PDF_PARALLEL_MIN_PAGES,
+    PDF_RANGES_PER_WORKER,
+    extract_file_content,
+    extract_pdf_range,
+    is_extraction_error,
+    pdf_page_count,
+    pdf_page_ranges,
+)
+from app.models.metrics import Gauge, Histogram
+from app.models.retrieval import get_retriever
+
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+INGESTION_QUEUE_SIZE = int(os.getenv("INGESTION_QUEUE_SIZE", "100"))
+INGESTION_JOB_TIMEOUT_SECONDS = float(os.getenv("INGESTION_JOB_TIMEOUT_SECONDS", "60"))
+INGESTION_JOB_RETENTION_SECONDS = float(os.getenv("INGESTION_JOB_RETENTION_SECONDS", "3600"))
+# forkserver (mặc định) hoặc spawn; không dùng fork trong process có thread/event loop
+INGESTION_START_METHOD = os.getenv("INGESTION_START_METHOD", "forkserver")
+
+TERMINAL_STATUSES = {"done", "failed"}
+
+INGESTION_WAIT_SECONDS = Histogram("ingestion_queue_wait_seconds", "Thời gian job nằm trong hàng đợi ingest")
+EXTRACTION_SECONDS = Histogram(
+    "file_extraction_duration_seconds", "Thời gian trích xuất nội dung file (process pool)", ("extension", "outcome"),
+)
+INDEXING_SECONDS = Histogram("document_indexing_duration_seconds", "Thời gian chia đoạn + embed + index một tài liệu")
+
+
+class IngestionQueueFull(Exception):
+    """Hàng đợi ingest đã đầy"""
+
+
+class IngestionJob:
+    def __init__(self, user_id: str, filename: str, path: Path, content_type: Optional[str], size: int,
+                 blob_id: Optional[str] = None, pinned: bool = False):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.filename = filename
+        self.path = path
+        self.content_type = content_type
+        self.size = size
+        self.blob_id = blob_id
+        # Job giữ một tham chiếu trên blob (blob_store.commit(pin=True)) cho tới khi kết thúc
+        self.pinned = pinned
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.content: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.requeued = False
+        self._changed = asyncio.Event()
+
+    def _set_status(self, status: str):
+        self.status = status
+        if status in TERMINAL_STATUSES:
+            self.finished_at = time.time()
+        # Đánh thức các client đang chờ rồi tạo Event mới cho lần đổi trạng thái sau
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def mark_queued(self):
+        self._set_status("queued")
+
+    def mark_running(self):
+        self._set_status("running")
+
+    def finish(self, content: str):
+        self.content = content
+        self._set_status("done")
+
+    def fail(self, error: str):
+        self.error = error
+        self._set_status("failed")
+
+    async def wait_for_change(self):
+        await self._changed.wait()
+
+    def file_info(self) -> dict:
+        return {
+            "filename": self.filename,
+            "size": self.size,
+            "content_type": self.content_type,
+            "path": str(self.path),
+            "blob_id": self.blob_id,
+            "extracted_content": self.content,
+        }
+
+    def to_dict(self) -> dict:
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "filename": self.filename,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+        if self.status == "done":
+            data["file_info"] = self.file_info()
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+def _register_worker(pid_queue):
+    """Initializer của process con: báo PID về process cha"""
+    pid_queue.put(os.getpid())
+
+
+class IngestionPool(ProcessPoolExecutor):
+    """ProcessPoolExecutor (forkserver/spawn) tự theo dõi PID các process con"""
+
+    def __init__(self, max_workers: int, start_method: str = INGESTION_START_METHOD):
+        context = multiprocessing.get_context(start_method)
+        self._pid_queue = context.SimpleQueue()
+        self._worker_pids: Set[int] = set()
+        super().__init__(
+            max_workers=max_workers, mp_context=context,
+            initializer=_register_worker, initargs=(self._pid_queue,),
+        )
+
+    def worker_pids(self) -> Set[int]:
+        """PID các process con đã khởi động (process tạo lười nên tập này tăng dần)"""
+        while not self._pid_queue.empty():
+            self._worker_pids.add(self._pid_queue.get())
+        return set(self._worker_pids)
+
+
+def terminate_pool(pool: IngestionPool):
+    """Dừng pool ngay: kill mọi process con (kể cả process đang chạy tác vụ)"""
+    for pid in pool.worker_pids():
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    # Các future còn dở nhận BrokenProcessPool khi pool phát hiện process chết
+    pool.shutdown(wait=False)
+
+
+class IngestionQueue:
+    def __init__(
+        self,
+        workers: int = INGESTION_WORKERS,
+        queue_size: int = INGESTION_QUEUE_SIZE,
+        job_timeout: float = INGESTION_JOB_TIMEOUT_SECONDS,
+        retention: float = INGESTION_JOB_RETENTION_SECONDS,
+    ):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.job_timeout = job_timeout
+        self.jobs = TTLCache(maxsize=10000, ttl=retention)
+        self.rejected = 0
+        self.timeouts = 0
+        self.pool_restarts = 0
+        self.requeued = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._pool: Optional[IngestionPool] = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._pool = self._new_pool()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._pool is not None:
+            terminate_pool(self._pool)
+            self._pool = None
+
+    def _new_pool(self) -> IngestionPool:
+        return IngestionPool(self.workers)
+
+    def _restart_pool(self, pool: IngestionPool):
+        """Thay pool có process bị treo; bỏ qua nếu worker khác đã thay rồi"""
+        if pool is not self._pool:
+            return
+        self._pool = self._new_pool()
+        self.pool_restarts += 1
+        terminate_pool(pool)
+
+    def _requeue(self, job: IngestionJob) -> bool:
+        """Đưa lại job bị huỷ theo pool cũ vào hàng đợi (một lần)"""
+        if job.requeued:
+            return False
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            return False
+        job.requeued = True
+        job.mark_queued()
+        self.requeued += 1
+        return True
+
+    def submit(self, job: IngestionJob) -> IngestionJob:
+        if self._queue is None:
+            raise RuntimeError("Ingestion queue chưa được khởi động")
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise IngestionQueueFull("Hàng đợi xử lý file đang đầy, vui lòng thử lại sau")
+        self.jobs.set(job.id, job)
+        return job
+
+    async def complete(self, job: IngestionJob, content: str) -> IngestionJob:
+        """Ghi nhận job đã có sẵn kết quả (cache hit), không đi qua hàng đợi"""
+        self.jobs.set(job.id, job)
+        await self._store_result(job, content, cached=True)
+        job.finish(content)
+        await self.release(job)
+        return job
+
+    async def release(self, job: IngestionJob):
+        """Trả tham chiếu job giữ trên blob (job đã kết thúc hoặc không vào được hàng đợi)"""
+        if not job.pinned:
+            return
+        job.pinned = False
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, blob_store.unpin, job.blob_id)
+        except Exception as e:
+            print(f"⚠️ Lỗi trả tham chiếu blob {job.blob_id}: {str(e)}")
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        return self.jobs.get(job_id)
+
+    async def _extract(self, pool: IngestionPool, job: IngestionJob) -> str:
+        loop = asyncio.get_running_loop()
+        path = str(job.path)
+        if self.workers > 1 and job.path.suffix.lower() == ".pdf":
+            try:
+                page_count = await loop.run_in_executor(pool, pdf_page_count, path)
+            except BrokenProcessPool:
+                raise
+            except Exception:
+                page_count = 0  # extract_file_content trả về chuỗi lỗi
+            if page_count >= PDF_PARALLEL_MIN_PAGES:
+                return await self._extract_pdf_ranges(pool, path, page_count)
+        return await loop.run_in_executor(pool, extract_file_content, path)
+
+    async def _extract_pdf_ranges(self, pool: IngestionPool, path: str, page_count: int) -> str:
+        """
+        Các khoảng trang được nộp theo thứ tự trang, tối đa `workers` khoảng chạy cùng lúc, ghép
+        theo thứ tự trang. Phần đầu đã ghép đủ MAX_CONTENT_CHARS thì không nộp tiếp, huỷ phần còn lại
+        """
+        loop = asyncio.get_running_loop()
+        ranges = iter(pdf_page_ranges(page_count, self.workers * PDF_RANGES_PER_WORKER))
+        running = deque()
+        parts = []
+        total = 0
+        try:
+            while total < MAX_CONTENT_CHARS:
+                while len(running) < self.workers and (page_range := next(ranges, None)) is not None:
+                    running.append(loop.run_in_executor(
+                        pool, extract_pdf_range, path, *page_range, MAX_CONTENT_CHARS - total
+                    ))
+                if not running:
+                    break
+                part = await running.popleft()
+                if is_extraction_error(part):
+                    return part
+                parts.append(part)
+                total += len(part)
+        finally:
+            for future in running:
+                future.cancel()
+        return "".join(parts)[:MAX_CONTENT_CHARS]
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            job.mark_running()
+            INGESTION_WAIT_SECONDS.observe(time.time() - job.created_at)
+            extension = job.path.suffix.lower().lstrip(".") or "none"
+            started = time.perf_counter()
+            pool = self._pool
+            try:
+                content = await asyncio.wait_for(self._extract(pool, job), self.job_timeout)
+                EXTRACTION_SECONDS.labels(extension, "error" if is_extraction_error(content) else "ok").observe(
+                    time.perf_counter() - started
+                )
+                await self._store_result(job, content, cached=False)
+                job.finish(content)
+            except asyncio.TimeoutError:
+                EXTRACTION_SECONDS.labels(extension, "timeout").observe(time.perf_counter() - started)
+                self.timeouts += 1
+                self._restart_pool(pool)
+                job.fail(f"Quá thời gian xử lý file ({self.job_timeout:g}s)")
+            except BrokenProcessPool as e:
+                # Pool bị thay do job khác quá thời gian (hoặc process con chết): chạy lại trên pool mới
+                self._restart_pool(pool)
+                if not self._requeue(job):
+                    job.fail(f"Error processing file: {str(e)}")
+            except Exception as e:
+                job.fail(f"Error processing file: {str(e)}")
+            finally:
+                self._queue.task_done()
+            if job.status in TERMINAL_STATUSES:
+                await self.release(job)
+
+    async def _store_result(self, job: IngestionJob, content: str, cached: bool):
+        """Cache kết quả trích xuất theo blob + index cho retrieval; lỗi ở đây không làm hỏng job"""
+        if not job.blob_id or is_extraction_error(content):
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            if not cached:
+                await loop.run_in_executor(None, blob_store.put_extracted, job.blob_id, content)
+            with INDEXING_SECONDS.time():
+                await loop.run_in_executor(
+                    None, get_retriever().index_document, job.user_id, job.blob_id, job.filename, content
+                )
+        except Exception as e:
+            print(f"⚠️ Lỗi lưu kết quả trích xuất {job.filename}: {str(e)}")
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "jobs": len(self.jobs),
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "pool_restarts": self.pool_restarts,
+            "requeued": self.requeued,
+        }
+
+
+# Global ingestion queue (khởi động/dừng trong lifespan)
+ingestion_queue = IngestionQueue()
+
+Gauge("ingestion_queue_depth", "Số job đang chờ trong hàng đợi ingest",
+      lambda: ingestion_queue._queue.qsize() if ingestion_queue._queue else 0)
@@ -0,0 +1,280 @@
+"""
+Metrics in-process, xuất ra `/metrics` theo định dạng text của Prometheus.
+
+- `Counter`, `Histogram` (bucket cố định, không lưu từng mẫu), `Gauge` (đọc
+  giá trị qua callback lúc scrape)
+- Không dùng lock: mọi cập nhật là vài phép cộng trên list/float của Python,
+  phần lớn chạy trên thread của event loop; cập nhật từ thread pool có thể
+  (rất hiếm) mất một lần đếm — chấp nhận được với metrics
+- Mỗi bộ label có một "child" được cache, đường nóng chỉ là dict get +
+  bisect + 2 phép cộng
+- `MetricsMiddleware`: độ trễ request theo method / route template / status
+- `LoopLagMonitor`: đo độ trễ event loop (sleep định kỳ, đo phần ngủ quá)
+
+Module nào có số liệu thì tự khai báo metric của mình ở đầu module.
+"""
+import asyncio
+import os
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+
+# Giây: 1ms .. 30s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LAG_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List["_Metric"] = []
+
+    def register(self, metric: "_Metric"):
+        self.metrics.append(metric)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional[Registry] = REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if registry is not None:
+            registry.register(self)
+
+    @abstractmethod
+    def _new_child(self):
+        """Giá trị của một bộ label"""
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} cần label {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """Các dòng text exposition của metric"""
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, values)} {_number(child.value)}"
+                for values, child in list(self._children.items())]
+
+
+class _Timer:
+    __slots__ = ("child", "started")
+
+    def __init__(self, child: "_HistogramChild"):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.started)
+        return False
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # phần tử cuối: > bucket lớn nhất (+Inf)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Optional[Registry] = REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self, *values: str) -> _Timer:
+        """`with HISTOGRAM.time("label"): ...` — đo thời gian của khối lệnh"""
+        return _Timer(self.labels(*values))
+
+    def samples(self) -> List[str]:
+        lines = []
+        les = [_number(bound) for bound in (*self.buckets, float("inf"))]
+        for values, child in list(self._children.items()):
+            base = _labels(self.labelnames, values)
+            prefix = f"{self.name}_bucket{{{base[1:-1]}," if base else f"{self.name}_bucket{{"
+            cumulative = 0
+            for le, count in zip(les, list(child.counts)):
+                cumulative += count
+                lines.append(f'{prefix}le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{base} {_number(child.sum)}")
+            lines.append(f"{self.name}_count{base} {cumulative}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Giá trị đọc lúc scrape: callback trả về số, hoặc dict {tuple label: số}"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str,
+                 callback: Callable[[], Union[float, Dict[Tuple[str, ...], float]]],
+                 labelnames: Sequence[str] = (), registry: Optional[Registry] = REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.callback = callback
+
+    def _new_child(self):
+        raise TypeError(f"{self.name} lấy giá trị từ callback, không dùng labels()")
+
+    def samples(self) -> List[str]:
+        try:
+            value = self.callback()
+        except Exception:
+            return []
+        if isinstance(value, dict):
+            return [f"{self.name}{_labels(self.labelnames, values)} {_number(v)}" for values, v in value.items()]
+        return [f"{self.name} {_number(value)}"]
+
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Thời gian xử lý request (tới khi gửi xong response)",
+    ("method", "route", "status"),
+)
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    "event_loop_lag_seconds", "Độ trễ của event loop so với lịch sleep", buckets=LAG_BUCKETS,
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware thuần: label route là template (vd `/chat/sessions/{session_id}`) để giới hạn số series"""
+
+    def __init__(self, app, histogram: Histogram = HTTP_REQUEST_SECONDS):
+        self.app = app
+        self.histogram = histogram
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            self.histogram.labels(
+                scope["method"], getattr(route, "path", None) or "unmatched", str(status_code)
+            ).observe(time.perf_counter() - started)
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, histogram: Histogram = EVENT_LOOP_LAG_SECONDS):
+        self.interval = interval
+        self.histogram = histogram
+        self.last = 0.0
+        self.max = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - started - self.interval)
+            self.last = lag
+            self.max = max(self.max, lag)
+            self.histogram.observe(lag)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+loop_lag_monitor = LoopLagMonitor()
+
+Gauge("event_loop_lag_last_seconds", "Độ trễ event loop đo lần gần nhất", lambda: loop_lag_monitor.last)
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,504 @@
+"""
+Vector store trên đĩa: vector lượng tử hoá (int8 / float16), đọc qua mmap.
+
+Mỗi collection là một thư mục gồm `manifest.json` và các segment bất biến:
+- `<seg>.codes`   ma trận (count, dim) int8 hoặc float16
+- `<seg>.scales`  float32 (count,), hệ số của từng vector (chỉ với int8)
+- `<seg>.ids`     JSON list id các điểm
+- `<seg>.records` các dòng JSON {"id", "payload"}; `<seg>.offsets` int64 vị trí từng dòng
+- `<seg>.fields`  JSON {trường: {giá trị: [dòng...]}} cho các trường payload trong
+  VECTOR_INDEXED_FIELDS: count/delete/search theo filter trên các trường này
+  không phải parse payload từng dòng
+Mỗi lần upsert ghi một segment mới; điểm bị xoá/ghi đè được đánh dấu trong
+manifest (`deleted`). Khi số segment hoặc tỉ lệ dòng đã xoá vượt ngưỡng, một
+thread nền gộp chúng thành một segment (compaction).
+
+Các uvicorn worker mở cùng file bằng np.memmap nên dùng chung page cache của
+hệ điều hành thay vì mỗi worker giữ một bản float32 trên heap. Manifest thay
+đổi (worker khác ghi) được phát hiện qua stat() trước mỗi thao tác. Ghi giữa
+các process được khoá bằng flock (nếu hệ điều hành hỗ trợ).
+API giống LocalVectorStore / QdrantClient.
+"""
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from app.models.blob_store import UPLOAD_DIR
+from app.models.embeddings import normalize
+from app.models.vector_store import (
+    CollectionNotFound, CountResult, Filter, PointId, PointStruct, ScoredPoint, SearchRequest, VectorParams, top_k,
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows: chỉ khoá trong process
+    fcntl = None
+
+VECTOR_STORE_DIR = Path(os.getenv("VECTOR_STORE_DIR", str(UPLOAD_DIR / "vectors")))
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "int8")
+VECTOR_COMPACTION_MIN_SEGMENTS = int(os.getenv("VECTOR_COMPACTION_MIN_SEGMENTS", "8"))
+VECTOR_COMPACTION_DELETED_RATIO = float(os.getenv("VECTOR_COMPACTION_DELETED_RATIO", "0.3"))
+VECTOR_INDEXED_FIELDS = tuple(
+    name.strip() for name in os.getenv("VECTOR_INDEXED_FIELDS", "filename,blob_id").split(",") if name.strip()
+)
+SEARCH_BLOCK_ROWS = 1024  # khối nhỏ: bản giải nén float32 nằm gọn trong cache CPU
+
+CODE_DTYPES = {"int8": np.int8, "float16": np.float16}
+
+
+def quantize(vectors: np.ndarray, quantization: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """int8: mỗi vector chia cho hệ số riêng max|x|/127; float16: ép kiểu, không cần hệ số"""
+    if quantization == "float16":
+        return vectors.astype(np.float16), None
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1.0
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def _write_atomic(path: Path, data: bytes):
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+FieldIndex = Dict[str, Dict[str, List[int]]]
+
+
+def build_field_index(payloads: Sequence[Optional[Dict[str, Any]]]) -> FieldIndex:
+    """{trường: {giá trị: [dòng...]}} cho các trường được index (chỉ giá trị chuỗi)"""
+    index: FieldIndex = {name: {} for name in VECTOR_INDEXED_FIELDS}
+    for row, payload in enumerate(payloads):
+        for name in VECTOR_INDEXED_FIELDS:
+            value = (payload or {}).get(name)
+            if isinstance(value, str):
+                index[name].setdefault(value, []).append(row)
+    return index
+
+
+class Segment:
+    """Segment bất biến, mở bằng memmap"""
+
+    def __init__(self, directory: Path, name: str, count: int, dim: int, quantization: str):
+        self.directory = directory
+        self.name = name
+        self.count = count
+        self.dim = dim
+        self.quantization = quantization
+        dtype = CODE_DTYPES[quantization]
+        if count:
+            self.codes = np.memmap(self._path("codes"), dtype=dtype, mode="r", shape=(count, dim))
+            self.offsets = np.memmap(self._path("offsets"), dtype=np.int64, mode="r", shape=(count + 1,))
+            self.records = np.memmap(self._path("records"), dtype=np.uint8, mode="r")
+        else:
+            self.codes = np.empty((0, dim), dtype=dtype)
+            self.offsets = np.zeros(1, dtype=np.int64)
+            self.records = np.empty(0, dtype=np.uint8)
+        self.scales = (np.memmap(self._path("scales"), dtype=np.float32, mode="r", shape=(count,))
+                       if count and quantization == "int8" else None)
+        self._ids: Optional[List[PointId]] = None
+        self._fields: Optional[FieldIndex] = None
+
+    def _path(self, kind: str) -> Path:
+        return self.directory / f"{self.name}.{kind}"
+
+    @classmethod
+    def write(cls, directory: Path, name: str, codes: np.ndarray, scales: Optional[np.ndarray],
+              ids: List[PointId], records: List[bytes], fields: FieldIndex, quantization: str) -> "Segment":
+        offsets = np.zeros(len(records) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(record) for record in records])
+        _write_atomic(directory / f"{name}.codes", np.ascontiguousarray(codes).tobytes())
+        if scales is not None:
+            _write_atomic(directory / f"{name}.scales", scales.astype(np.float32).tobytes())
+        _write_atomic(directory / f"{name}.offsets", offsets.tobytes())
+        _write_atomic(directory / f"{name}.records", b"".join(records))
+        _write_atomic(directory / f"{name}.ids", json.dumps(ids).encode())
+        _write_atomic(directory / f"{name}.fields", json.dumps(fields, ensure_ascii=False).encode())
+        return cls(directory, name, len(records), codes.shape[1], quantization)
+
+    def remove_files(self):
+        for kind in ("codes", "scales", "offsets", "records", "ids", "fields"):
+            self._path(kind).unlink(missing_ok=True)
+
+    @property
+    def ids(self) -> List[PointId]:
+        if self._ids is None:
+            self._ids = json.loads(self._path("ids").read_bytes()) if self.count else []
+        return self._ids
+
+    @property
+    def fields(self) -> FieldIndex:
+        """Index trường payload; segment ghi trước khi có index -> {} (lọc bằng cách đọc payload)"""
+        if self._fields is None:
+            path = self._path("fields")
+            self._fields = json.loads(path.read_bytes()) if self.count and path.exists() else {}
+        return self._fields
+
+    def rows_matching(self, query_filter: Filter) -> Optional[np.ndarray]:
+        """Mask các dòng khớp filter tra từ index; None nếu filter dùng trường/giá trị chưa được index"""
+        mask = np.ones(self.count, dtype=bool)
+        for condition in query_filter.must:
+            values = self.fields.get(condition.key)
+            if values is None or not isinstance(condition.match.value, str):
+                return None
+            matched = np.zeros(self.count, dtype=bool)
+            matched[values.get(condition.match.value, [])] = True
+            mask &= matched
+        return mask
+
+    def record_bytes(self, row: int) -> bytes:
+        return self.records[self.offsets[row]:self.offsets[row + 1]].tobytes()
+
+    def record(self, row: int) -> Dict[str, Any]:
+        return json.loads(self.record_bytes(row))
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """Điểm cosine (q, count); giải nén từng khối nhỏ thay vì tạo bản float32 của cả segment"""
+        scores = np.empty((len(queries), self.count), dtype=np.float32)
+        for start in range(0, self.count, SEARCH_BLOCK_ROWS):
+            stop = min(start + SEARCH_BLOCK_ROWS, self.count)
+            np.matmul(queries, self.codes[start:stop].astype(np.float32).T, out=scores[:, start:stop])
+        if self.scales is not None:
+            scores *= self.scales
+        return scores
+
+
+def merge_field_index(target: FieldIndex, segment: Segment, rows: np.ndarray, offset: int):
+    """Thêm index của các dòng `rows` (còn sống, tăng dần) của segment vào `target`, dòng mới = offset + thứ tự"""
+    source = segment.fields
+    if any(name not in source for name in target):
+        # Segment cũ chưa có index: dựng từ payload
+        source = build_field_index([segment.record(row)["payload"] for row in range(segment.count)])
+    for name, values in target.items():
+        for value, old_rows in source[name].items():
+            old_rows = np.asarray(old_rows, dtype=np.int64)
+            positions = np.searchsorted(rows, old_rows)
+            kept = positions < len(rows)
+            kept[kept] = rows[positions[kept]] == old_rows[kept]
+            if kept.any():
+                values.setdefault(value, []).extend((positions[kept] + offset).tolist())
+
+
+class MmapCollection:
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.manifest_path = directory / "manifest.json"
+        self.manifest: Dict[str, Any] = {}
+        self.segments: List[Segment] = []
+        self.alive: Dict[str, np.ndarray] = {}
+        self._opened: Dict[str, Segment] = {}
+        self._stamp = None
+        self._index: Optional[Dict[PointId, Tuple[str, int]]] = None
+        self._lock = threading.RLock()  # trạng thái đọc (manifest/segments)
+        self._write_mutex = threading.Lock()  # một thao tác ghi/compaction tại một thời điểm
+        self._compacting = False
+        self.compactions = 0
+
+    # Manifest
+    @classmethod
+    def create(cls, directory: Path, params: VectorParams, quantization: str) -> Tuple["MmapCollection", bool]:
+        """Tạo collection nếu chưa có; trả về (collection, đã tạo mới hay chưa)"""
+        directory.mkdir(parents=True, exist_ok=True)
+        collection = cls(directory)
+        with collection._write_lock():
+            # Kiểm tra lại khi đã giữ flock: worker khác có thể vừa tạo và ghi dữ liệu vào collection
+            if collection.manifest_path.exists():
+                return collection, False
+            collection._save({"dim": params.size, "quantization": quantization, "next_segment": 0, "segments": []})
+        return collection, True
+
+    def _save(self, manifest: Dict[str, Any]):
+        _write_atomic(self.manifest_path, json.dumps(manifest).encode())
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self):
+        """Đọc lại manifest nếu file đã đổi (worker khác vừa ghi); gọi khi giữ self._lock"""
+        stat = self.manifest_path.stat()
+        stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        if stamp == self._stamp:
+            return
+        manifest = json.loads(self.manifest_path.read_bytes())
+        segments, alive = [], {}
+        for entry in manifest["segments"]:
+            segment = self._opened.get(entry["name"]) or Segment(
+                self.directory, entry["name"], entry["count"], manifest["dim"], manifest["quantization"]
+            )
+            mask = np.ones(segment.count, dtype=bool)
+            mask[entry["deleted"]] = False
+            segments.append(segment)
+            alive[segment.name] = mask
+        self.manifest, self.segments, self.alive, self._stamp = manifest, segments, alive, stamp
+        self._opened = {segment.name: segment for segment in segments}
+        self._index = None
+
+    @contextmanager
+    def _write_lock(self):
+        """Khoá ghi giữa các thread (mutex) và giữa các process (flock); không chặn search"""
+        with self._write_mutex:
+            lock_file = open(self.directory / "lock", "a+")
+            try:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                if self.manifest_path.exists():
+                    with self._lock:
+                        self._refresh()
+                yield
+            finally:
+                lock_file.close()
+
+    def _snapshot(self) -> List[Tuple[Segment, np.ndarray]]:
+        with self._lock:
+            self._refresh()
+            return [(segment, self.alive[segment.name]) for segment in self.segments]
+
+    def _index_of(self) -> Dict[PointId, Tuple[str, int]]:
+        """id -> (segment, dòng) của các điểm còn sống; chỉ dựng khi ghi/xoá theo id"""
+        if self._index is None:
+            self._index = {}
+            for segment in self.segments:
+                alive = self.alive[segment.name]
+                for row, point_id in enumerate(segment.ids):
+                    if alive[row]:
+                        self._index[point_id] = (segment.name, row)
+        return self._index
+
+    def _mark_deleted(self, manifest: Dict[str, Any], locations: List[Tuple[str, int]]):
+        by_segment: Dict[str, List[int]] = {}
+        for name, row in locations:
+            by_segment.setdefault(name, []).append(row)
+        for entry in manifest["segments"]:
+            rows = by_segment.get(entry["name"])
+            if rows:
+                entry["deleted"] = sorted(set(entry["deleted"]) | set(rows))
+
+    # Ghi
+    def upsert(self, points: Sequence[PointStruct]):
+        if not points:
+            return
+        with self._write_lock():
+            manifest = json.loads(json.dumps(self.manifest))
+            index = self._index_of()
+            self._mark_deleted(manifest, [index[point.id] for point in points if point.id in index])
+
+            vectors = normalize(np.asarray([point.vector for point in points], dtype=np.float32))
+            codes, scales = quantize(vectors, manifest["quantization"])
+            records = [json.dumps({"id": point.id, "payload": point.payload}, ensure_ascii=False).encode() + b"\n"
+                       for point in points]
+            name = f"seg-{manifest['next_segment']:08d}"
+            segment = Segment.write(self.directory, name, codes, scales, [point.id for point in points], records,
+                                    build_field_index([point.payload for point in points]), manifest["quantization"])
+            self._opened[name] = segment
+            manifest["next_segment"] += 1
+            manifest["segments"].append({"name": name, "count": segment.count, "deleted": []})
+            self._save(manifest)
+        self.maybe_compact()
+
+    def delete(self, points_selector: Union[Filter, Sequence[PointId]]):
+        with self._write_lock():
+            manifest = json.loads(json.dumps(self.manifest))
+            if isinstance(points_selector, Filter):
+                masks = self._matching(points_selector, self._snapshot())
+                locations = [(name, int(row)) for name, mask in masks.items() for row in np.flatnonzero(mask)]
+            else:
+                index = self._index_of()
+                locations = [index[point_id] for point_id in points_selector if point_id in index]
+            if locations:
+                self._mark_deleted(manifest, locations)
+                self._save(manifest)
+        self.maybe_compact()
+
+    # Compaction
+    def needs_compaction(self) -> bool:
+        total = sum(segment.count for segment in self.segments)
+        deleted = total - sum(int(mask.sum()) for mask in self.alive.values())
+        return (len(self.segments) >= VECTOR_COMPACTION_MIN_SEGMENTS
+                or (total and deleted / total >= VECTOR_COMPACTION_DELETED_RATIO))
+
+    def maybe_compact(self):
+        """Gộp segment trong thread nền nếu vượt ngưỡng"""
+        with self._lock:
+            self._refresh()
+            if self._compacting or not self.needs_compaction():
+                return
+            self._compacting = True
+        threading.Thread(target=self.compact, daemon=True).start()
+
+    def compact(self):
+        """Gộp các dòng còn sống của mọi segment thành một segment (copy mã đã lượng tử, không tính lại)"""
+        try:
+            with self._write_lock():
+                manifest = json.loads(json.dumps(self.manifest))
+                snapshot = self._snapshot()
+                codes, scales, ids, records = [], [], [], []
+                fields: FieldIndex = {name: {} for name in VECTOR_INDEXED_FIELDS}
+                for segment, alive in snapshot:
+                    rows = np.flatnonzero(alive)
+                    merge_field_index(fields, segment, rows, offset=len(ids))
+                    codes.append(segment.codes[rows])
+                    if segment.scales is not None:
+                        scales.append(segment.scales[rows])
+                    segment_ids = segment.ids
+                    ids.extend(segment_ids[row] for row in rows)
+                    records.extend(segment.record_bytes(row) for row in rows)
+                name = f"seg-{manifest['next_segment']:08d}"
+                segment = Segment.write(
+                    self.directory, name,
+                    np.concatenate(codes) if codes else np.empty((0, manifest["dim"]), CODE_DTYPES[manifest["quantization"]]),
+                    np.concatenate(scales) if scales else None,
+                    ids, records, fields, manifest["quantization"],
+                )
+                manifest["next_segment"] += 1
+                manifest["segments"] = [{"name": name, "count": segment.count, "deleted": []}]
+                self._save(manifest)
+                # Worker khác đang map file cũ vẫn đọc được (unlink không xoá inode đang mở)
+                for old, _ in snapshot:
+                    old.remove_files()
+                self.compactions += 1
+        finally:
+            with self._lock:
+                self._compacting = False
+
+    # Đọc
+    @staticmethod
+    def _matching(query_filter: Filter, snapshot: List[Tuple[Segment, np.ndarray]]) -> Dict[str, np.ndarray]:
+        """Mask các dòng còn sống khớp filter của từng segment (tra index, không có thì đọc payload từng dòng)"""
+        masks = {}
+        for segment, alive in snapshot:
+            indexed = segment.rows_matching(query_filter)
+            if indexed is not None:
+                masks[segment.name] = alive & indexed
+                continue
+            mask = alive.copy()
+            for row in np.flatnonzero(alive):
+                mask[row] = query_filter.matches(segment.record(row)["payload"])
+            masks[segment.name] = mask
+        return masks
+
+    def count(self, count_filter: Optional[Filter] = None) -> int:
+        snapshot = self._snapshot()
+        if count_filter is not None:
+            snapshot = [(segment, mask) for (segment, _), mask
+                        in zip(snapshot, self._matching(count_filter, snapshot).values())]
+        return sum(int(alive.sum()) for _, alive in snapshot)
+
+    def search(self, queries: np.ndarray, limit: int, query_filter: Optional[Filter] = None) -> List[List[ScoredPoint]]:
+        queries = normalize(queries.astype(np.float32))
+        snapshot = self._snapshot()
+        if query_filter is not None:
+            snapshot = [(segment, mask) for (segment, _), mask
+                        in zip(snapshot, self._matching(query_filter, snapshot).values())]
+
+        # Top-k từng segment, sau đó gộp ứng viên của mọi segment
+        candidate_scores, candidate_refs = [], []
+        for segment, alive in snapshot:
+            if not segment.count:
+                continue
+            scores = segment.scores(queries)
+            if not alive.all():
+                scores[:, ~alive] = -np.inf
+            rows = top_k(scores, limit)
+            candidate_scores.append(np.take_along_axis(scores, rows, axis=1))
+            candidate_refs.extend((segment, rows[:, i]) for i in range(rows.shape[1]))
+
+        if not candidate_scores:
+            return [[] for _ in range(len(queries))]
+        scores = np.concatenate(candidate_scores, axis=1)
+        results = []
+        for q, order in enumerate(top_k(scores, limit)):
+            points = []
+            for column in order:
+                score = scores[q, column]
+                if not np.isfinite(score):
+                    continue
+                segment, rows = candidate_refs[column]
+                record = segment.record(int(rows[q]))
+                points.append(ScoredPoint(id=record["id"], score=float(score), payload=record["payload"]))
+            results.append(points)
+        return results
+
+
+class MmapVectorStore:
+    """Thay thế QdrantClient, lưu trên đĩa (mỗi collection một thư mục)"""
+
+    def __init__(self, root: Path = VECTOR_STORE_DIR, quantization: str = VECTOR_QUANTIZATION):
+        if quantization not in CODE_DTYPES:
+            raise ValueError(f"Unsupported quantization: {quantization}")
+        self.root = Path(root)
+        self.quantization = quantization
+        self.collections: Dict[str, MmapCollection] = {}
+        self._lock = threading.Lock()
+
+    def _directory(self, collection_name: str) -> Path:
+        return self.root / collection_name
+
+    def _get(self, collection_name: str) -> MmapCollection:
+        with self._lock:
+            collection = self.collections.get(collection_name)
+            if collection is None:
+                directory = self._directory(collection_name)
+                if not (directory / "manifest.json").exists():
+                    raise CollectionNotFound(f"Collection `{collection_name}` doesn't exist!")
+                collection = self.collections[collection_name] = MmapCollection(directory)
+            return collection
+
+    def collection_exists(self, collection_name: str) -> bool:
+        return collection_name in self.collections or (self._directory(collection_name) / "manifest.json").exists()
+
+    def create_collection(self, collection_name: str, vectors_config: VectorParams) -> bool:
+        """Tạo collection; đã tồn tại (kể cả do worker khác tạo) thì mở bản có sẵn, trả về False"""
+        with self._lock:
+            if collection_name in self.collections:
+                return False
+            collection, created = MmapCollection.create(
+                self._directory(collection_name), vectors_config, self.quantization
+            )
+            self.collections[collection_name] = collection
+        return created
+
+    def delete_collection(self, collection_name: str) -> bool:
+        with self._lock:
+            self.collections.pop(collection_name, None)
+            directory = self._directory(collection_name)
+            if not directory.exists():
+                return False
+            shutil.rmtree(directory)
+            return True
+
+    def upsert(self, collection_name: str, points: Sequence[PointStruct]):
+        self._get(collection_name).upsert(points)
+
+    def delete(self, collection_name: str, points_selector: Union[Filter, Sequence[PointId]]):
+        self._get(collection_name).delete(points_selector)
+
+    def count(self, collection_name: str, count_filter: Optional[Filter] = None) -> CountResult:
+        return CountResult(self._get(collection_name).count(count_filter))
+
+    def search(self, collection_name: str, query_vector: Sequence[float], limit: int = 10,
+               query_filter: Optional[Filter] = None) -> List[ScoredPoint]:
+        return self.search_batch(collection_name, [SearchRequest(query_vector, limit, query_filter)])[0]
+
+    def search_batch(self, collection_name: str, requests: Sequence[SearchRequest]) -> List[List[ScoredPoint]]:
+        collection = self._get(collection_name)
+        results: List[Optional[List[ScoredPoint]]] = [None] * len(requests)
+        groups: Dict[int, List[int]] = {}
+        for index, request in enumerate(requests):
+            groups.setdefault(id(request.filter), []).append(index)
+        for indexes in groups.values():
+            limit = max(requests[index].limit for index in indexes)
+            queries = np.asarray([requests[index].vector for index in indexes], dtype=np.float32)
+            for index, points in zip(indexes, collection.search(queries, limit, requests[indexes[0]].filter)):
+                results[index] = points[:requests[index].limit]
+        return results
+
+    def stats(self) -> dict:
+        return {
+            "collections": len(self.collections),
+            "compactions": sum(collection.compactions for collection in self.collections.values()),
+        }
@@ -0,0 +1,53 @@
+"""
+Keyset pagination theo (cột sắp xếp, id).
+
+Cursor là base64 (urlsafe) của [giá trị cột sắp xếp, id] của dòng biên,
+nên mỗi trang chỉ cần một query dùng index thay vì OFFSET. Cursor do client
+gửi lên nên phải là [timestamp ISO, UUID] trước khi được ghép vào filter.
+"""
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Optional, Tuple
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(row: dict, column: str) -> str:
+    raw = json.dumps([row[column], row["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        # Cột sắp xếp luôn là timestamp, id là UUID: chặn giá trị lạ (dấu ngoặc, dấu phẩy...) vào filter
+        datetime.fromisoformat(value)
+        return value, str(uuid.UUID(row_id))
+    except (ValueError, TypeError, AttributeError) as e:
+        raise InvalidCursor("Cursor không hợp lệ") from e
+
+
+def keyset_filter(column: str, value: str, row_id: str, operator: str) -> str:
+    """
+    Điều kiện PostgREST `or=(...)` lấy các dòng nằm sau cursor đã decode (`decode_cursor`):
+    column <op> value OR (column = value AND id <op> id)
+    """
+    return (
+        f'({column}.{operator}."{value}",'
+        f'and({column}.eq."{value}",id.{operator}."{row_id}"))'
+    )
+
+
+def pick_cursor(before: Optional[str], after: Optional[str]) -> Tuple[Optional[str], bool]:
+    """Trả về (cursor, backwards); chỉ được dùng một trong before/after"""
+    if before and after:
+        raise InvalidCursor("Chỉ dùng một trong hai tham số before/after")
+    return (before, True) if before else (after, False)
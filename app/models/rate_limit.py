@@ -0,0 +1,294 @@
+"""
+Rate limiting theo sliding-window counter.
+
+Mỗi key (user id, API key hoặc IP) chỉ giữ (chỉ số cửa sổ, số request cửa
+sổ trước, số request cửa sổ hiện tại) -> O(1) bộ nhớ. Số request ước lượng
+trong `window_seconds` gần nhất = prev * (phần cửa sổ trước còn nằm trong
+khoảng) + curr. Request bị từ chối không được đếm.
+
+- `MemoryRateLimitBackend`: chia shard theo hash(key), mỗi shard một lock
+  ngắn; key không hoạt động quá 2 cửa sổ bị dọn dần theo từng shard
+- `RedisRateLimitBackend`: dùng chung giữa các worker (script Lua, một round trip)
+- `RateLimitMiddleware`: ASGI middleware cho các route trong
+  `RATE_LIMITED_ROUTES` (chat, upload), key theo API key (dùng `rate_limit`
+  riêng của key nếu có), user (JWT) hoặc IP, thêm
+  header `X-RateLimit-*` vào response và `Retry-After` khi trả 429. JWT đã
+  verify ở đây được lưu vào state của request để dependency xác thực dùng lại
+"""
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from app.models.api_keys import api_key_store
+from app.models.security import VERIFIED_USER_STATE, SecurityUtils
+from app.schemas.security import RateLimitConfig, TokenData
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+# Mặc định theo phút, đủ rộng cho người dùng tương tác (không dùng 100/giờ của RateLimitConfig)
+RATE_LIMIT_MAX_REQUESTS = int(os.getenv("RATE_LIMIT_MAX_REQUESTS", "60"))
+RATE_LIMIT_WINDOW_SECONDS = int(os.getenv("RATE_LIMIT_WINDOW_SECONDS", "60"))
+RATE_LIMIT_SHARDS = int(os.getenv("RATE_LIMIT_SHARDS", "64"))
+# Chỉ giới hạn các endpoint tốn tài nguyên (sinh câu trả lời, upload); đọc lịch sử,
+# poll job, đăng nhập... không bị tính. Dạng "METHOD /path" phân tách bằng dấu phẩy
+RATE_LIMITED_ROUTES = frozenset(
+    tuple(route.split(maxsplit=1)) for route in os.getenv(
+        "RATE_LIMITED_ROUTES", "POST /chat/,POST /chat/stream,POST /chat/batch,POST /file/upload-file/"
+    ).split(",") if route.strip()
+)
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+DEFAULT_RATE_LIMIT = RateLimitConfig(max_requests=RATE_LIMIT_MAX_REQUESTS, window_seconds=RATE_LIMIT_WINDOW_SECONDS)
+
+
+def clamp_rate_limit(config: Optional[RateLimitConfig]) -> Optional[RateLimitConfig]:
+    """
+    Giới hạn client tự chọn cho API key chỉ được chặt hơn mặc định (ít request
+    hơn, cửa sổ dài hơn). Muốn nới cho một key thì admin sửa cột `rate_limit`
+    trong DB; limiter dùng nguyên giá trị trong DB
+    """
+    if config is None:
+        return None
+    return RateLimitConfig(
+        max_requests=max(1, min(config.max_requests, DEFAULT_RATE_LIMIT.max_requests)),
+        window_seconds=max(config.window_seconds, DEFAULT_RATE_LIMIT.window_seconds),
+    )
+
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_after: float  # giây đến hết cửa sổ hiện tại
+    retry_after: float = 0.0
+
+    def raw_headers(self) -> List[Tuple[bytes, bytes]]:
+        """Header dạng ASGI (bytes), dùng trực tiếp khi chèn vào response"""
+        headers = [
+            (b"x-ratelimit-limit", b"%d" % self.limit),
+            (b"x-ratelimit-remaining", b"%d" % self.remaining),
+            (b"x-ratelimit-reset", b"%d" % math.ceil(self.reset_after)),
+        ]
+        if not self.allowed:
+            headers.append((b"retry-after", b"%d" % max(1, math.ceil(self.retry_after))))
+        return headers
+
+    def headers(self) -> Dict[str, str]:
+        return {name.decode(): value.decode() for name, value in self.raw_headers()}
+
+
+def evaluate(prev: int, curr: int, now: float, config: RateLimitConfig) -> RateLimitResult:
+    """Quyết định cho một request mới khi đã biết số đếm của cửa sổ trước / hiện tại"""
+    window = config.window_seconds
+    limit = config.max_requests
+    offset = now % window
+    weight = 1 - offset / window
+    estimate = prev * weight + curr
+    reset_after = window - offset
+
+    if estimate + 1 <= limit:
+        return RateLimitResult(True, limit, max(0, math.floor(limit - estimate - 1)), reset_after)
+
+    # Thời điểm sớm nhất ước lượng giảm đủ để nhận thêm một request
+    if curr + 1 <= limit and prev:
+        retry_after = (1 - (limit - 1 - curr) / prev) * window - offset
+    else:
+        retry_after = reset_after + (1 - (limit - 1) / curr) * window if curr else reset_after
+    return RateLimitResult(False, limit, 0, reset_after, max(retry_after, 0.0))
+
+
+class MemoryRateLimitBackend:
+    """Trạng thái trong process: shard = dict key -> [chỉ số cửa sổ, prev, curr, độ dài cửa sổ]"""
+
+    def __init__(self, shards: int = RATE_LIMIT_SHARDS, sweep_every: int = 1024):
+        self.shards: List[Dict[str, list]] = [{} for _ in range(shards)]
+        self.locks = [threading.Lock() for _ in range(shards)]
+        self.ops = [0] * shards
+        self.sweep_every = sweep_every
+        self.evicted = 0
+
+    def _sweep(self, shard: Dict[str, list], now: float):
+        """Bỏ các key đã qua >= 2 cửa sổ không có request (cả prev và curr đều về 0)"""
+        idle = [key for key, entry in shard.items() if int(now // entry[3]) - entry[0] >= 2]
+        for key in idle:
+            del shard[key]
+        self.evicted += len(idle)
+
+    def hit_sync(self, key: str, config: RateLimitConfig, now: float) -> RateLimitResult:
+        index = hash(key) % len(self.shards)
+        window_index = int(now // config.window_seconds)
+        with self.locks[index]:
+            shard = self.shards[index]
+            self.ops[index] += 1
+            if self.ops[index] % self.sweep_every == 0:
+                self._sweep(shard, now)
+
+            entry = shard.get(key)
+            if entry is None or entry[3] != config.window_seconds:
+                entry = shard[key] = [window_index, 0, 0, config.window_seconds]
+            elif entry[0] != window_index:
+                entry[1] = entry[2] if entry[0] == window_index - 1 else 0
+                entry[2] = 0
+                entry[0] = window_index
+
+            result = evaluate(entry[1], entry[2], now, config)
+            if result.allowed:
+                entry[2] += 1
+            return result
+
+    async def hit(self, key: str, config: RateLimitConfig, now: float) -> RateLimitResult:
+        return self.hit_sync(key, config, now)
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self.shards)
+
+    def stats(self) -> dict:
+        return {"backend": "memory", "keys": len(self), "evicted": self.evicted}
+
+
+class RedisRateLimitBackend:
+    """Đếm trong Redis để giới hạn đúng khi chạy nhiều worker (cần package `redis`)"""
+
+    # KEYS: cửa sổ hiện tại, cửa sổ trước; ARGV: weight, limit, ttl
+    SCRIPT = """
+local curr = tonumber(redis.call('GET', KEYS[1]) or '0')
+local prev = tonumber(redis.call('GET', KEYS[2]) or '0')
+if prev * tonumber(ARGV[1]) + curr + 1 <= tonumber(ARGV[2]) then
+    redis.call('INCR', KEYS[1])
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+return {prev, curr}
+"""
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = "ratelimit"):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis cần cài package `redis`") from e
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+        self._script = self.client.register_script(self.SCRIPT)
+
+    async def hit(self, key: str, config: RateLimitConfig, now: float) -> RateLimitResult:
+        window = config.window_seconds
+        window_index = int(now // window)
+        keys = [f"{self.prefix}:{key}:{window_index}", f"{self.prefix}:{key}:{window_index - 1}"]
+        weight = 1 - (now % window) / window
+        prev, curr = await self._script(keys=keys, args=[weight, config.max_requests, window * 2])
+        return evaluate(int(prev), int(curr), now, config)
+
+    def stats(self) -> dict:
+        return {"backend": "redis"}
+
+
+class RateLimiter:
+    def __init__(self, backend, default: RateLimitConfig = DEFAULT_RATE_LIMIT):
+        self.backend = backend
+        self.default = default
+        self.limited = 0
+
+    async def hit(self, key: str, config: Optional[RateLimitConfig] = None,
+                  now: Optional[float] = None) -> RateLimitResult:
+        result = await self.backend.hit(key, config or self.default, time.time() if now is None else now)
+        if not result.allowed:
+            self.limited += 1
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "max_requests": self.default.max_requests,
+            "window_seconds": self.default.window_seconds,
+            "limited": self.limited,
+            **self.backend.stats(),
+        }
+
+
+BACKENDS = {
+    "memory": MemoryRateLimitBackend,
+    "redis": RedisRateLimitBackend,
+}
+
+_limiter: Optional[RateLimiter] = None
+
+def get_rate_limiter() -> RateLimiter:
+    """Rate limiter dùng chung (chọn backend qua RATE_LIMIT_BACKEND)"""
+    global _limiter
+    if _limiter is None:
+        if RATE_LIMIT_BACKEND not in BACKENDS:
+            raise RuntimeError(f"RATE_LIMIT_BACKEND={RATE_LIMIT_BACKEND} không hợp lệ (memory hoặc redis)")
+        _limiter = RateLimiter(BACKENDS[RATE_LIMIT_BACKEND]())
+    return _limiter
+
+
+async def rate_limit_key(scope) -> Tuple[str, Optional[RateLimitConfig], Optional[TokenData]]:
+    """
+    Key + cấu hình riêng (None = mặc định) của request: API key, user trong JWT, nếu không có thì IP;
+    kèm TokenData nếu đã verify được JWT
+    """
+    api_key = authorization = None
+    for name, value in scope["headers"]:
+        if name == b"x-api-key":
+            api_key = value
+        elif name == b"authorization":
+            authorization = value
+
+    # Cùng thứ tự ưu tiên với get_current_user_or_api_key: API key trước, JWT sau
+    if api_key:
+        try:
+            record = await api_key_store.resolve(api_key.decode("latin-1"))
+        except Exception:
+            record = None  # lỗi DB: để dependency xác thực trả lỗi, ở đây tính theo IP
+        if record is not None and record.is_active:
+            return f"key:{record.id}", record.rate_limit, None
+    elif authorization and authorization[:7].lower() == b"bearer ":
+        try:
+            user = SecurityUtils.verify_token(authorization[7:].decode("latin-1"))
+        except HTTPException:
+            user = None
+        if user is not None and user.user_id:
+            return f"user:{user.user_id}", None, user
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}", None, None
+
+
+class RateLimitMiddleware:
+    """ASGI middleware thuần (không bọc request/response như BaseHTTPMiddleware)"""
+
+    def __init__(self, app, limiter: Optional[RateLimiter] = None, routes=RATE_LIMITED_ROUTES):
+        self.app = app
+        self.limiter = limiter or get_rate_limiter()
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (scope["method"], scope["path"]) not in self.routes:
+            await self.app(scope, receive, send)
+            return
+
+        key, config, user = await rate_limit_key(scope)
+        if user is not None:
+            scope.setdefault("state", {})[VERIFIED_USER_STATE] = user
+        result = await self.limiter.hit(key, config)
+        if not result.allowed:
+            response = JSONResponse(
+                status_code=429,
+                content={"detail": "Quá nhiều request, vui lòng thử lại sau"},
+                headers=result.headers(),
+            )
+            await response(scope, receive, send)
+            return
+
+        extra_headers = result.raw_headers()
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), *extra_headers]
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -0,0 +1,580 @@
+"""
+Async data-access layer cho users, sessions, questions, answers.
+
+Gọi thẳng PostgREST của Supabase qua httpx.AsyncClient dùng chung
+(connection pool giới hạn + HTTP/2 keep-alive), nên các request đồng thời
+trên cùng một worker không chặn event loop của nhau.
+"""
+import os
+import re
+import time
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+import httpx
+
+from app.config.database import db_config
+from app.models.cache import TTLCache
+from app.models.metrics import Counter, Histogram
+from app.models.pagination import decode_cursor, encode_cursor, keyset_filter, pick_cursor
+from app.models.singleflight import SingleFlight
+
+# Cột lấy cho lịch sử chat: questions kèm answers lồng nhau (PostgREST embed)
+CONVERSATION_COLUMNS = """
+    id,
+    content,
+    created_at,
+    answers (
+        id,
+        question_id,
+        content,
+        generated_by,
+        created_at
+    )
+"""
+
+# Cột API key trả về cho client (không bao giờ trả key_hash)
+API_KEY_COLUMNS = "id,key_prefix,user_id,name,is_active,rate_limit,created_at,last_used"
+
+# Cache quyền sở hữu: session -> owner, question -> session
+OWNERSHIP_CACHE_SIZE = int(os.getenv("OWNERSHIP_CACHE_SIZE", "50000"))
+OWNERSHIP_CACHE_TTL = float(os.getenv("OWNERSHIP_CACHE_TTL", "600"))
+
+# Cache version (ETag): ghi qua worker này cập nhật ngay; ghi qua worker khác
+# chỉ thấy sau tối đa VERSION_CACHE_TTL giây
+VERSION_CACHE_SIZE = int(os.getenv("VERSION_CACHE_SIZE", "50000"))
+VERSION_CACHE_TTL = float(os.getenv("VERSION_CACHE_TTL", "5"))
+
+# Gộp các lần đọc (GET) giống hệt nhau đang chạy đồng thời (app/models/singleflight.py)
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+
+# Bảng mà mỗi RPC ghi vào (kể cả qua trigger), để bỏ các lần đọc đang bay;
+# RPC không có ở đây coi như ghi mọi bảng
+RPC_WRITES = {
+    "chat_turn": ("questions", "answers", "sessions"),
+    "chat_turns": ("questions", "answers", "sessions"),
+    "apply_deferred_updates": ("users", "api_keys"),
+}
+
+# `answers(...)` trong tham số select -> bảng được embed
+EMBEDDED_TABLE = re.compile(r"(\w+)\(")
+
+
+POSTGREST_SECONDS = Histogram(
+    "postgrest_request_duration_seconds", "Thời gian một lần gọi PostgREST", ("table", "operation"),
+)
+POSTGREST_ERRORS = Counter(
+    "postgrest_errors_total", "Lần gọi PostgREST lỗi (status >= 400 hoặc lỗi kết nối)", ("table", "operation", "status"),
+)
+POSTGREST_COALESCED = Counter(
+    "postgrest_coalesced_total", "Lần đọc PostgREST dùng chung kết quả của một lần gọi đang chạy", ("table",),
+)
+OPERATIONS = {"GET": "select", "POST": "insert", "PATCH": "update", "DELETE": "delete"}
+
+
+def request_labels(method: str, path: str) -> Tuple[str, str]:
+    """`/users` -> (users, select|insert|...); `/rpc/chat_turn` -> (chat_turn, rpc)"""
+    if path.startswith("/rpc/"):
+        return path[5:], "rpc"
+    return path[1:], OPERATIONS.get(method, method.lower())
+
+
+def quote_value(value: Any) -> str:
+    """Giá trị trong danh sách `in.(...)`: đặt trong ngoặc kép, escape `\\` và `"` như PostgREST yêu cầu"""
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+class RepositoryError(Exception):
+    """Lỗi trả về từ PostgREST"""
+
+    def __init__(self, status_code: int, message: str, code: Optional[str] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.code = code
+
+
+class SupabaseRepository:
+    def __init__(self, client: Optional[httpx.AsyncClient] = None):
+        self._client = client
+        self.session_owners = TTLCache(OWNERSHIP_CACHE_SIZE, OWNERSHIP_CACHE_TTL)
+        self.question_sessions = TTLCache(OWNERSHIP_CACHE_SIZE, OWNERSHIP_CACHE_TTL)
+        # ("session", session_id) -> sessions.version; ("user", user_id) -> users.sessions_version
+        self.versions = TTLCache(VERSION_CACHE_SIZE, VERSION_CACHE_TTL)
+        self.single_flight = SingleFlight() if SINGLE_FLIGHT_ENABLED else None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self._client or db_config.async_client
+
+    # Low-level PostgREST helpers
+    @staticmethod
+    def _eq(filters: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        """{cột: giá trị} -> eq; giá trị list/tuple/set -> in.(...) (một query cho nhiều id)"""
+        params = {}
+        for column, value in (filters or {}).items():
+            if isinstance(value, (list, tuple, set)):
+                params[column] = "in.(" + ",".join(quote_value(item) for item in value) + ")"
+            else:
+                params[column] = f"eq.{value}"
+        return params
+
+    @staticmethod
+    def _first(rows: List[dict]) -> Optional[dict]:
+        return rows[0] if rows else None
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, str]] = None,
+        json: Any = None,
+        prefer: Optional[str] = None,
+        user_id: Optional[str] = None,
+    ) -> Any:
+        """
+        `user_id`: user mà lần đọc phục vụ (nằm trong key single-flight: chỉ các request
+        của cùng user dùng chung kết quả); None cho các lần đọc nội bộ (ownership, version...)
+        """
+        labels = request_labels(method, path)
+        if self.single_flight is None:
+            response = await self._send(method, path, labels, params, json, prefer)
+        elif method == "GET":
+            # Đọc trùng đang bay -> dùng chung response; mỗi caller tự parse body bên dưới
+            key = (user_id, path, tuple(sorted((params or {}).items())))
+            if key in self.single_flight:
+                POSTGREST_COALESCED.labels(labels[0]).inc()
+            response = await self.single_flight.do(
+                key, self._read_tables(labels[0], params), lambda: self._send(method, path, labels, params)
+            )
+        else:
+            written = self._written_tables(labels, json)
+            self.single_flight.invalidate(written)
+            try:
+                response = await self._send(method, path, labels, params, json, prefer)
+            finally:
+                self.single_flight.invalidate(written)
+
+        if response.status_code >= 400:
+            try:
+                payload = response.json()
+            except ValueError:
+                payload = {}
+            raise RepositoryError(
+                response.status_code,
+                payload.get("message") or response.text,
+                payload.get("code"),
+            )
+
+        if not response.content:
+            return []
+        return response.json()
+
+    async def _send(
+        self,
+        method: str,
+        path: str,
+        labels: Tuple[str, str],
+        params: Optional[Dict[str, str]] = None,
+        json: Any = None,
+        prefer: Optional[str] = None,
+    ) -> httpx.Response:
+        headers = {"Prefer": prefer} if prefer else None
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, params=params, json=json, headers=headers)
+        except Exception:
+            POSTGREST_ERRORS.labels(*labels, "error").inc()
+            raise
+        finally:
+            POSTGREST_SECONDS.labels(*labels).observe(time.perf_counter() - started)
+        if response.status_code >= 400:
+            POSTGREST_ERRORS.labels(*labels, str(response.status_code)).inc()
+        return response
+
+    @staticmethod
+    def _read_tables(table: str, params: Optional[Dict[str, str]]) -> FrozenSet[str]:
+        """Bảng mà một lần đọc phụ thuộc: bảng chính + các bảng embed trong `select`"""
+        return frozenset((table, *EMBEDDED_TABLE.findall((params or {}).get("select", ""))))
+
+    @staticmethod
+    def _written_tables(labels: Tuple[str, str], json: Any) -> Optional[Tuple[str, ...]]:
+        name, operation = labels
+        if operation != "rpc":
+            return (name,)
+        if name == "apply_deferred_updates" and isinstance(json, dict):
+            return (json.get("p_table"),)
+        return RPC_WRITES.get(name)
+
+    async def select(
+        self,
+        table: str,
+        columns: str = "*",
+        filters: Optional[Dict[str, Any]] = None,
+        order: Optional[str] = None,
+        desc: bool = False,
+        limit: Optional[int] = None,
+        user_id: Optional[str] = None,
+    ) -> List[dict]:
+        params = self._eq(filters)
+        params["select"] = "".join(columns.split())
+        if order:
+            params["order"] = f"{order}.{'desc' if desc else 'asc'}"
+        if limit is not None:
+            params["limit"] = str(limit)
+        return await self._request("GET", f"/{table}", params=params, user_id=user_id)
+
+    async def select_page(
+        self,
+        table: str,
+        columns: str,
+        filters: Optional[Dict[str, Any]],
+        order: str,
+        desc: bool = False,
+        limit: int = 50,
+        before: Optional[str] = None,
+        after: Optional[str] = None,
+        user_id: Optional[str] = None,
+    ) -> Tuple[List[dict], Optional[str]]:
+        """
+        Keyset pagination theo (order, id). Trả về (rows, next_cursor);
+        next_cursor dùng lại với cùng tham số (before hoặc after) để lấy trang kế tiếp.
+        """
+        cursor, backwards = pick_cursor(before, after)
+        # Cursor do client gửi: kiểm tra trước khi dựng filter / gọi PostgREST (InvalidCursor -> 400)
+        position = decode_cursor(cursor) if cursor else None
+        query_desc = desc != backwards
+        direction = "desc" if query_desc else "asc"
+
+        params = self._eq(filters)
+        params["select"] = "".join(columns.split())
+        params["order"] = f"{order}.{direction},id.{direction}"
+        params["limit"] = str(limit + 1)
+        if position:
+            params["or"] = keyset_filter(order, *position, "lt" if query_desc else "gt")
+
+        rows = await self._request("GET", f"/{table}", params=params, user_id=user_id)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1], order) if has_more and rows else None
+        if backwards:
+            rows.reverse()
+        return rows, next_cursor
+
+    async def insert(self, table: str, data: Any) -> List[dict]:
+        return await self._request("POST", f"/{table}", json=data, prefer="return=representation")
+
+    async def update(self, table: str, data: dict, filters: Dict[str, Any]) -> List[dict]:
+        return await self._request(
+            "PATCH", f"/{table}", params=self._eq(filters), json=data, prefer="return=representation"
+        )
+
+    async def delete(self, table: str, filters: Dict[str, Any]) -> List[dict]:
+        return await self._request(
+            "DELETE", f"/{table}", params=self._eq(filters), prefer="return=representation"
+        )
+
+    async def rpc(self, function: str, params: dict) -> Any:
+        return await self._request("POST", f"/rpc/{function}", json=params)
+
+    async def apply_deferred_updates(self, table: str, rows: List[dict]) -> int:
+        """Cập nhật nhiều dòng (mỗi dòng giá trị riêng, có `id`) trong một round trip"""
+        return await self.rpc("apply_deferred_updates", {"p_table": table, "p_rows": rows})
+
+    # Users
+    async def get_user(self, user_id: str, columns: str = "*") -> Optional[dict]:
+        return self._first(await self.select("users", columns, {"id": user_id}, user_id=user_id))
+
+    async def get_user_by_email(self, email: str, columns: str = "*") -> Optional[dict]:
+        return self._first(await self.select("users", columns, {"email": email}))
+
+    async def create_user(self, data: dict) -> Optional[dict]:
+        return self._first(await self.insert("users", data))
+
+    async def update_user(self, user_id: str, data: dict) -> Optional[dict]:
+        return self._first(await self.update("users", data, {"id": user_id}))
+
+    # API keys
+    async def get_api_key_by_hash(self, key_hash: str) -> Optional[dict]:
+        return self._first(await self.select("api_keys", "id,user_id,is_active,rate_limit", {"key_hash": key_hash}))
+
+    async def list_api_keys(self, user_id: str) -> List[dict]:
+        return await self.select(
+            "api_keys", API_KEY_COLUMNS, {"user_id": user_id}, order="created_at", user_id=user_id
+        )
+
+    async def create_api_key(self, data: dict) -> Optional[dict]:
+        return self._first(await self.insert("api_keys", data))
+
+    async def update_api_key(self, key_id: str, user_id: str, data: dict) -> Optional[dict]:
+        return self._first(await self.update("api_keys", data, {"id": key_id, "user_id": user_id}))
+
+    # Revoked tokens
+    async def list_revoked_tokens(self, not_expired_at: int, since: Optional[str] = None) -> List[dict]:
+        """jti chưa hết hạn, chỉ lấy các dòng thu hồi từ `since` (nếu có)"""
+        params = {"select": "jti,exp", "exp": f"gt.{not_expired_at}"}
+        if since is not None:
+            params["revoked_at"] = f"gte.{since}"
+        return await self._request("GET", "/revoked_tokens", params=params)
+
+    async def delete_expired_revoked_tokens(self, now: int):
+        await self._request("DELETE", "/revoked_tokens", params={"exp": f"lte.{now}"})
+
+    # Ownership cache
+    def _remember_sessions(self, sessions: List[dict]) -> List[dict]:
+        for session in sessions:
+            if "id" in session and "user_id" in session:
+                self.session_owners.set(session["id"], session["user_id"])
+            if "id" in session and "version" in session:
+                self.versions.set(("session", session["id"]), session["version"])
+        return sessions
+
+    def _remember_questions(self, questions: List[dict]) -> List[dict]:
+        for question in questions:
+            if "id" in question and "session_id" in question:
+                self.question_sessions.set(question["id"], question["session_id"])
+        return questions
+
+    async def get_session_owner(self, session_id: str) -> Optional[str]:
+        """user_id sở hữu session (None nếu không tồn tại), ưu tiên cache"""
+        owner = self.session_owners.get(session_id)
+        if owner is None:
+            session = await self.get_session(session_id, columns="id,user_id,version")
+            owner = session["user_id"] if session else None
+        return owner
+
+    async def get_question_session(self, question_id: str) -> Optional[str]:
+        """session_id chứa question (None nếu không tồn tại), ưu tiên cache"""
+        session_id = self.question_sessions.get(question_id)
+        if session_id is None:
+            question = await self.get_question(question_id, columns="id,session_id")
+            session_id = question["session_id"] if question else None
+        return session_id
+
+    async def get_question_sessions(self, question_ids: List[str]) -> Dict[str, str]:
+        """question_id -> session_id cho nhiều question (một query `in` cho phần chưa cache)"""
+        found = {}
+        missing = []
+        for question_id in question_ids:
+            session_id = self.question_sessions.get(question_id)
+            if session_id is None:
+                missing.append(question_id)
+            else:
+                found[question_id] = session_id
+        if missing:
+            questions = await self.select("questions", "id,session_id", {"id": missing})
+            found.update((q["id"], q["session_id"]) for q in self._remember_questions(questions))
+        return found
+
+    async def get_session_owners(self, session_ids: List[str]) -> Dict[str, str]:
+        """session_id -> user_id cho nhiều session (một query `in` cho phần chưa cache)"""
+        found = {}
+        missing = []
+        for session_id in session_ids:
+            owner = self.session_owners.get(session_id)
+            if owner is None:
+                missing.append(session_id)
+            else:
+                found[session_id] = owner
+        if missing:
+            sessions = await self.select("sessions", "id,user_id,version", {"id": missing})
+            found.update((s["id"], s["user_id"]) for s in self._remember_sessions(sessions))
+        return found
+
+    async def get_session_version(self, session_id: str) -> Optional[int]:
+        """Version lịch sử chat của session (None nếu không tồn tại), ưu tiên cache"""
+        version = self.versions.get(("session", session_id))
+        if version is None:
+            session = await self.get_session(session_id, columns="id,user_id,version")
+            version = session["version"] if session else None
+        return version
+
+    async def get_sessions_version(self, user_id: str) -> int:
+        """Version danh sách session của user, ưu tiên cache"""
+        version = self.versions.get(("user", user_id))
+        if version is None:
+            user = await self.get_user(user_id, columns="id,sessions_version")
+            version = user["sessions_version"] if user else 0
+            self.versions.set(("user", user_id), version)
+        return version
+
+    def _forget_versions(self, session_id: Optional[str] = None, user_id: Optional[str] = None):
+        """Bỏ version đã cache sau khi ghi (giá trị mới do trigger tính, đọc lại khi cần)"""
+        if session_id is not None:
+            self.versions.pop(("session", session_id))
+        if user_id is not None:
+            self.versions.pop(("user", user_id))
+
+    def cache_stats(self) -> Dict[str, Any]:
+        return {
+            "session_owners": self.session_owners.stats(),
+            "question_sessions": self.question_sessions.stats(),
+            "versions": self.versions.stats(),
+            "single_flight": self.single_flight.stats() if self.single_flight is not None else None,
+        }
+
+    # Sessions
+    async def get_session(
+        self, session_id: str, columns: str = "*", user_id: Optional[str] = None
+    ) -> Optional[dict]:
+        sessions = await self.select("sessions", columns, {"id": session_id}, user_id=user_id)
+        return self._first(self._remember_sessions(sessions))
+
+    async def list_sessions(self, user_id: str) -> List[dict]:
+        sessions = await self.select(
+            "sessions", "*", {"user_id": user_id}, order="started_at", desc=True, user_id=user_id
+        )
+        return self._remember_sessions(sessions)
+
+    async def list_sessions_page(
+        self, user_id: str, limit: int, before: Optional[str] = None, after: Optional[str] = None
+    ) -> Tuple[List[dict], Optional[str]]:
+        sessions, next_cursor = await self.select_page(
+            "sessions", "*", {"user_id": user_id}, "started_at", desc=True,
+            limit=limit, before=before, after=after, user_id=user_id,
+        )
+        return self._remember_sessions(sessions), next_cursor
+
+    async def create_session(self, data: dict) -> Optional[dict]:
+        session = self._first(self._remember_sessions(await self.insert("sessions", data)))
+        self._forget_versions(user_id=data.get("user_id"))
+        return session
+
+    async def update_session(self, session_id: str, data: dict) -> Optional[dict]:
+        session = self._first(self._remember_sessions(await self.update("sessions", data, {"id": session_id})))
+        self._forget_versions(user_id=session["user_id"] if session else self.session_owners.get(session_id))
+        return session
+
+    async def delete_sessions(self, session_ids: List[str], user_id: str) -> List[dict]:
+        """Xoá nhiều session của user trong một lần gọi (filter cả user_id cho chắc)"""
+        deleted = await self.delete("sessions", {"id": list(session_ids), "user_id": user_id})
+        for session in deleted:
+            self.session_owners.pop(session["id"])
+            self._forget_versions(session_id=session["id"])
+        self._forget_versions(user_id=user_id)
+        return deleted
+
+    async def delete_session(self, session_id: str) -> List[dict]:
+        deleted = await self.delete("sessions", {"id": session_id})
+        self._forget_versions(session_id, deleted[0]["user_id"] if deleted else self.session_owners.get(session_id))
+        self.session_owners.pop(session_id)
+        return deleted
+
+    # Questions
+    async def get_question(self, question_id: str, columns: str = "*") -> Optional[dict]:
+        return self._first(self._remember_questions(await self.select("questions", columns, {"id": question_id})))
+
+    async def list_questions(self, session_id: str, user_id: Optional[str] = None) -> List[dict]:
+        questions = await self.select(
+            "questions", "*", {"session_id": session_id}, order="created_at", user_id=user_id
+        )
+        return self._remember_questions(questions)
+
+    async def list_questions_page(
+        self, session_id: str, limit: int, before: Optional[str] = None, after: Optional[str] = None,
+        user_id: Optional[str] = None,
+    ) -> Tuple[List[dict], Optional[str]]:
+        questions, next_cursor = await self.select_page(
+            "questions", "*", {"session_id": session_id}, "created_at",
+            limit=limit, before=before, after=after, user_id=user_id,
+        )
+        return self._remember_questions(questions), next_cursor
+
+    async def create_question(self, data: dict) -> Optional[dict]:
+        question = self._first(self._remember_questions(await self.insert("questions", data)))
+        self._forget_versions(session_id=data.get("session_id"))
+        return question
+
+    async def list_conversation(self, session_id: str, user_id: Optional[str] = None) -> List[dict]:
+        """Questions của session kèm answers lồng nhau (PostgREST embed)"""
+        return await self.select(
+            "questions", CONVERSATION_COLUMNS, {"session_id": session_id}, order="created_at", user_id=user_id
+        )
+
+    async def list_conversation_page(
+        self, session_id: str, limit: int, before: Optional[str] = None, after: Optional[str] = None,
+        user_id: Optional[str] = None,
+    ) -> Tuple[List[dict], Optional[str]]:
+        return await self.select_page(
+            "questions", CONVERSATION_COLUMNS, {"session_id": session_id}, "created_at",
+            limit=limit, before=before, after=after, user_id=user_id,
+        )
+
+    async def create_chat_turn(
+        self,
+        session_id: str,
+        user_id: str,
+        question: str,
+        answer: str,
+        generated_by: str = "chatbot",
+    ) -> dict:
+        """
+        Lưu question + answer trong một round trip (RPC `chat_turn`).
+        RPC tự kiểm tra quyền sở hữu session; trả về question_id, answer_id, created_at.
+        """
+        try:
+            turn = await self.rpc("chat_turn", {
+                "p_session_id": session_id,
+                "p_user_id": user_id,
+                "p_question": question,
+                "p_answer": answer,
+                "p_generated_by": generated_by,
+            })
+        except RepositoryError as e:
+            if e.status_code == 404:
+                self.session_owners.pop(session_id)
+            raise
+
+        self.session_owners.set(session_id, user_id)
+        if turn.get("version") is not None:
+            self.versions.set(("session", session_id), turn["version"])
+        else:
+            self._forget_versions(session_id=session_id)
+        self.question_sessions.set(turn["question_id"], session_id)
+        return turn
+
+    async def create_chat_turns(self, session_id: str, user_id: str, turns: List[dict]) -> List[dict]:
+        """
+        Lưu nhiều lượt chat (mỗi lượt {question, answer, generated_by}) trong
+        một round trip (RPC `chat_turns`, insert theo lô trong một transaction).
+        Trả về [{question_id, answer_id, created_at, answer_created_at}] theo thứ tự.
+        """
+        try:
+            result = await self.rpc("chat_turns", {
+                "p_session_id": session_id,
+                "p_user_id": user_id,
+                "p_turns": turns,
+            })
+        except RepositoryError as e:
+            if e.status_code == 404:
+                self.session_owners.pop(session_id)
+            raise
+
+        self.session_owners.set(session_id, user_id)
+        for turn in result["turns"]:
+            self.question_sessions.set(turn["question_id"], session_id)
+        if result.get("version") is not None:
+            self.versions.set(("session", session_id), result["version"])
+        else:
+            self._forget_versions(session_id=session_id)
+        return result["turns"]
+
+    # Answers
+    async def list_answers(self, question_id: str, user_id: Optional[str] = None) -> List[dict]:
+        return await self.select("answers", "*", {"question_id": question_id}, order="created_at", user_id=user_id)
+
+    async def list_answers_for_questions(self, question_ids: List[str], user_id: Optional[str] = None) -> List[dict]:
+        """Answers của nhiều question trong một query `in`"""
+        return await self.select(
+            "answers", "*", {"question_id": list(question_ids)}, order="created_at", user_id=user_id
+        )
+
+    async def create_answer(self, data: dict) -> Optional[dict]:
+        answer = self._first(await self.insert("answers", data))
+        self._forget_versions(session_id=self.question_sessions.get(data.get("question_id")))
+        return answer
+
+
+# Global repository instance
+repository = SupabaseRepository()
+
+def get_repository() -> SupabaseRepository:
+    """Dependency function to get async repository"""
+    return repository
@@ -0,0 +1,129 @@
+"""
+Retrieval tài liệu của user cho chatbot.
+
+- Nội dung trích xuất được chia đoạn (`chunk_text`), embed rồi upsert vào
+  collection riêng của từng user (`documents_<user_id>`)
+- `retrieve` embed câu hỏi và lấy top-k đoạn gần nhất (cosine); `retrieve_many`
+  cho nhiều câu hỏi: embed một lần, search theo lô (một phép nhân ma trận)
+- Vector store chọn qua VECTOR_STORE: `mmap` (mặc định, vector lượng tử hoá
+  trên đĩa, các worker dùng chung page cache) hoặc `memory` (float32 trên
+  heap); cả hai có cùng API với QdrantClient nên có thể thay bằng Qdrant thật
+Các hàm ở đây là blocking (CPU) -> gọi qua threadpool.
+"""
+import os
+import threading
+import uuid
+from typing import List, Optional
+
+from app.models.embeddings import Embedder, get_embedder
+from app.models.file_processor import chunk_text
+from app.models.metrics import Histogram
+from app.models.mmap_vector_store import MmapVectorStore
+from app.models.vector_store import (
+    FieldCondition, Filter, LocalVectorStore, MatchValue, PointStruct, ScoredPoint, SearchRequest, VectorParams,
+)
+
+VECTOR_STORE = os.getenv("VECTOR_STORE", "mmap")
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+RETRIEVAL_MIN_SCORE = float(os.getenv("RETRIEVAL_MIN_SCORE", "0.1"))
+EMBED_BATCH_SIZE = 256
+
+RETRIEVAL_SECONDS = Histogram("retrieval_duration_seconds", "Thời gian embed câu hỏi + search vector store")
+
+POINT_NAMESPACE = uuid.UUID("8f1c1f9e-3a57-4c36-9a53-3cde2f0d7a41")
+
+
+def match(**conditions) -> Filter:
+    return Filter(must=[FieldCondition(key=key, match=MatchValue(value=value)) for key, value in conditions.items()])
+
+
+class DocumentRetriever:
+    def __init__(self, store, embedder: Embedder, top_k: int = RETRIEVAL_TOP_K,
+                 min_score: float = RETRIEVAL_MIN_SCORE):
+        self.store = store
+        self.embedder = embedder
+        self.top_k = top_k
+        self.min_score = min_score
+        self.indexed_documents = 0
+        self.indexed_chunks = 0
+        self.searches = 0
+        self._index_lock = threading.Lock()
+
+    @staticmethod
+    def collection_name(user_id: str) -> str:
+        return f"documents_{user_id}"
+
+    def index_document(self, user_id: str, blob_id: str, filename: str, text: str) -> int:
+        """Index nội dung một file của user, trả về số đoạn đã index (0 nếu đã có sẵn)"""
+        with self._index_lock:
+            return self._index_document(user_id, blob_id, filename, text)
+
+    def _index_document(self, user_id: str, blob_id: str, filename: str, text: str) -> int:
+        name = self.collection_name(user_id)
+        if not self.store.collection_exists(name):
+            self.store.create_collection(name, vectors_config=VectorParams(size=self.embedder.dim))
+        elif self.store.count(name, count_filter=match(filename=filename, blob_id=blob_id)).count:
+            return 0
+
+        # Cùng tên file nhưng nội dung khác -> bỏ các đoạn của bản cũ
+        self.store.delete(name, points_selector=match(filename=filename))
+
+        chunks = chunk_text(text)
+        for start in range(0, len(chunks), EMBED_BATCH_SIZE):
+            batch = chunks[start:start + EMBED_BATCH_SIZE]
+            vectors = self.embedder.embed(batch)
+            self.store.upsert(name, points=[
+                PointStruct(
+                    id=str(uuid.uuid5(POINT_NAMESPACE, f"{user_id}:{blob_id}:{index}")),
+                    vector=vector,
+                    payload={"blob_id": blob_id, "filename": filename, "chunk_index": index, "text": chunk},
+                )
+                for index, (chunk, vector) in enumerate(zip(batch, vectors), start=start)
+            ])
+
+        self.indexed_documents += 1
+        self.indexed_chunks += len(chunks)
+        return len(chunks)
+
+    def retrieve(self, user_id: str, query: str, limit: Optional[int] = None) -> List[ScoredPoint]:
+        """Các đoạn tài liệu của user liên quan nhất tới câu hỏi (score >= min_score)"""
+        name = self.collection_name(user_id)
+        if not self.store.collection_exists(name):
+            return []
+        self.searches += 1
+        with RETRIEVAL_SECONDS.time():
+            points = self.store.search(name, query_vector=self.embedder.embed([query])[0], limit=limit or self.top_k)
+        return [point for point in points if point.score >= self.min_score]
+
+    def retrieve_many(self, user_id: str, queries: List[str], limit: Optional[int] = None) -> List[List[ScoredPoint]]:
+        """Như `retrieve` cho nhiều câu hỏi cùng lúc (batch endpoint)"""
+        name = self.collection_name(user_id)
+        if not queries or not self.store.collection_exists(name):
+            return [[] for _ in queries]
+        self.searches += len(queries)
+        with RETRIEVAL_SECONDS.time():
+            vectors = self.embedder.embed(queries)
+            results = self.store.search_batch(name, [SearchRequest(vector, limit or self.top_k) for vector in vectors])
+        return [[point for point in points if point.score >= self.min_score] for points in results]
+
+    def stats(self) -> dict:
+        return {
+            "indexed_documents": self.indexed_documents,
+            "indexed_chunks": self.indexed_chunks,
+            "searches": self.searches,
+        }
+
+
+VECTOR_STORES = {
+    "mmap": MmapVectorStore,
+    "memory": LocalVectorStore,
+}
+
+_retriever: Optional[DocumentRetriever] = None
+
+def get_retriever() -> DocumentRetriever:
+    """Dependency function to get document retriever"""
+    global _retriever
+    if _retriever is None:
+        _retriever = DocumentRetriever(VECTOR_STORES[VECTOR_STORE](), get_embedder())
+    return _retriever
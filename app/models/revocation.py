@@ -0,0 +1,138 @@
+"""
+Danh sách token đã thu hồi (logout) theo `jti`.
+
+Mỗi token chỉ cần nằm trong danh sách tới lúc `exp` của nó, nên các jti được
+chia bucket theo `exp // REVOCATION_BUCKET_SECONDS`: kiểm tra một token chỉ
+tra đúng bucket chứa `exp` của nó (một dict get + một set lookup), và bucket
+đã hết hạn bị bỏ nguyên cả khối. jti lưu dạng số nguyên 64-bit (`hash()` của
+Python, chỉ dùng trong process) thay vì chuỗi cho gọn bộ nhớ.
+
+Đồng bộ giữa các worker qua bảng `revoked_tokens`: logout ghi một dòng, mỗi
+worker poll các dòng mới mỗi `REVOCATION_SYNC_INTERVAL` giây (token bị thu
+hồi ở worker khác còn dùng được tối đa bấy nhiêu giây ở worker này). Không
+có truy vấn DB nào trên đường xác thực request.
+"""
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Set
+
+from app.models.repository import SupabaseRepository, get_repository
+
+REVOCATION_BUCKET_SECONDS = int(os.getenv("REVOCATION_BUCKET_SECONDS", "60"))
+REVOCATION_SYNC_INTERVAL = float(os.getenv("REVOCATION_SYNC_INTERVAL", "5"))
+# Poll lại cả khoảng này trước lần poll trước (bù lệch đồng hồ / transaction commit muộn)
+REVOCATION_SYNC_OVERLAP = float(os.getenv("REVOCATION_SYNC_OVERLAP", "30"))
+REVOCATION_CLEANUP_INTERVAL = float(os.getenv("REVOCATION_CLEANUP_INTERVAL", "3600"))
+
+
+def jti_key(jti: str) -> int:
+    return hash(jti)
+
+
+def _timestamp(moment: float) -> str:
+    return datetime.fromtimestamp(moment, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f+00:00")
+
+
+class RevocationList:
+    def __init__(self, repo: Optional[SupabaseRepository] = None,
+                 bucket_seconds: int = REVOCATION_BUCKET_SECONDS,
+                 sync_interval: float = REVOCATION_SYNC_INTERVAL):
+        self._repo = repo
+        self.bucket_seconds = bucket_seconds
+        self.sync_interval = sync_interval
+        self.buckets: Dict[int, Set[int]] = {}
+        self.rejected = 0
+        self.syncs = 0
+        self.sync_errors = 0
+        self._synced_at: Optional[float] = None
+        self._cleaned_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def repo(self) -> SupabaseRepository:
+        return self._repo or get_repository()
+
+    def add(self, jti: str, exp: int):
+        if exp <= time.time():
+            return
+        self.buckets.setdefault(exp // self.bucket_seconds, set()).add(jti_key(jti))
+
+    def is_revoked(self, jti: Optional[str], exp: Optional[int]) -> bool:
+        if not self.buckets or jti is None or exp is None:
+            return False
+        bucket = self.buckets.get(exp // self.bucket_seconds)
+        if bucket is not None and jti_key(jti) in bucket:
+            self.rejected += 1
+            return True
+        return False
+
+    def prune(self, now: Optional[float] = None):
+        """Bỏ các bucket mà mọi token trong đó đã hết hạn"""
+        current = int((time.time() if now is None else now) // self.bucket_seconds)
+        for index in [index for index in self.buckets if index < current]:
+            del self.buckets[index]
+
+    async def revoke(self, jti: str, exp: int, user_id: Optional[str] = None):
+        """Thu hồi ngay ở worker này và ghi DB để các worker khác đồng bộ"""
+        self.add(jti, exp)
+        await self.repo.insert("revoked_tokens", {"jti": jti, "user_id": user_id, "exp": exp})
+
+    async def sync(self):
+        """Lấy các jti mới thu hồi (chưa hết hạn) từ DB"""
+        started = time.time()
+        since = _timestamp(self._synced_at - REVOCATION_SYNC_OVERLAP) if self._synced_at is not None else None
+        for row in await self.repo.list_revoked_tokens(int(started), since):
+            self.add(row["jti"], int(row["exp"]))
+        self._synced_at = started
+        self.syncs += 1
+        self.prune(started)
+
+        if started - self._cleaned_at >= REVOCATION_CLEANUP_INTERVAL:
+            self._cleaned_at = started
+            await self.repo.delete_expired_revoked_tokens(int(started))
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                self.sync_errors += 1
+                print(f"Không đồng bộ được danh sách token thu hồi: {e}")
+
+    async def start(self):
+        try:
+            await self.sync()
+        except Exception as e:
+            self.sync_errors += 1
+            print(f"Không tải được danh sách token thu hồi: {e}")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def __len__(self) -> int:
+        return sum(len(bucket) for bucket in self.buckets.values())
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self),
+            "buckets": len(self.buckets),
+            "rejected": self.rejected,
+            "syncs": self.syncs,
+            "sync_errors": self.sync_errors,
+            "synced_seconds_ago": round(time.time() - self._synced_at, 1) if self._synced_at else None,
+        }
+
+
+# Global revocation list
+revocation_list = RevocationList()
+
+def get_revocation_list() -> RevocationList:
+    """Dependency function to get revocation list"""
+    return revocation_list
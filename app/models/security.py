@@ -1,23 +1,106 @@
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import asyncio
+import hashlib
+import hmac
+import time
+import uuid
 import jwt
 from passlib.context import CryptContext
 import os
-from fastapi import HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi import HTTPException, Request, status
+from fastapi.security import APIKeyHeader, HTTPBearer, HTTPAuthorizationCredentials
 from fastapi import Depends
 from dotenv import load_dotenv
 from app.schemas.security import *
+from app.models.cache import TTLCache
+from app.models.api_keys import api_key_store
+from app.models.revocation import revocation_list
 load_dotenv()
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
+# Khoá trong scope["state"]: TokenData của Bearer JWT đã verify trước routing (rate limit middleware)
+VERIFIED_USER_STATE = "verified_user"
+api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
+stats_token_header = APIKeyHeader(name="X-Stats-Token", auto_error=False)
 
 # JWT Settings
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-here")
 ALGORITHM = "HS256"
 
+# Token cho endpoint vận hành /stats (header X-Stats-Token); không đặt -> /stats bị tắt
+STATS_TOKEN = os.getenv("STATS_TOKEN")
+
+# Password hashing pool (bcrypt nhả GIL nên dùng thread là đủ)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+
+class PasswordHasher:
+    """
+    Chạy bcrypt trên thread pool riêng để không chặn event loop.
+    Số tác vụ đang chờ vượt `max_pending` -> trả 503 thay vì xếp hàng vô hạn.
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Hệ thống đang quá tải, vui lòng thử lại sau",
+                headers={"Retry-After": "1"},
+            )
+
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, partial(fn, *args))
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(pwd_context.hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(pwd_context.verify, plain_password, hashed_password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "rejected": self.rejected,
+        }
+
+
+password_hasher = PasswordHasher()
+
+# Cache token đã verify: sha256(token) -> TokenData, hết hạn đúng lúc token hết hạn
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=0)
+
 
 
 class SecurityUtils:
@@ -31,6 +114,16 @@ class SecurityUtils:
     def verify_password(plain_password: str, hashed_password: str) -> bool:
         """Verify password against hash"""
         return pwd_context.verify(plain_password, hashed_password)
+
+    @staticmethod
+    async def hash_password_async(password: str) -> str:
+        """Hash password trên password pool (không chặn event loop)"""
+        return await password_hasher.hash(password)
+
+    @staticmethod
+    async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+        """Verify password trên password pool (không chặn event loop)"""
+        return await password_hasher.verify(plain_password, hashed_password)
     
     @staticmethod
     def create_access_token(data: dict, expires_delta: Optional[datetime] = None) -> str:
@@ -44,12 +137,42 @@ class SecurityUtils:
             expire = datetime.utcnow() + timedelta(minutes=SecurityUtils.ACCESS_TOKEN_EXPIRE_MINUTES)
         
         to_encode.update({"exp": expire})
+        to_encode.setdefault("jti", uuid.uuid4().hex)
         encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
         return encoded_jwt
     
+    @staticmethod
+    def token_digest(token: str) -> bytes:
+        """Khoá cache của token (không giữ token gốc trong bộ nhớ)"""
+        return hashlib.sha256(token.encode()).digest()
+
+    @staticmethod
+    def invalidate_cached_token(token: str):
+        """Xoá token khỏi cache (dùng khi token bị thu hồi)"""
+        token_cache.pop(SecurityUtils.token_digest(token))
+
+    @staticmethod
+    def _revoked() -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token đã bị thu hồi",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
     @staticmethod
     def verify_token(token: str) -> TokenData:
-        """Verify and decode JWT token"""
+        """
+        Verify and decode JWT token. Logout xoá token khỏi cache của worker xử lý nó;
+        worker khác biết qua danh sách thu hồi đồng bộ -> cache hit vẫn kiểm tra và xoá entry
+        """
+        digest = SecurityUtils.token_digest(token)
+        cached = token_cache.get(digest)
+        if cached is not None:
+            if revocation_list.is_revoked(cached.jti, cached.exp):
+                token_cache.pop(digest)
+                raise SecurityUtils._revoked()
+            return cached
+
         try:
             payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
             user_id: str = payload.get("sub")
@@ -62,7 +185,13 @@ class SecurityUtils:
                     headers={"WWW-Authenticate": "Bearer"},
                 )
             
-            return TokenData(user_id=user_id, email=email)
+            token_data = TokenData(user_id=user_id, email=email, jti=payload.get("jti"), exp=payload.get("exp"))
+            if revocation_list.is_revoked(token_data.jti, token_data.exp):
+                raise SecurityUtils._revoked()
+            expires_in = payload.get("exp", 0) - time.time()
+            if expires_in > 0:
+                token_cache.set(digest, token_data, ttl=expires_in)
+            return token_data
             
         except jwt.ExpiredSignatureError:
             raise HTTPException(
@@ -70,7 +199,7 @@ class SecurityUtils:
                 detail="Token has expired",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-        except jwt.JWTError:
+        except jwt.PyJWTError:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid authentication credentials",
@@ -87,3 +216,65 @@ async def get_current_active_user(current_user: TokenData = Depends(get_current_
     """Get current active user (can add additional checks here)"""
     return current_user
 
+async def authenticate_api_key(api_key: str) -> TokenData:
+    """Xác thực API key (qua cache), ghi nhận lần dùng để flush last_used theo lô"""
+    record = await api_key_store.resolve(api_key)
+    if record is None or not record.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="API key không hợp lệ hoặc đã bị thu hồi",
+        )
+    api_key_store.touch(record)
+    return TokenData(user_id=record.user_id)
+
+async def get_current_api_key_user(api_key: Optional[str] = Depends(api_key_header)) -> TokenData:
+    """Get current user from X-API-Key header"""
+    if not api_key:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Thiếu API key",
+        )
+    return await authenticate_api_key(api_key)
+
+async def authenticate_credentials(token: Optional[str] = None, api_key: Optional[str] = None) -> TokenData:
+    """Xác thực API key hoặc JWT ngoài Depends (vd WebSocket: header hoặc message `auth`)"""
+    if api_key:
+        return await authenticate_api_key(api_key)
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return await get_current_active_user(SecurityUtils.verify_token(token))
+
+def credentials_still_valid(token_data: TokenData) -> bool:
+    """Cho kết nối sống lâu (WebSocket): JWT chưa hết hạn và chưa bị thu hồi"""
+    if token_data.exp is not None and token_data.exp <= time.time():
+        return False
+    return not revocation_list.is_revoked(token_data.jti, token_data.exp)
+
+async def get_current_user_or_api_key(
+    request: Request,
+    api_key: Optional[str] = Depends(api_key_header),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+) -> TokenData:
+    """
+    Chấp nhận X-API-Key (client máy) hoặc Bearer JWT (người dùng);
+    JWT rate limit middleware đã verify cho request này thì dùng lại, không verify lần nữa
+    """
+    if not api_key:
+        verified = request.scope.get("state", {}).get(VERIFIED_USER_STATE)
+        if verified is not None:
+            return await get_current_active_user(verified)
+    return await authenticate_credentials(credentials.credentials if credentials else None, api_key)
+
+async def require_stats_token(token: Optional[str] = Depends(stats_token_header)):
+    """Chỉ cho gọi /stats khi gửi đúng STATS_TOKEN"""
+    if not STATS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not token or not hmac.compare_digest(token.encode(), STATS_TOKEN.encode()):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Stats token không hợp lệ",
+        )
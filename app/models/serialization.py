@@ -0,0 +1,55 @@
+"""
+Serialize response nhanh cho các endpoint trả danh sách dài.
+
+Đường mặc định với `response_model`: handler dựng từng model Pydantic, FastAPI
+validate lại cả list theo response_model, chuyển về dict/list
+(`serialize(mode="json")`) rồi `json.dumps` — nhiều lượt qua từng dòng, phần
+lớn bằng Python thuần. Ở đây dòng từ repository được validate đúng một lượt
+bằng `TypeAdapter` (schema compile sẵn trong pydantic-core, tạo một lần lúc
+import) rồi `dump_json` thẳng ra bytes. Handler trả `Response` nên FastAPI bỏ
+qua bước validate response_model; response_model vẫn giữ để sinh OpenAPI.
+
+`DefaultJSONResponse` (orjson nếu có) là default response class của app cho
+các endpoint còn lại.
+"""
+from typing import Any, Dict, Generic, List, Optional, Type, TypeVar
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import BaseModel, TypeAdapter
+
+try:
+    import orjson
+except ImportError:  # thiếu orjson: về lại json của stdlib
+    orjson = None
+
+DefaultJSONResponse = ORJSONResponse if orjson is not None else JSONResponse
+
+JSON_MEDIA_TYPE = "application/json"
+
+T = TypeVar("T")
+
+
+class FastSerializer(Generic[T]):
+    """TypeAdapter compile một lần cho một kiểu response"""
+
+    def __init__(self, type_: Type[T]):
+        self.adapter: TypeAdapter[T] = TypeAdapter(type_)
+
+    def validate(self, data: Any) -> T:
+        return self.adapter.validate_python(data)
+
+    def dump(self, value: T) -> bytes:
+        return self.adapter.dump_json(value)
+
+    def to_json(self, data: Any) -> bytes:
+        """Dòng thô (dict) -> bytes JSON, validate một lượt"""
+        return self.adapter.dump_json(self.adapter.validate_python(data))
+
+
+def list_serializer(model: Type[BaseModel]) -> FastSerializer[List[BaseModel]]:
+    return FastSerializer(List[model])
+
+
+def cursor_headers(next_cursor: Optional[str]) -> Optional[Dict[str, str]]:
+    """Header phân trang keyset cho các endpoint trả list"""
+    return {"X-Next-Cursor": next_cursor} if next_cursor else None
@@ -0,0 +1,78 @@
+"""
+Single-flight cho các lần đọc PostgREST giống hệt nhau đang chạy đồng thời.
+
+- Request đọc trùng key với một lần gọi đang bay (nhiều tab, frontend retry...)
+  không gọi upstream nữa mà chờ chung kết quả; mỗi caller tự parse body nên
+  nhận object riêng, sửa thoải mái không ảnh hưởng caller khác
+- Key gồm user mà lần đọc phục vụ (repository truyền xuống từ router): request
+  của các user khác nhau không bao giờ dùng chung một response
+- Không cache: lần gọi xong là key bị bỏ, request tới sau gọi upstream mới
+- Ghi vào một bảng bỏ mọi lần đọc đang bay có dùng bảng đó (kể cả bảng được
+  embed), trước và sau khi ghi: request tới sau lệnh ghi không nhận kết quả
+  của lần đọc bắt đầu trước khi ghi xong. Caller đã đang chờ thì vẫn nhận kết
+  quả cũ — giống như request của họ tới trước lệnh ghi
+- Upstream chạy trong task riêng: một caller bị huỷ không huỷ lần gọi của
+  các caller còn lại
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Hashable, Iterable, Optional
+
+
+class _Flight:
+    __slots__ = ("task", "tables")
+
+    def __init__(self, task: asyncio.Task, tables: FrozenSet[str]):
+        self.task = task
+        self.tables = tables
+
+
+class SingleFlight:
+    """Gộp các lời gọi cùng key đang chạy đồng thời thành một"""
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.calls = 0       # lần gọi upstream thật
+        self.coalesced = 0   # lần gọi upstream tiết kiệm được
+        self.invalidated = 0
+
+    async def do(self, key: Hashable, tables: FrozenSet[str], call: Callable[[], Awaitable[Any]]) -> Any:
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(flight.task)
+
+        task = asyncio.ensure_future(call())
+        flight = self._flights[key] = _Flight(task, tables)
+        task.add_done_callback(lambda _: self._discard(key, flight))
+        self.calls += 1
+        return await asyncio.shield(task)
+
+    def _discard(self, key: Hashable, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.task.cancelled():
+            flight.task.exception()  # mọi caller đã huỷ: không log "exception was never retrieved"
+
+    def invalidate(self, tables: Optional[Iterable[str]] = None):
+        """Bỏ các lần đọc đang bay dùng `tables` (None = tất cả)"""
+        tables = None if tables is None else frozenset(tables)
+        for key, flight in list(self._flights.items()):
+            if tables is None or flight.tables & tables:
+                del self._flights[key]
+                self.invalidated += 1
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._flights
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def stats(self) -> dict:
+        requests = self.calls + self.coalesced
+        return {
+            "inflight": len(self._flights),
+            "upstream_calls": self.calls,
+            "coalesced": self.coalesced,
+            "invalidated": self.invalidated,
+            "coalesced_ratio": round(self.coalesced / requests, 4) if requests else 0.0,
+        }
@@ -0,0 +1,11 @@
+"""
+Định dạng Server-Sent Events dùng chung cho các endpoint stream.
+"""
+import json
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Định dạng một Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
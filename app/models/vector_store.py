@@ -0,0 +1,223 @@
+"""
+Vector store trong process, API theo QdrantClient.
+
+Tên method/kiểu dữ liệu (`create_collection`, `upsert`, `search`,
+`search_batch`, `delete`, `count`, PointStruct, ScoredPoint, Filter...) giống
+qdrant-client nên có thể thay bằng Qdrant thật mà không sửa code gọi.
+Vector lưu trong mảng NumPy float32 đã chuẩn hoá, search cosine = tích vô
+hướng, top-k bằng argpartition (nhiều query một lần nhân ma trận).
+"""
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+from app.models.embeddings import normalize
+
+PointId = Union[str, int]
+
+
+# Kiểu dữ liệu (tương ứng qdrant_client.models)
+@dataclass
+class VectorParams:
+    size: int
+    distance: str = "Cosine"
+
+
+@dataclass
+class PointStruct:
+    id: PointId
+    vector: Sequence[float]
+    payload: Optional[Dict[str, Any]] = None
+
+
+@dataclass
+class ScoredPoint:
+    id: PointId
+    score: float
+    payload: Optional[Dict[str, Any]] = None
+    version: int = 0
+
+
+@dataclass
+class MatchValue:
+    value: Any
+
+
+@dataclass
+class FieldCondition:
+    key: str
+    match: MatchValue
+
+
+@dataclass
+class Filter:
+    must: List[FieldCondition] = field(default_factory=list)
+
+    def matches(self, payload: Optional[Dict[str, Any]]) -> bool:
+        payload = payload or {}
+        return all(payload.get(condition.key) == condition.match.value for condition in self.must)
+
+
+@dataclass
+class SearchRequest:
+    vector: Sequence[float]
+    limit: int = 10
+    filter: Optional[Filter] = None
+    with_payload: bool = True
+
+
+@dataclass
+class CountResult:
+    count: int
+
+
+class CollectionNotFound(Exception):
+    pass
+
+
+def top_k(scores: np.ndarray, limit: int) -> np.ndarray:
+    """Chỉ số top-k theo từng dòng của ma trận điểm, sắp xếp giảm dần"""
+    limit = min(limit, scores.shape[1])
+    if limit == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    if limit < scores.shape[1]:
+        candidates = np.argpartition(-scores, limit - 1, axis=1)[:, :limit]
+    else:
+        candidates = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1)
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+class LocalCollection:
+    """Một collection: mảng vector (tăng dung lượng gấp đôi khi đầy) + id/payload"""
+
+    def __init__(self, params: VectorParams):
+        self.params = params
+        self.vectors = np.empty((0, params.size), dtype=np.float32)
+        self.size = 0
+        self.ids: List[PointId] = []
+        self.payloads: List[Optional[Dict[str, Any]]] = []
+        self.rows: Dict[PointId, int] = {}
+
+    def _reserve(self, extra: int):
+        needed = self.size + extra
+        if needed > len(self.vectors):
+            capacity = max(needed, 2 * len(self.vectors), 64)
+            grown = np.empty((capacity, self.params.size), dtype=np.float32)
+            grown[:self.size] = self.vectors[:self.size]
+            self.vectors = grown
+
+    def upsert(self, points: Sequence[PointStruct]):
+        if not points:
+            return
+        vectors = normalize(np.asarray([point.vector for point in points], dtype=np.float32))
+        self._reserve(len(points))
+        for point, vector in zip(points, vectors):
+            row = self.rows.get(point.id)
+            if row is None:
+                row = self.size
+                self.size += 1
+                self.rows[point.id] = row
+                self.ids.append(point.id)
+                self.payloads.append(point.payload)
+            else:
+                self.payloads[row] = point.payload
+            self.vectors[row] = vector
+
+    def mask(self, query_filter: Optional[Filter]) -> Optional[np.ndarray]:
+        if query_filter is None:
+            return None
+        return np.fromiter((query_filter.matches(payload) for payload in self.payloads),
+                           dtype=bool, count=self.size)
+
+    def delete(self, keep: np.ndarray):
+        """Giữ lại các dòng có keep=True (dồn mảng)"""
+        self.vectors = self.vectors[:self.size][keep].copy()
+        self.size = len(self.vectors)
+        self.ids = [point_id for point_id, kept in zip(self.ids, keep) if kept]
+        self.payloads = [payload for payload, kept in zip(self.payloads, keep) if kept]
+        self.rows = {point_id: row for row, point_id in enumerate(self.ids)}
+
+    def search(self, queries: np.ndarray, limit: int, query_filter: Optional[Filter] = None) -> List[List[ScoredPoint]]:
+        scores = normalize(queries) @ self.vectors[:self.size].T
+        mask = self.mask(query_filter)
+        if mask is not None:
+            scores[:, ~mask] = -np.inf
+        results = []
+        for row_scores, rows in zip(scores, top_k(scores, limit)):
+            results.append([
+                ScoredPoint(id=self.ids[row], score=float(row_scores[row]), payload=self.payloads[row])
+                for row in rows if np.isfinite(row_scores[row])
+            ])
+        return results
+
+
+class LocalVectorStore:
+    """Thay thế QdrantClient trong process (thread-safe, gọi qua threadpool)"""
+
+    def __init__(self):
+        self.collections: Dict[str, LocalCollection] = {}
+        self._lock = threading.RLock()
+
+    def _get(self, collection_name: str) -> LocalCollection:
+        collection = self.collections.get(collection_name)
+        if collection is None:
+            raise CollectionNotFound(f"Collection `{collection_name}` doesn't exist!")
+        return collection
+
+    def collection_exists(self, collection_name: str) -> bool:
+        return collection_name in self.collections
+
+    def create_collection(self, collection_name: str, vectors_config: VectorParams) -> bool:
+        with self._lock:
+            if collection_name in self.collections:
+                return False
+            self.collections[collection_name] = LocalCollection(vectors_config)
+        return True
+
+    def delete_collection(self, collection_name: str) -> bool:
+        with self._lock:
+            return self.collections.pop(collection_name, None) is not None
+
+    def upsert(self, collection_name: str, points: Sequence[PointStruct]):
+        with self._lock:
+            self._get(collection_name).upsert(points)
+
+    def delete(self, collection_name: str, points_selector: Union[Filter, Sequence[PointId]]):
+        with self._lock:
+            collection = self._get(collection_name)
+            if isinstance(points_selector, Filter):
+                keep = ~collection.mask(points_selector)
+            else:
+                selected = set(points_selector)
+                keep = np.fromiter((point_id not in selected for point_id in collection.ids),
+                                   dtype=bool, count=collection.size)
+            collection.delete(keep)
+
+    def count(self, collection_name: str, count_filter: Optional[Filter] = None) -> CountResult:
+        with self._lock:
+            collection = self._get(collection_name)
+            mask = collection.mask(count_filter)
+            return CountResult(collection.size if mask is None else int(mask.sum()))
+
+    def search(self, collection_name: str, query_vector: Sequence[float], limit: int = 10,
+               query_filter: Optional[Filter] = None) -> List[ScoredPoint]:
+        return self.search_batch(collection_name, [SearchRequest(query_vector, limit, query_filter)])[0]
+
+    def search_batch(self, collection_name: str, requests: Sequence[SearchRequest]) -> List[List[ScoredPoint]]:
+        """Các request cùng filter được gom thành một phép nhân ma trận"""
+        with self._lock:
+            collection = self._get(collection_name)
+            results: List[Optional[List[ScoredPoint]]] = [None] * len(requests)
+            groups: Dict[int, List[int]] = {}
+            for index, request in enumerate(requests):
+                groups.setdefault(id(request.filter), []).append(index)
+            for indexes in groups.values():
+                query_filter = requests[indexes[0]].filter
+                limit = max(requests[index].limit for index in indexes)
+                queries = np.asarray([requests[index].vector for index in indexes], dtype=np.float32)
+                for index, points in zip(indexes, collection.search(queries, limit, query_filter)):
+                    results[index] = points[:requests[index].limit]
+            return results
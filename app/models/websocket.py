@@ -0,0 +1,236 @@
+"""
+Kênh chat qua WebSocket: xác thực một lần, nhiều session trên một kết nối.
+
+- Mỗi kết nối có một hàng đợi gửi giới hạn (`WS_SEND_QUEUE_SIZE` message) và
+  một task ghi duy nhất; producer (các request chat đang chạy) chờ khi hàng
+  đợi đầy, nên client đọc chậm làm chậm luôn việc sinh token của chính nó.
+  Đầy quá `WS_SEND_TIMEOUT` giây (client không đọc nữa) -> đóng kết nối
+- Heartbeat: một task chung cho cả worker gửi `ping` mỗi
+  `WS_HEARTBEAT_INTERVAL` giây và đóng các kết nối im lặng quá
+  `WS_IDLE_TIMEOUT` giây (client trả `pong` hoặc bất kỳ message nào)
+- `drain()` (lifespan shutdown): ngừng nhận kết nối / request mới, chờ các
+  request đang chạy xong (tối đa `WS_DRAIN_TIMEOUT` giây), gửi hết hàng đợi
+  rồi đóng 1001
+"""
+import asyncio
+import json
+import os
+import time
+from typing import Dict, Optional, Set
+
+from fastapi import WebSocket
+
+from app.models.metrics import Gauge
+from app.schemas.security import TokenData
+
+WS_HEARTBEAT_INTERVAL = float(os.getenv("WS_HEARTBEAT_INTERVAL", "20"))
+WS_IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", "60"))
+WS_AUTH_TIMEOUT = float(os.getenv("WS_AUTH_TIMEOUT", "10"))
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+WS_MAX_INFLIGHT = int(os.getenv("WS_MAX_INFLIGHT", "4"))
+WS_MAX_CONNECTIONS = int(os.getenv("WS_MAX_CONNECTIONS", "10000"))
+WS_DRAIN_TIMEOUT = float(os.getenv("WS_DRAIN_TIMEOUT", "10"))
+
+# Close code (RFC 6455 + dải 4xxx của ứng dụng)
+CLOSE_GOING_AWAY = 1001
+CLOSE_POLICY = 1008
+CLOSE_TRY_AGAIN_LATER = 1013
+CLOSE_UNAUTHORIZED = 4401
+
+
+class ConnectionClosed(Exception):
+    """Kết nối đã đóng hoặc client không đọc kịp (hàng đợi gửi đầy quá lâu)"""
+
+
+def encode_message(message: dict) -> str:
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+class ChatConnection:
+    """Một WebSocket đã xác thực"""
+
+    __slots__ = ("websocket", "user", "queue", "inflight", "sessions", "last_seen", "closed", "_writer", "hub")
+
+    def __init__(self, websocket: WebSocket, user: TokenData, hub: "WebSocketHub"):
+        self.websocket = websocket
+        self.user = user
+        self.hub = hub
+        self.queue: asyncio.Queue = asyncio.Queue(hub.send_queue_size)
+        self.inflight: Dict[str, asyncio.Task] = {}
+        self.sessions: Set[str] = set()  # session đã kiểm tra quyền sở hữu trên kết nối này
+        self.last_seen = time.monotonic()
+        self.closed = False
+        self._writer = asyncio.create_task(self._write())
+
+    async def _write(self):
+        try:
+            while True:
+                text = await self.queue.get()
+                try:
+                    await self.websocket.send_text(text)
+                finally:
+                    self.queue.task_done()
+                self.hub.messages_sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Socket đã đứt: producer đang chờ sẽ nhận ConnectionClosed
+            self.closed = True
+
+    async def send(self, message: dict):
+        """Xếp message vào hàng đợi gửi; chờ tối đa `WS_SEND_TIMEOUT` nếu đầy"""
+        if self.closed:
+            raise ConnectionClosed()
+        text = encode_message(message)
+        try:
+            self.queue.put_nowait(text)
+            return
+        except asyncio.QueueFull:
+            pass
+        self.hub.backpressure_waits += 1
+        try:
+            await asyncio.wait_for(self.queue.put(text), self.hub.send_timeout)
+        except asyncio.TimeoutError:
+            self.hub.slow_consumers += 1
+            await self.close(CLOSE_TRY_AGAIN_LATER, "slow consumer")
+            raise ConnectionClosed()
+        if self.closed:
+            raise ConnectionClosed()
+
+    def try_send(self, message: dict) -> bool:
+        """Message điều khiển (ping...): bỏ qua nếu hàng đợi đang đầy"""
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(encode_message(message))
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def touch(self):
+        self.last_seen = time.monotonic()
+
+    async def flush(self, timeout: float):
+        """Chờ gửi hết hàng đợi (dùng khi drain)"""
+        if not self.closed:
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        if self.closed:
+            return
+        self.closed = True
+        self._writer.cancel()
+        current = asyncio.current_task()
+        for task in self.inflight.values():
+            if task is not current:
+                task.cancel()
+        try:
+            await self.websocket.close(code, reason)
+        except Exception:
+            pass  # client đã đi trước
+
+
+class WebSocketHub:
+    """Các kết nối WebSocket của worker hiện tại"""
+
+    def __init__(self, max_connections: int = WS_MAX_CONNECTIONS,
+                 send_queue_size: int = WS_SEND_QUEUE_SIZE, send_timeout: float = WS_SEND_TIMEOUT,
+                 heartbeat_interval: float = WS_HEARTBEAT_INTERVAL, idle_timeout: float = WS_IDLE_TIMEOUT):
+        self.max_connections = max_connections
+        self.send_queue_size = send_queue_size
+        self.send_timeout = send_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.connections: Set[ChatConnection] = set()
+        self.closing = False
+        self.accepted = 0
+        self.rejected = 0
+        self.idle_closed = 0
+        self.slow_consumers = 0
+        self.backpressure_waits = 0
+        self.messages_sent = 0
+        self.requests = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def can_accept(self) -> bool:
+        if self.closing or len(self.connections) >= self.max_connections:
+            self.rejected += 1
+            return False
+        return True
+
+    def open(self, websocket: WebSocket, user: TokenData) -> ChatConnection:
+        connection = ChatConnection(websocket, user, self)
+        self.connections.add(connection)
+        self.accepted += 1
+        return connection
+
+    async def release(self, connection: ChatConnection):
+        """Client ngắt kết nối: huỷ các request đang chạy (không lưu câu trả lời dở)"""
+        self.connections.discard(connection)
+        await connection.close()
+        if connection.inflight:
+            await asyncio.gather(*connection.inflight.values(), return_exceptions=True)
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            deadline = time.monotonic() - self.idle_timeout
+            for connection in list(self.connections):
+                if connection.last_seen < deadline and not connection.inflight:
+                    self.idle_closed += 1
+                    await connection.close(CLOSE_GOING_AWAY, "idle timeout")
+                else:
+                    connection.try_send({"type": "ping"})
+
+    async def start(self):
+        self.closing = False
+        self._task = asyncio.create_task(self._heartbeat())
+
+    async def drain(self, timeout: float = WS_DRAIN_TIMEOUT):
+        """Shutdown: chờ request đang chạy xong, gửi hết hàng đợi, đóng 1001"""
+        self.closing = True
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        connections = list(self.connections)
+        for connection in connections:
+            connection.try_send({"type": "shutdown"})
+        deadline = time.monotonic() + timeout
+        inflight = [task for connection in connections for task in connection.inflight.values()]
+        if inflight:
+            await asyncio.wait(inflight, timeout=timeout)
+        for connection in connections:
+            await connection.flush(max(0.0, deadline - time.monotonic()))
+            await connection.close(CLOSE_GOING_AWAY, "server shutdown")
+
+    def __len__(self) -> int:
+        return len(self.connections)
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self.connections),
+            "inflight": sum(len(connection.inflight) for connection in self.connections),
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "requests": self.requests,
+            "messages_sent": self.messages_sent,
+            "backpressure_waits": self.backpressure_waits,
+            "slow_consumers": self.slow_consumers,
+            "idle_closed": self.idle_closed,
+        }
+
+
+# Global WebSocket hub
+websocket_hub = WebSocketHub()
+
+def get_websocket_hub() -> WebSocketHub:
+    """Dependency function to get WebSocket hub"""
+    return websocket_hub
+
+Gauge("websocket_connections", "Số WebSocket đang mở", lambda: len(websocket_hub))
@@ -0,0 +1,173 @@
+"""
+Write-behind cho các cập nhật không quan trọng (last_login, last_used...).
+
+Request không chờ ghi DB: `enqueue(table, row_id, changes)` gộp thay đổi theo
+từng dòng trong bộ nhớ (ghi sau đè ghi trước), rồi flush theo lô — mỗi bảng
+một lần gọi RPC `apply_deferred_updates` — theo chu kỳ hoặc khi số dòng chờ
+vượt ngưỡng. Khi shutdown, lifespan gọi `stop()` để ghi nốt phần còn lại.
+Mất điện giữa hai lần flush thì mất tối đa một chu kỳ cập nhật — chỉ dùng
+cho dữ liệu chấp nhận được điều đó.
+"""
+import asyncio
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from app.models.metrics import Gauge, Histogram
+from app.models.repository import RepositoryError, SupabaseRepository, get_repository
+
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "5"))
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "500"))
+
+# Bảng và cột được phép cập nhật qua RPC (khớp với supabase/migrations/*_apply_deferred_updates.sql)
+DEFERRED_UPDATE_COLUMNS = {"users": ("last_login",), "api_keys": ("last_used",)}
+DEFERRED_UPDATE_TABLES = tuple(DEFERRED_UPDATE_COLUMNS)
+
+WRITE_BEHIND_FLUSH_SECONDS = Histogram("write_behind_flush_duration_seconds", "Thời gian một lần flush write-behind")
+
+
+class WriteBehindQueue:
+    def __init__(self, repo: Optional[SupabaseRepository] = None,
+                 flush_interval: float = WRITE_BEHIND_FLUSH_INTERVAL,
+                 max_pending: int = WRITE_BEHIND_MAX_PENDING):
+        self._repo = repo
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pending: Dict[Tuple[str, str], dict] = {}
+        self.enqueued = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.errors = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._flush_lock = asyncio.Lock()
+
+    @property
+    def repo(self) -> SupabaseRepository:
+        return self._repo or get_repository()
+
+    def enqueue(self, table: str, row_id: str, changes: dict):
+        """Ghi nhận thay đổi, trả về ngay (không chờ DB)"""
+        if table not in DEFERRED_UPDATE_TABLES:
+            raise ValueError(f"Bảng {table} không hỗ trợ write-behind")
+        columns = set(changes) - set(DEFERRED_UPDATE_COLUMNS[table])
+        if columns:
+            raise ValueError(f"Cột {', '.join(sorted(columns))} của bảng {table} không hỗ trợ write-behind")
+        self.enqueued += 1
+        key = (table, row_id)
+        if key in self.pending:
+            self.coalesced += 1
+            self.pending[key].update(changes)
+        else:
+            self.pending[key] = dict(changes)
+        self.max_depth = max(self.max_depth, len(self.pending))
+        if len(self.pending) >= self.max_pending and self._wake is not None:
+            self._wake.set()
+
+    def _requeue(self, batch: Dict[Tuple[str, str], dict]):
+        """Trả lô lỗi về hàng đợi; thay đổi mới hơn (enqueue trong lúc flush) được giữ"""
+        for key, changes in batch.items():
+            self.pending[key] = {**changes, **self.pending.get(key, {})}
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self.pending:
+                return
+            batch, self.pending = self.pending, {}
+            by_table: Dict[str, list] = {}
+            for (table, row_id), changes in batch.items():
+                by_table.setdefault(table, []).append({**changes, "id": row_id})
+
+            started = time.perf_counter()
+            for table, rows in list(by_table.items()):
+                try:
+                    await self.repo.apply_deferred_updates(table, rows)
+                except asyncio.CancelledError:
+                    # Bị huỷ giữa chừng: trả phần chưa ghi về hàng đợi thay vì làm mất
+                    self._requeue({(name, row["id"]): batch[(name, row["id"])]
+                                   for name, unflushed in by_table.items() for row in unflushed})
+                    raise
+                except RepositoryError as e:
+                    self.errors += 1
+                    if e.status_code < 500:
+                        # Lỗi dữ liệu (cột sai...): thử lại cũng không qua
+                        self.dropped += len(rows)
+                        print(f"Bỏ {len(rows)} cập nhật write-behind của bảng {table}: {e}")
+                        continue
+                    self._requeue({(table, row["id"]): batch[(table, row["id"])] for row in rows})
+                except Exception as e:
+                    self.errors += 1
+                    self._requeue({(table, row["id"]): batch[(table, row["id"])] for row in rows})
+                    print(f"Không ghi được write-behind của bảng {table}: {e}")
+                else:
+                    self.flushed_rows += len(rows)
+                finally:
+                    del by_table[table]
+
+            seconds = time.perf_counter() - started
+            WRITE_BEHIND_FLUSH_SECONDS.observe(seconds)
+            elapsed = seconds * 1000
+            self.flushes += 1
+            self.last_flush_ms = elapsed
+            self.max_flush_ms = max(self.max_flush_ms, elapsed)
+            self.total_flush_ms += elapsed
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if not self._stopping:
+                await self.flush()
+
+    async def start(self):
+        self._stopping = False
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Dừng flush định kỳ và ghi nốt các thay đổi đang chờ"""
+        if self._task is not None:
+            # Không cancel: chờ lần flush đang chạy (nếu có) xong rồi vòng lặp tự thoát
+            self._stopping = True
+            self._wake.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+    def stats(self) -> dict:
+        return {
+            "depth": len(self.pending),
+            "max_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "coalesced": self.coalesced,
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+            "errors": self.errors,
+            "dropped": self.dropped,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+            "avg_flush_ms": round(self.total_flush_ms / self.flushes, 2) if self.flushes else 0.0,
+        }
+
+
+# Global write-behind queue
+write_behind = WriteBehindQueue()
+
+def get_write_behind_queue() -> WriteBehindQueue:
+    """Dependency function to get write-behind queue"""
+    return write_behind
+
+Gauge("write_behind_queue_depth", "Số dòng đang chờ ghi write-behind", lambda: len(write_behind))
@@ -1,21 +1,28 @@
 from fastapi import APIRouter, HTTPException, Depends, status
 from fastapi.security import HTTPAuthorizationCredentials
-from supabase import Client
 from datetime import timedelta, datetime
-from typing import Optional
-import traceback
+from typing import List, Optional
+import logging
 
 from app.models.security import (
     UserLogin, UserRegister, Token, SecurityUtils, 
-    get_current_user, get_current_active_user, TokenData
+    get_current_user, get_current_active_user, TokenData,
+    APIKeyCreate, APIKeyModel, security
 )
 from app.schemas.chat import User
-from app.config.database import get_supabase
+from app.models.repository import SupabaseRepository, get_repository
+from app.models.write_behind import WriteBehindQueue, get_write_behind_queue
+from app.models.revocation import RevocationList, get_revocation_list
+from app.models.rate_limit import clamp_rate_limit
+from app.models.api_keys import (
+    API_KEY_DISPLAY_CHARS, API_KEY_PREFIX, APIKeyStore, generate_api_key, get_api_key_store, hash_api_key, mask_api_key
+)
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
+logger = logging.getLogger(__name__)
 
 @router.post("/register", response_model=dict)
-async def register(user_data: UserRegister, db: Client = Depends(get_supabase)):
+async def register(user_data: UserRegister, repo: SupabaseRepository = Depends(get_repository)):
     """
     Đăng ký tài khoản mới
     - Kiểm tra email đã tồn tại chưa
@@ -24,32 +31,31 @@ async def register(user_data: UserRegister, db: Client = Depends(get_supabase)):
     """
     try:
         # Kiểm tra email đã tồn tại
-        existing_user = db.table("users").select("email").eq("email", user_data.email).execute()
-        print(existing_user.data)
-        if existing_user.data:
+        existing_user = await repo.get_user_by_email(user_data.email, columns="email")
+        if existing_user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Email đã được sử dụng"
             )
         
         # Hash password
-        hashed_password = SecurityUtils.hash_password(user_data.password)
+        hashed_password = await SecurityUtils.hash_password_async(user_data.password)
         
         # Tạo user mới
-        result = db.table("users").insert({
+        new_user = await repo.create_user({
             "email": user_data.email,
             "password_hash": hashed_password,
             "full_name": user_data.full_name,
             "is_active": True
-        }).execute()
+        })
         
-        if not result.data:
+        if not new_user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Không thể tạo tài khoản"
             )
         
-        return {"message": "Đăng ký thành công", "user_id": result.data[0]["id"]}
+        return {"message": "Đăng ký thành công", "user_id": new_user["id"]}
         
     except HTTPException:
         raise
@@ -60,7 +66,11 @@ async def register(user_data: UserRegister, db: Client = Depends(get_supabase)):
         )
 
 @router.post("/login", response_model=Token)
-async def login(user_credentials: UserLogin, db: Client = Depends(get_supabase)):
+async def login(
+    user_credentials: UserLogin,
+    repo: SupabaseRepository = Depends(get_repository),
+    writes: WriteBehindQueue = Depends(get_write_behind_queue)
+):
     """
     Đăng nhập và tạo JWT token
     - Kiểm tra email và password
@@ -68,18 +78,16 @@ async def login(user_credentials: UserLogin, db: Client = Depends(get_supabase))
     """
     try:
         # Lấy user từ database
-        result = db.table("users").select("*").eq("email", user_credentials.email).execute()
+        user = await repo.get_user_by_email(user_credentials.email)
         
-        if not result.data:
+        if not user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Email hoặc mật khẩu không đúng"
             )
         
-        user = result.data[0]
-        
         # Kiểm tra password
-        if not SecurityUtils.verify_password(user_credentials.password, user["password_hash"]):
+        if not await SecurityUtils.verify_password_async(user_credentials.password, user["password_hash"]):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Email hoặc mật khẩu không đúng"
@@ -99,8 +107,8 @@ async def login(user_credentials: UserLogin, db: Client = Depends(get_supabase))
             expires_delta=access_token_expires
         )
         
-        # Cập nhật last_login
-        db.table("users").update({"last_login": datetime.utcnow().isoformat()}).eq("id", user["id"]).execute()
+        # Cập nhật last_login (write-behind, không chờ DB)
+        writes.enqueue("users", user["id"], {"last_login": datetime.utcnow().isoformat()})
         
         return Token(
             access_token=access_token,
@@ -115,8 +123,7 @@ async def login(user_credentials: UserLogin, db: Client = Depends(get_supabase))
         #     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         #     detail=f"Lỗi đăng nhập: {str(e)}"
         # )
-        print("🚨 Lỗi đăng nhập - Stack trace:")
-        traceback.print_exc()
+        logger.exception("Lỗi đăng nhập")
         raise HTTPException(
             status_code=500,
             detail=f"Lỗi nội bộ: {str(e)}"
@@ -125,21 +132,20 @@ async def login(user_credentials: UserLogin, db: Client = Depends(get_supabase))
 @router.get("/me", response_model=User)
 async def get_current_user_info(
     current_user: TokenData = Depends(get_current_active_user),
-    db: Client = Depends(get_supabase)
+    repo: SupabaseRepository = Depends(get_repository)
 ):
     """
     Lấy thông tin user hiện tại từ token
     """
     try:
-        result = db.table("users").select("*").eq("id", current_user.user_id).execute()
+        user_data = await repo.get_user(current_user.user_id)
         
-        if not result.data:
+        if not user_data:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Không tìm thấy thông tin user"
             )
         
-        user_data = result.data[0]
         return User(**user_data)
         
     except HTTPException:
@@ -175,9 +181,92 @@ async def refresh_token(current_user: TokenData = Depends(get_current_user)):
         )
 
 @router.post("/logout")
-async def logout(current_user: TokenData = Depends(get_current_active_user)):
+async def logout(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    current_user: TokenData = Depends(get_current_active_user),
+    revocations: RevocationList = Depends(get_revocation_list)
+):
+    """
+    Đăng xuất: thu hồi token hiện tại (theo jti) cho tới khi token hết hạn
+    và xoá token khỏi cache JWT đã verify của worker này
+    """
+    if current_user.jti and current_user.exp:
+        try:
+            await revocations.revoke(current_user.jti, current_user.exp, current_user.user_id)
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Lỗi đăng xuất: {str(e)}"
+            )
+    SecurityUtils.invalidate_cached_token(credentials.credentials)
+    return {"message": "Đăng xuất thành công"}
+
+def build_api_key(row: dict, key: Optional[str] = None) -> APIKeyModel:
+    return APIKeyModel(**{**row, "key": key or mask_api_key(row["key_prefix"])})
+
+@router.post("/api-keys", response_model=APIKeyModel, status_code=201)
+async def create_api_key(
+    key_data: APIKeyCreate,
+    current_user: TokenData = Depends(get_current_active_user),
+    repo: SupabaseRepository = Depends(get_repository)
+):
+    """
+    Tạo API key cho client máy (header X-API-Key)
+    - Key đầy đủ chỉ trả về một lần, DB chỉ lưu hash
+    - `rate_limit` chỉ được chặt hơn giới hạn mặc định (giá trị lớn hơn bị kẹp lại)
+    """
+    key = generate_api_key()
+    rate_limit = clamp_rate_limit(key_data.rate_limit)
+    try:
+        row = await repo.create_api_key({
+            "user_id": current_user.user_id,
+            "key_hash": hash_api_key(key),
+            "key_prefix": key[:len(API_KEY_PREFIX) + API_KEY_DISPLAY_CHARS],
+            "name": key_data.name,
+            "rate_limit": rate_limit.model_dump() if rate_limit else None,
+        })
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Lỗi tạo API key: {str(e)}"
+        )
+    if not row:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Không thể tạo API key")
+    return build_api_key(row, key)
+
+@router.get("/api-keys", response_model=List[APIKeyModel])
+async def list_api_keys(
+    current_user: TokenData = Depends(get_current_active_user),
+    repo: SupabaseRepository = Depends(get_repository)
+):
+    """Danh sách API key của user (chỉ hiện phần đầu của key)"""
+    try:
+        return [build_api_key(row) for row in await repo.list_api_keys(current_user.user_id)]
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Lỗi lấy danh sách API key: {str(e)}"
+        )
+
+@router.delete("/api-keys/{key_id}")
+async def revoke_api_key(
+    key_id: str,
+    current_user: TokenData = Depends(get_current_active_user),
+    repo: SupabaseRepository = Depends(get_repository),
+    key_store: APIKeyStore = Depends(get_api_key_store)
+):
     """
-    Đăng xuất (trong thực tế, JWT token sẽ hết hạn tự động)
-    Có thể implement blacklist token nếu cần
+    Thu hồi API key
+    - Worker hiện tại bỏ key khỏi cache ngay, worker khác sau tối đa API_KEY_CACHE_TTL giây
     """
-    return {"message": "Đăng xuất thành công"}
\ No newline at end of file
+    try:
+        row = await repo.update_api_key(key_id, current_user.user_id, {"is_active": False})
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Lỗi thu hồi API key: {str(e)}"
+        )
+    if not row:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Không tìm thấy API key")
+    key_store.invalidate(row["key_hash"])
+    return {"message": "Đã thu hồi API key"}
@@ -1,44 +1,103 @@
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import JSONResponse
-from dateutil.parser import isoparse
-from supabase import Client
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import AsyncIterator, List, Optional, Tuple
 from datetime import datetime
-import traceback
+from contextlib import aclosing
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+import asyncio
+import json
+import logging
+import time
 from app.schemas.chat import (
     UserCreate, User, UserUpdate,
     SessionCreate, Session, SessionUpdate,
     QuestionCreate, Question,
     AnswerCreate, Answer,
-    ChatMessage, ChatResponse,
-    ConversationHistory, ConversationItem
+    ChatMessage, ChatResponse, ChatSource,
+    ConversationHistory, ConversationItem,
+    ChatBatchRequest, ChatBatchItem, ChatBatchResponse,
+    AnswerBatchRequest, AnswerBatchItem, AnswerBatchResponse,
+    SessionBatchDelete, SessionDeleteItem, SessionBatchDeleteResponse
+)
+from app.models.security import (
+    get_current_user_or_api_key, authenticate_credentials, credentials_still_valid, TokenData
+)
+from app.models.repository import SupabaseRepository, RepositoryError, get_repository
+from app.models.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.models.sse import SSE_HEADERS, sse_event
+from app.models.serialization import FastSerializer, cursor_headers, list_serializer
+from app.models.conditional import RenderedResponseCache, get_response_cache
+from app.models.answer_cache import CACHE_GENERATED_BY, AnswerCache, get_answer_cache
+from app.models.generation import GenerationScheduler, GenerationOverloaded, get_generation_scheduler
+from app.models.retrieval import DocumentRetriever, get_retriever
+from app.models.vector_store import ScoredPoint
+from app.models.websocket import (
+    WS_AUTH_TIMEOUT, WS_MAX_INFLIGHT, CLOSE_POLICY, CLOSE_TRY_AGAIN_LATER, CLOSE_UNAUTHORIZED,
+    ChatConnection, ConnectionClosed, WebSocketHub, get_websocket_hub,
 )
-from app.models.security import get_current_active_user, TokenData
-from app.config.database import get_supabase
 
 
 router = APIRouter(prefix="/chat", tags=["chat"])
+logger = logging.getLogger(__name__)
+
+def is_paginated(limit: Optional[int], before: Optional[str], after: Optional[str]) -> bool:
+    """Không truyền limit/before/after -> trả về toàn bộ như trước"""
+    return limit is not None or before is not None or after is not None
+
+def build_sources(points: List[ScoredPoint]) -> List[ChatSource]:
+    return [
+        ChatSource(filename=point.payload["filename"], chunk_index=point.payload["chunk_index"], score=point.score)
+        for point in points
+    ]
 
-def generate_ai_response(question: str) -> str:
+async def _cached_tokens(answer: str) -> AsyncIterator[str]:
+    yield answer
+
+async def _generated_tokens(
+    answer_cache: AnswerCache, scheduler: GenerationScheduler, question: str, user_id: str, context: List[str]
+) -> AsyncIterator[str]:
+    started = time.perf_counter()
+    tokens = []
+    async with aclosing(scheduler.stream(question, user_id, context)) as stream:
+        async for token in stream:
+            tokens.append(token)
+            yield token
+    # Chỉ cache câu trả lời đã stream hết (client ngắt / huỷ giữa chừng thì không)
+    answer_cache.put(user_id, question, context, "".join(tokens), time.perf_counter() - started)
+
+def answer_stream(
+    answer_cache: AnswerCache, scheduler: GenerationScheduler, question: str, user_id: str, context: List[str]
+) -> Tuple[str, AsyncIterator[str]]:
     """
-    Mock AI response generator.
-    Thay thế bằng logic AI thực tế
+    (generated_by, token stream) cho chat stream / WebSocket: cache hit -> cả câu trả lời
+    trong một token, miss -> stream từ scheduler rồi lưu cache. Dùng trong `aclosing(...)`
     """
-    return f"Đây là câu trả lời mẫu từ chatbot cho câu hỏi: {question}"
+    cached = answer_cache.get(user_id, question, context)
+    if cached is not None:
+        return CACHE_GENERATED_BY, _cached_tokens(cached)
+    return scheduler.backend.name, _generated_tokens(answer_cache, scheduler, question, user_id, context)
+
+# Serializer compile sẵn cho các endpoint trả list (dòng repository -> bytes JSON)
+SESSIONS_JSON = list_serializer(Session)
+QUESTIONS_JSON = list_serializer(Question)
+ANSWERS_JSON = list_serializer(Answer)
+CONVERSATION_JSON = FastSerializer(ConversationHistory)
+CONVERSATION_ITEMS = list_serializer(ConversationItem)
 
 
 
 @router.get("/users/me", response_model=User)
 async def get_my_profile(
-    current_user: TokenData = Depends(get_current_active_user),
-    db: Client = Depends(get_supabase)
+    current_user: TokenData = Depends(get_current_user_or_api_key),
+    repo: SupabaseRepository = Depends(get_repository)
 ):
     """Lấy thông tin profile của user hiện tại"""
     try:
-        result = db.table("users").select("*").eq("id", current_user.user_id).execute()
+        user = await repo.get_user(current_user.user_id)
         
-        if result.data:
-            return User(**result.data[0])
+        if user:
+            return User(**user)
         else:
             raise HTTPException(status_code=404, detail="Không tìm thấy user")
     except Exception as e:
@@ -47,17 +106,17 @@ async def get_my_profile(
 @router.put("/users/me", response_model=User)
 async def update_my_profile(
     user_update: UserUpdate,
-    current_user: TokenData = Depends(get_current_active_user),
-    db: Client = Depends(get_supabase)
+    current_user: TokenData = Depends(get_current_user_or_api_key),
+    repo: SupabaseRepository = Depends(get_repository)
 ):
     """Cập nhật thông tin profile của user hiện tại"""
     try:
         update_data = {k: v for k, v in user_update.dict().items() if v is not None}
         
-        result = db.table("users").update(update_data).eq("id", current_user.user_id).execute()
+        user = await repo.update_user(current_user.user_id, update_data)
         
-        if result.data:
-            return User(**result.data[0])
+        if user:
+            return User(**user)
         else:
             raise HTTPException(status_code=400, detail="Không thể cập nhật user")
     except Exception as e:
@@ -67,8 +126,8 @@ async def update_my_profile(
 @router.post("/sessions/", response_model=Session)
 async def create_session(
     session: SessionCreate,
-    current_user: TokenData = Depends(get_current_active_user),
-    db: Client = Depends(get_supabase)
+    current_user: TokenData = Depends(get_current_user_or_api_key),
+    repo: SupabaseRepository = Depends(get_repository)
 ):
     """Tạo phiên chat mới"""
     try:
@@ -76,12 +135,12 @@ async def create_session(
         if session.user_id != current_user.user_id:
             raise HTTPException(status_code=403, detail="Không có quyền tạo session cho user khác")
         
-        result = db.table("sessions").insert({
+        new_session = await repo.create_session({
             "user_id": session.user_id,
             "session_title": session.session_title or f"Chat Session {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-        }).execute()        
-        if result.data:
-            return Session(**result.data[0])
+        })
+        if new_session:
+            return Session(**new_session)
         else:
             raise HTTPException(status_code=400, detail="Không thể tạo session")
     except HTTPException:
@@ -91,31 +150,48 @@ async def create_session(
 
 @router.get("/sessions/", response_model=List[Session])
 async def get_my_sessions(
-    current_user: TokenData = Depends(get_current_active_user),
-    db: Client = Depends(get_supabase)
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    current_user: TokenData = Depends(get_current_user_or_api_key),
+    repo: SupabaseRepository = Depends(get_repository),
+    cache: RenderedResponseCache = Depends(get_response_cache)
 ):
-    """Lấy tất cả sessions của user hiện tại"""
+    """
+    Lấy sessions của user hiện tại (mới nhất trước)
+    - Có `limit`/`before`/`after`: phân trang keyset, cursor trang kế tiếp ở header `X-Next-Cursor`
+    - Có `ETag`; gửi `If-None-Match` để nhận 304 khi danh sách chưa đổi
+    """
+    async def render():
+        next_cursor = None
+        if is_paginated(limit, before, after):
+            sessions, next_cursor = await repo.list_sessions_page(
+                current_user.user_id, limit or DEFAULT_PAGE_SIZE, before, after
+            )
+        else:
+            sessions = await repo.list_sessions(current_user.user_id)
+        return SESSIONS_JSON.to_json(sessions), cursor_headers(next_cursor)
+
     try:
-        result = db.table("sessions").select("*").eq("user_id", current_user.user_id).order("started_at", desc=True).execute()
-        return [Session(**session) for session in result.data]
+        version = await repo.get_sessions_version(current_user.user_id)
+        return await cache.respond(request, "sessions", current_user.user_id, version, render)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Lỗi lấy sessions: {str(e)}")
 
 @router.get("/sessions/{session_id}", response_model=Session)
 async def get_session(
     session_id: str,
-    current_user: TokenData = Depends(get_current_active_user),
-    db: Client = Depends(get_supabase)
+    current_user: TokenData = Depends(get_current_user_or_api_key),
+    repo: SupabaseRepository = Depends(get_repository)
 ):
     """Lấy thông tin session theo ID"""
     try:
-        result = db.table("sessions").select("*").eq("id", session_id).execute()
+        session = await repo.get_session(session_id, user_id=current_user.user_id)
         
-        if not result.data:
+        if not session:
             raise HTTPException(status_code=404, detail="Không tìm thấy session")
         
-        session = result.data[0]
-        
         # Kiểm tra quyền truy cập
         if session["user_id"] != current_user.user_id:
             raise HTTPException(status_code=403, detail="Không có quyền truy cập session này")
@@ -130,25 +206,25 @@ async def get_session(
 async def update_session(
     session_id: str,
     session_update: SessionUpdate,
-    current_user: TokenData = Depends(get_current_active_user),
-    db: Client = Depends(get_supabase)
+    current_user: TokenData = Depends(get_current_user_or_api_key),
+    repo: SupabaseRepository = Depends(get_repository)
 ):
     """Cập nhật thông tin session"""
     try:
         # Kiểm tra session tồn tại và thuộc về user hiện tại
-        session_result = db.table("sessions").select("*").eq("id", session_id).execute()
-        if not session_result.data:
+        owner_id = await repo.get_session_owner(session_id)
+        if not owner_id:
             raise HTTPException(status_code=404, detail="Không tìm thấy session")
         
-        if session_result.data[0]["user_id"] != current_user.user_id:
+        if owner_id != current_user.user_id:
             raise HTTPException(status_code=403, detail="Không có quyền cập nhật session này")
         
         update_data = {k: v for k, v in session_update.dict().items() if v is not None}
         
-        result = db.table("sessions").update(update_data).eq("id", session_id).execute()
+        updated_session = await repo.update_session(session_id, update_data)
         
-        if result.data:
-            return Session(**result.data[0])
+        if updated_session:
+            return Session(**updated_session)
         else:
             raise HTTPException(status_code=400, detail="Không thể cập nhật session")
     except HTTPException:
@@ -159,23 +235,23 @@ async def update_session(
 @router.delete("/sessions/{session_id}", status_code=204)
 async def delete_session(
     session_id: str,
-    current_user: TokenData = Depends(get_current_active_user),
-    db: Client = Depends(get_supabase)
+    current_user: TokenData = Depends(get_current_user_or_api_key),
+    repo: SupabaseRepository = Depends(get_repository)
 ):
     """Xoá session nếu thuộc về user hiện tại"""
     try:
         # Kiểm tra session tồn tại và thuộc về user hiện tại
-        session_result = db.table("sessions").select("*").eq("id", session_id).execute()
-        if not session_result.data:
+        owner_id = await repo.get_session_owner(session_id)
+        if not owner_id:
             raise HTTPException(status_code=404, detail="Không tìm thấy session")
 
-        if session_result.data[0]["user_id"] != current_user.user_id:
+        if owner_id != current_user.user_id:
             raise HTTPException(status_code=403, detail="Không có quyền xoá session này")
 
         # Xoá session
-        delete_result = db.table("sessions").delete().eq("id", session_id).execute()
+        deleted = await repo.delete_session(session_id)
 
-        if delete_result.data:
+        if deleted:
             return  JSONResponse(content={"success": True}, status_code=200)
         else:
             raise HTTPException(status_code=400, detail="Không thể xoá session")
@@ -185,25 +261,76 @@ async def delete_session(
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Lỗi xoá session: {str(e)}")
 
+@router.post("/sessions/batch-delete", response_model=SessionBatchDeleteResponse)
+async def delete_sessions_batch(
+    request: SessionBatchDelete,
+    current_user: TokenData = Depends(get_current_user_or_api_key),
+    repo: SupabaseRepository = Depends(get_repository)
+):
+    """
+    Xoá nhiều session trong một request
+    - Quyền sở hữu kiểm tra một lần cho cả lô (một query `in`), xoá bằng một lệnh DELETE
+    - Kết quả theo từng session: 200 đã xoá, 404 không tồn tại, 403 của user khác
+    """
+    try:
+        session_ids = list(dict.fromkeys(request.session_ids))
+        owners = await repo.get_session_owners(session_ids)
+        owned = [session_id for session_id in session_ids if owners.get(session_id) == current_user.user_id]
+        deleted = {session["id"] for session in await repo.delete_sessions(owned, current_user.user_id)} if owned else set()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Lỗi xoá session: {str(e)}")
+
+    results = []
+    for session_id in request.session_ids:
+        if session_id in deleted:
+            results.append(SessionDeleteItem(session_id=session_id, status=200))
+        elif session_id in owners and owners[session_id] != current_user.user_id:
+            results.append(SessionDeleteItem(session_id=session_id, status=403, detail="Không có quyền xoá session này"))
+        else:
+            results.append(SessionDeleteItem(session_id=session_id, status=404, detail="Không tìm thấy session"))
+    succeeded = sum(item.status == 200 for item in results)
+    return SessionBatchDeleteResponse(succeeded=succeeded, failed=len(results) - succeeded, results=results)
+
 # Question Endpoints
 @router.get("/sessions/{session_id}/questions", response_model=List[Question])
 async def get_session_questions(
     session_id: str,
-    current_user: TokenData = Depends(get_current_active_user),
-    db: Client = Depends(get_supabase)
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    current_user: TokenData = Depends(get_current_user_or_api_key),
+    repo: SupabaseRepository = Depends(get_repository),
+    cache: RenderedResponseCache = Depends(get_response_cache)
 ):
-    """Lấy tất cả câu hỏi trong một session"""
+    """
+    Lấy câu hỏi trong một session (cũ nhất trước)
+    - Có `limit`/`before`/`after`: phân trang keyset, cursor trang kế tiếp ở header `X-Next-Cursor`
+    - Có `ETag` theo version của session; `If-None-Match` khớp trả 304
+    """
+    async def render():
+        next_cursor = None
+        if is_paginated(limit, before, after):
+            questions, next_cursor = await repo.list_questions_page(
+                session_id, limit or DEFAULT_PAGE_SIZE, before, after, user_id=current_user.user_id
+            )
+        else:
+            questions = await repo.list_questions(session_id, user_id=current_user.user_id)
+        return QUESTIONS_JSON.to_json(questions), cursor_headers(next_cursor)
+
     try:
         # Kiểm tra quyền truy cập session
-        session_result = db.table("sessions").select("user_id").eq("id", session_id).execute()
-        if not session_result.data:
+        owner_id = await repo.get_session_owner(session_id)
+        if not owner_id:
             raise HTTPException(status_code=404, detail="Không tìm thấy session")
         
-        if session_result.data[0]["user_id"] != current_user.user_id:
+        if owner_id != current_user.user_id:
             raise HTTPException(status_code=403, detail="Không có quyền truy cập session này")
         
-        result = db.table("questions").select("*").eq("session_id", session_id).order("created_at", desc=False).execute()
-        return [Question(**question) for question in result.data]
+        version = await repo.get_session_version(session_id)
+        if version is None:
+            raise HTTPException(status_code=404, detail="Không tìm thấy session")
+        return await cache.respond(request, "questions", session_id, version, render)
     except HTTPException:
         raise
     except Exception as e:
@@ -213,150 +340,577 @@ async def get_session_questions(
 @router.get("/questions/{question_id}/answers", response_model=List[Answer])
 async def get_question_answers(
     question_id: str,
-    current_user: TokenData = Depends(get_current_active_user),
-    db: Client = Depends(get_supabase)
+    request: Request,
+    current_user: TokenData = Depends(get_current_user_or_api_key),
+    repo: SupabaseRepository = Depends(get_repository),
+    cache: RenderedResponseCache = Depends(get_response_cache)
 ):
-    """Lấy tất cả câu trả lời của một câu hỏi"""
+    """Lấy tất cả câu trả lời của một câu hỏi (có `ETag` theo version của session)"""
+    async def render():
+        return ANSWERS_JSON.to_json(await repo.list_answers(question_id, user_id=current_user.user_id)), None
+
     try:
         # Kiểm tra quyền truy cập question thông qua session
-        question_result = db.table("questions").select("session_id").eq("id", question_id).execute()
-        if not question_result.data:
+        session_id = await repo.get_question_session(question_id)
+        if not session_id:
             raise HTTPException(status_code=404, detail="Không tìm thấy question")
         
-        session_id = question_result.data[0]["session_id"]
-        session_result = db.table("sessions").select("user_id").eq("id", session_id).execute()
+        owner_id = await repo.get_session_owner(session_id)
         
-        if not session_result.data or session_result.data[0]["user_id"] != current_user.user_id:
+        if not owner_id or owner_id != current_user.user_id:
             raise HTTPException(status_code=403, detail="Không có quyền truy cập")
         
-        result = db.table("answers").select("*").eq("question_id", question_id).order("created_at", desc=False).execute()
-        return [Answer(**answer) for answer in result.data]
+        version = await repo.get_session_version(session_id)
+        if version is None:
+            raise HTTPException(status_code=404, detail="Không tìm thấy question")
+        return await cache.respond(request, "answers", question_id, version, render)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Lỗi lấy answers: {str(e)}")
 
+@router.post("/answers/batch", response_model=AnswerBatchResponse)
+async def get_answers_batch(
+    request: AnswerBatchRequest,
+    current_user: TokenData = Depends(get_current_user_or_api_key),
+    repo: SupabaseRepository = Depends(get_repository)
+):
+    """
+    Lấy answers của nhiều question trong một request
+    - question -> session -> owner resolve theo lô (cache trước, phần thiếu một query `in` mỗi bảng)
+    - Answers của mọi question hợp lệ lấy bằng một query `in`
+    - Kết quả theo từng question: 200 kèm answers, 404 không tồn tại, 403 của user khác
+    """
+    try:
+        question_ids = list(dict.fromkeys(request.question_ids))
+        question_sessions = await repo.get_question_sessions(question_ids)
+        owners = await repo.get_session_owners(list(set(question_sessions.values())))
+        allowed = [
+            question_id for question_id in question_ids
+            if owners.get(question_sessions.get(question_id)) == current_user.user_id
+        ]
+        grouped = {question_id: [] for question_id in allowed}
+        if allowed:
+            for answer in await repo.list_answers_for_questions(allowed, user_id=current_user.user_id):
+                grouped[answer["question_id"]].append(answer)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Lỗi lấy answers: {str(e)}")
+
+    results = []
+    for question_id in request.question_ids:
+        if question_id in grouped:
+            results.append(AnswerBatchItem(question_id=question_id, status=200, answers=grouped[question_id]))
+        elif question_sessions.get(question_id) in owners:
+            results.append(AnswerBatchItem(question_id=question_id, status=403, detail="Không có quyền truy cập"))
+        else:
+            results.append(AnswerBatchItem(question_id=question_id, status=404, detail="Không tìm thấy question"))
+    succeeded = sum(item.status == 200 for item in results)
+    return AnswerBatchResponse(succeeded=succeeded, failed=len(results) - succeeded, results=results)
+
 # Chat Endpoint - Main functionality
 @router.post("/", response_model=ChatResponse)
 async def chat(
     message: ChatMessage,
-    current_user: TokenData = Depends(get_current_active_user),
-    db: Client = Depends(get_supabase)
+    current_user: TokenData = Depends(get_current_user_or_api_key),
+    repo: SupabaseRepository = Depends(get_repository),
+    scheduler: GenerationScheduler = Depends(get_generation_scheduler),
+    retriever: DocumentRetriever = Depends(get_retriever),
+    answer_cache: AnswerCache = Depends(get_answer_cache)
 ):
     """
     - **Chức năng**:  ENDPOINT CHÍNH - Xử lý chat
     - Flow:
-        1. Kiểm tra session tồn tại
-        2. Tạo question mới
-        3. Gọi AI để tạo response
-        4. Lưu answer vào database
+        1. Kiểm tra session tồn tại và thuộc về user (ưu tiên cache) trước khi retrieval / gọi AI
+        2. Tìm các đoạn liên quan trong tài liệu user đã upload (retrieval)
+        3. Lấy câu trả lời từ cache (cùng câu hỏi đã chuẩn hoá + cùng tài liệu, `generated_by="cache"`),
+           không có thì gọi AI để tạo response (qua GenerationScheduler: giới hạn đồng thời + micro-batching)
+        4. Lưu question + answer trong một round trip (RPC `chat_turn`,
+           kiểm tra session tồn tại và thuộc về user trong cùng transaction)
         5. Trả về kết quả đầy đủ
     - Input: session_id + câu hỏi
-    - Output: question_id, answer_id, nội dung Q&A, timestamp
-    - Error handling: Rollback nếu có lỗi
+    - Output: question_id, answer_id, nội dung Q&A, timestamp, các đoạn tài liệu đã dùng (`sources`)
+    - Error handling: question và answer được ghi cùng nhau hoặc không ghi gì
     """
     try:
-        # Kiểm tra session tồn tại và thuộc về user hiện tại
-        session_result = db.table("sessions").select("*").eq("id", message.session_id).execute()
-        if not session_result.data:
+        # Session không tồn tại / của user khác -> từ chối ngay, không tốn retrieval và gọi AI
+        owner_id = await repo.get_session_owner(message.session_id)
+        if not owner_id:
             raise HTTPException(status_code=404, detail="Session không tồn tại")
-        
-        if session_result.data[0]["user_id"] != current_user.user_id:
+        if owner_id != current_user.user_id:
             raise HTTPException(status_code=403, detail="Không có quyền truy cập session này")
         
-        # Tạo question
-        question_result = db.table("questions").insert({
-            "session_id": message.session_id,
-            "content": message.question
-        }).execute()
-        
-        if not question_result.data:
-            raise HTTPException(status_code=400, detail="Không thể tạo question")
-        
-        question_data = question_result.data[0]
-        
         # kiểm tra đầu vào "message.question"
         #
         #
         #
 
         
-        # Generate AI response
-        ai_response = generate_ai_response(message.question)
-        
-        # Tạo answer
-        answer_result = db.table("answers").insert({
-            "question_id": question_data["id"],
-            "content": ai_response,
-            "generated_by": "chatbot"
-        }).execute()
-        
-        if not answer_result.data:
-            raise HTTPException(status_code=400, detail="Không thể tạo answer")
-        
-        answer_data = answer_result.data[0]
+        # Retrieval: các đoạn tài liệu liên quan
+        points = await run_in_threadpool(retriever.retrieve, current_user.user_id, message.question)
+        context = [point.payload["text"] for point in points]
+        
+        # Generate AI response (hoặc lấy từ cache)
+        ai_response = answer_cache.get(current_user.user_id, message.question, context)
+        generated_by = CACHE_GENERATED_BY
+        if ai_response is None:
+            started = time.perf_counter()
+            try:
+                ai_response = await scheduler.generate(message.question, current_user.user_id, context)
+            except GenerationOverloaded as e:
+                raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+            answer_cache.put(current_user.user_id, message.question, context, ai_response,
+                             time.perf_counter() - started)
+            generated_by = scheduler.backend.name
+        
+        # Lưu question + answer
+        try:
+            turn = await repo.create_chat_turn(
+                session_id=message.session_id,
+                user_id=current_user.user_id,
+                question=message.question,
+                answer=ai_response,
+                generated_by=generated_by,
+            )
+        except RepositoryError as e:
+            if e.status_code in (403, 404):
+                raise HTTPException(status_code=e.status_code, detail=str(e))
+            raise
         
         return ChatResponse(
-            question_id=question_data["id"],
-            answer_id=answer_data["id"],
+            question_id=turn["question_id"],
+            answer_id=turn["answer_id"],
             question=message.question,
             answer=ai_response,
-            created_at=datetime.fromisoformat(question_data["created_at"].replace('Z', '+00:00'))
+            created_at=datetime.fromisoformat(turn["created_at"].replace('Z', '+00:00')),
+            sources=build_sources(points)
         )
         
-    # except HTTPException:
-    #     raise
-    # except Exception as e:
-    #     raise HTTPException(status_code=500, detail=f"Lỗi chat: {str(e)}")
+    except HTTPException:
+        raise
     except Exception as e:
-        print("🔥 Lỗi chi tiết khi xử lý câu hỏi:", str(e))
-        traceback.print_exc()  # In stacktrace chi tiết
+        logger.exception("Lỗi khi xử lý câu hỏi của session %s", message.session_id)
         raise HTTPException(status_code=500, detail=f"Lỗi chat: {str(e)}")
 
+@router.post("/batch", response_model=ChatBatchResponse)
+async def chat_batch(
+    request: ChatBatchRequest,
+    current_user: TokenData = Depends(get_current_user_or_api_key),
+    repo: SupabaseRepository = Depends(get_repository),
+    scheduler: GenerationScheduler = Depends(get_generation_scheduler),
+    retriever: DocumentRetriever = Depends(get_retriever),
+    answer_cache: AnswerCache = Depends(get_answer_cache)
+):
+    """
+    Gửi nhiều câu hỏi vào một session trong một request
+    - Flow:
+        1. Kiểm tra quyền sở hữu session một lần cho cả lô (404/403 cho cả request)
+        2. Retrieval theo lô: embed mọi câu hỏi một lần, một lần search
+        3. Câu có trong cache dùng luôn; các câu còn lại chiếm một slot của user cho cả lô,
+           vào micro-batching cùng lúc
+        4. Lưu mọi lượt thành công trong một round trip (RPC `chat_turns`, insert theo lô)
+    - Output: kết quả theo thứ tự câu hỏi; câu nào sinh lỗi có `status` 503/500
+      và không được lưu, các câu khác vẫn lưu bình thường
+    - Hàng đợi không đủ chỗ cho cả lô -> 503 cho cả request
+    """
+    session_id = request.session_id
+    try:
+        owner_id = await repo.get_session_owner(session_id)
+        if not owner_id:
+            raise HTTPException(status_code=404, detail="Không tìm thấy session")
+        if owner_id != current_user.user_id:
+            raise HTTPException(status_code=403, detail="Không có quyền truy cập session này")
+
+        points_list = await run_in_threadpool(retriever.retrieve_many, current_user.user_id, request.questions)
+        contexts = [[point.payload["text"] for point in points] for points in points_list]
+
+        answers = [
+            answer_cache.get(current_user.user_id, question, context)
+            for question, context in zip(request.questions, contexts)
+        ]
+        cached = {index for index, answer in enumerate(answers) if answer is not None}
+        missing = [index for index in range(len(answers)) if index not in cached]
+        if missing:
+            started = time.perf_counter()
+            try:
+                generated_answers = await scheduler.generate_many(
+                    [request.questions[index] for index in missing], current_user.user_id,
+                    [contexts[index] for index in missing]
+                )
+            except GenerationOverloaded as e:
+                raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+            # Cả lô sinh cùng lúc: chia đều thời gian cho từng câu
+            per_answer_seconds = (time.perf_counter() - started) / len(missing)
+            for index, answer in zip(missing, generated_answers):
+                answers[index] = answer
+                if isinstance(answer, str):
+                    answer_cache.put(current_user.user_id, request.questions[index], contexts[index],
+                                     answer, per_answer_seconds)
+
+        generated = [index for index, answer in enumerate(answers) if isinstance(answer, str)]
+        turns = {}
+        if generated:
+            try:
+                saved = await repo.create_chat_turns(session_id, current_user.user_id, [
+                    {"question": request.questions[index], "answer": answers[index],
+                     "generated_by": CACHE_GENERATED_BY if index in cached else scheduler.backend.name}
+                    for index in generated
+                ])
+            except RepositoryError as e:
+                if e.status_code in (403, 404):
+                    raise HTTPException(status_code=e.status_code, detail=str(e))
+                raise
+            turns = dict(zip(generated, saved))
+
+        results = []
+        for index, (question, answer) in enumerate(zip(request.questions, answers)):
+            if index in turns:
+                turn = turns[index]
+                results.append(ChatBatchItem(index=index, status=200, result=ChatResponse(
+                    question_id=turn["question_id"],
+                    answer_id=turn["answer_id"],
+                    question=question,
+                    answer=answer,
+                    created_at=datetime.fromisoformat(turn["created_at"].replace('Z', '+00:00')),
+                    sources=build_sources(points_list[index])
+                )))
+            else:
+                status = 503 if isinstance(answer, GenerationOverloaded) else 500
+                results.append(ChatBatchItem(index=index, status=status, detail=str(answer) or type(answer).__name__))
+        return ChatBatchResponse(
+            session_id=session_id, succeeded=len(turns), failed=len(results) - len(turns), results=results
+        )
+
+    except HTTPException:
+        raise
+    except Exception:
+        logger.exception("Lỗi khi xử lý chat batch của session %s", session_id)
+        raise HTTPException(status_code=500, detail="Lỗi chat batch")
+
+@router.post("/stream")
+async def chat_stream(
+    message: ChatMessage,
+    request: Request,
+    current_user: TokenData = Depends(get_current_user_or_api_key),
+    repo: SupabaseRepository = Depends(get_repository),
+    scheduler: GenerationScheduler = Depends(get_generation_scheduler),
+    retriever: DocumentRetriever = Depends(get_retriever),
+    answer_cache: AnswerCache = Depends(get_answer_cache)
+):
+    """
+    - **Chức năng**: Chat dạng stream (Server-Sent Events)
+    - Events:
+        - `token`: {"delta": "..."} mỗi token của câu trả lời
+        - `done`: ChatResponse sau khi question + answer đã được lưu
+        - `error`: {"detail": "..."} nếu hệ thống quá tải hoặc lưu thất bại
+    - Client ngắt kết nối giữa chừng: dừng sinh câu trả lời, không lưu gì
+    - Dùng chung answer cache với `POST /chat/`: hit thì `token` đầu tiên là cả câu trả lời
+    """
+    owner_id = await repo.get_session_owner(message.session_id)
+    if not owner_id:
+        raise HTTPException(status_code=404, detail="Session không tồn tại")
+    
+    if owner_id != current_user.user_id:
+        raise HTTPException(status_code=403, detail="Không có quyền truy cập session này")
+    
+    points = await run_in_threadpool(retriever.retrieve, current_user.user_id, message.question)
+    context = [point.payload["text"] for point in points]
+    
+    async def generate():
+        tokens = []
+        generated_by, answer_tokens = answer_stream(
+            answer_cache, scheduler, message.question, current_user.user_id, context
+        )
+        try:
+            async with aclosing(answer_tokens) as stream:
+                async for token in stream:
+                    if await request.is_disconnected():
+                        return
+                    tokens.append(token)
+                    yield sse_event("token", {"delta": token})
+        except GenerationOverloaded as e:
+            yield sse_event("error", {"detail": str(e)})
+            return
+        
+        ai_response = "".join(tokens)
+        try:
+            turn = await repo.create_chat_turn(
+                session_id=message.session_id,
+                user_id=current_user.user_id,
+                question=message.question,
+                answer=ai_response,
+                generated_by=generated_by,
+            )
+        except Exception as e:
+            logger.exception("Lỗi khi lưu lượt chat stream của session %s", message.session_id)
+            yield sse_event("error", {"detail": f"Lỗi chat: {str(e)}"})
+            return
+        
+        response = ChatResponse(
+            question_id=turn["question_id"],
+            answer_id=turn["answer_id"],
+            question=message.question,
+            answer=ai_response,
+            created_at=datetime.fromisoformat(turn["created_at"].replace('Z', '+00:00')),
+            sources=build_sources(points)
+        )
+        yield sse_event("done", response.model_dump(mode="json"))
+    
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
 # Get full conversation history
 @router.get("/sessions/{session_id}/conversation", response_model=ConversationHistory)
 async def get_conversation(
     session_id: str,
-    current_user: TokenData = Depends(get_current_active_user),
-    db: Client = Depends(get_supabase)
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    current_user: TokenData = Depends(get_current_user_or_api_key),
+    repo: SupabaseRepository = Depends(get_repository),
+    cache: RenderedResponseCache = Depends(get_response_cache)
 ):
-    """Lấy toàn bộ lịch sử chat"""
+    """
+    Lấy lịch sử chat
+    - Không truyền `limit`/`before`/`after`: toàn bộ lịch sử
+    - Có: phân trang keyset theo (created_at, id), cursor trang kế tiếp trong `next_cursor`
+    - Có `ETag` theo version của session; `If-None-Match` khớp trả 304 (không gọi DB khi version đã cache)
+    """
+    async def render():
+        # Lấy questions với answers
+        next_cursor = None
+        if is_paginated(limit, before, after):
+            questions, next_cursor = await repo.list_conversation_page(
+                session_id, limit or DEFAULT_PAGE_SIZE, before, after, user_id=current_user.user_id
+            )
+        else:
+            questions = await repo.list_conversation(session_id, user_id=current_user.user_id)
+        # questions validate thẳng thành ConversationItem (alias id/content/created_at)
+        body = CONVERSATION_JSON.to_json(
+            {"session_id": session_id, "conversation": questions, "next_cursor": next_cursor}
+        )
+        return body, None
+
     try:
         # Kiểm tra quyền truy cập session
-        session_result = db.table("sessions").select("user_id").eq("id", session_id).execute()
-        if not session_result.data:
+        owner_id = await repo.get_session_owner(session_id)
+        if not owner_id:
             raise HTTPException(status_code=404, detail="Không tìm thấy session")
         
-        if session_result.data[0]["user_id"] != current_user.user_id:
+        if owner_id != current_user.user_id:
             raise HTTPException(status_code=403, detail="Không có quyền truy cập session này")
         
-        # Lấy questions với answers
-        result = db.table("questions").select("""
-            id,
-            content,
-            created_at,
-            answers (
-                id,
-                question_id,                              
-                content,
-                generated_by,
-                created_at
-            )
-        """).eq("session_id", session_id).order("created_at", desc=False).execute()
-        
-        conversation = []
-        for question in result.data:
-            question_data = ConversationItem(
-                question_id=question["id"],
-                question=question["content"],
-                question_time=isoparse(question["created_at"]),
-                answers=[Answer(**answer) for answer in question.get("answers", [])]
-            )
-            conversation.append(question_data)
-        
-        return ConversationHistory(session_id=session_id, conversation=conversation)
+        version = await repo.get_session_version(session_id)
+        if version is None:
+            raise HTTPException(status_code=404, detail="Không tìm thấy session")
+        return await cache.respond(request, "conversation", session_id, version, render)
         
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Lỗi lấy conversation: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=f"Lỗi lấy conversation: {str(e)}")
+
+@router.get("/sessions/{session_id}/conversation/stream")
+async def stream_conversation(
+    session_id: str,
+    batch_size: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    current_user: TokenData = Depends(get_current_user_or_api_key),
+    repo: SupabaseRepository = Depends(get_repository)
+):
+    """
+    Stream lịch sử chat dạng NDJSON (mỗi dòng một ConversationItem)
+    - Đọc từng trang `batch_size` câu hỏi theo keyset, không giữ toàn bộ lịch sử trong bộ nhớ
+    """
+    owner_id = await repo.get_session_owner(session_id)
+    if not owner_id:
+        raise HTTPException(status_code=404, detail="Không tìm thấy session")
+    
+    if owner_id != current_user.user_id:
+        raise HTTPException(status_code=403, detail="Không có quyền truy cập session này")
+    
+    async def generate():
+        cursor = None
+        while True:
+            questions, cursor = await repo.list_conversation_page(
+                session_id, batch_size, after=cursor, user_id=current_user.user_id
+            )
+            if questions:
+                items = CONVERSATION_ITEMS.validate(questions)
+                yield "".join(item.model_dump_json() + "\n" for item in items)
+            if not cursor:
+                break
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+# WebSocket chat
+async def authenticate_websocket(websocket: WebSocket) -> TokenData:
+    """Header `Authorization: Bearer` / `X-API-Key`, không có thì chờ message `auth` đầu tiên"""
+    token = None
+    authorization = websocket.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    api_key = websocket.headers.get("x-api-key")
+    if not token and not api_key:
+        message = json.loads(await asyncio.wait_for(websocket.receive_text(), WS_AUTH_TIMEOUT))
+        if not isinstance(message, dict) or message.get("type") != "auth":
+            raise HTTPException(status_code=401, detail="Message đầu tiên phải là auth")
+        token, api_key = message.get("token"), message.get("api_key")
+    return await authenticate_credentials(token, api_key)
+
+async def websocket_chat_turn(
+    connection: ChatConnection,
+    request_id: str,
+    message: ChatMessage,
+    repo: SupabaseRepository,
+    scheduler: GenerationScheduler,
+    retriever: DocumentRetriever,
+    answer_cache: AnswerCache,
+):
+    """Một lượt chat trên WebSocket: stream `token` rồi `done` (hoặc `error`), cùng `id` của request"""
+    user_id = connection.user.user_id
+    try:
+        # Quyền sở hữu session chỉ kiểm tra một lần cho mỗi kết nối
+        if message.session_id not in connection.sessions:
+            owner_id = await repo.get_session_owner(message.session_id)
+            if not owner_id:
+                raise HTTPException(status_code=404, detail="Session không tồn tại")
+            if owner_id != user_id:
+                raise HTTPException(status_code=403, detail="Không có quyền truy cập session này")
+            connection.sessions.add(message.session_id)
+
+        points = await run_in_threadpool(retriever.retrieve, user_id, message.question)
+        context = [point.payload["text"] for point in points]
+
+        tokens = []
+        generated_by, answer_tokens = answer_stream(answer_cache, scheduler, message.question, user_id, context)
+        async with aclosing(answer_tokens) as stream:
+            async for token in stream:
+                tokens.append(token)
+                await connection.send({"type": "token", "id": request_id, "delta": token})
+
+        ai_response = "".join(tokens)
+        try:
+            turn = await repo.create_chat_turn(
+                session_id=message.session_id,
+                user_id=user_id,
+                question=message.question,
+                answer=ai_response,
+                generated_by=generated_by,
+            )
+        except RepositoryError as e:
+            if e.status_code in (403, 404):
+                connection.sessions.discard(message.session_id)
+                raise HTTPException(status_code=e.status_code, detail=str(e))
+            raise
+
+        response = ChatResponse(
+            question_id=turn["question_id"],
+            answer_id=turn["answer_id"],
+            question=message.question,
+            answer=ai_response,
+            created_at=datetime.fromisoformat(turn["created_at"].replace('Z', '+00:00')),
+            sources=build_sources(points)
+        )
+        await connection.send({"type": "done", "id": request_id, "response": response.model_dump(mode="json")})
+    except ConnectionClosed:
+        pass
+    except GenerationOverloaded as e:
+        await connection.send({"type": "error", "id": request_id, "status": 503, "detail": str(e)})
+    except HTTPException as e:
+        await connection.send({"type": "error", "id": request_id, "status": e.status_code, "detail": e.detail})
+    except Exception as e:
+        logger.exception("Lỗi khi xử lý chat WebSocket %s của session %s", request_id, message.session_id)
+        await connection.send({"type": "error", "id": request_id, "status": 500, "detail": f"Lỗi chat: {str(e)}"})
+    finally:
+        connection.inflight.pop(request_id, None)
+
+@router.websocket("/ws")
+async def chat_websocket(
+    websocket: WebSocket,
+    repo: SupabaseRepository = Depends(get_repository),
+    scheduler: GenerationScheduler = Depends(get_generation_scheduler),
+    retriever: DocumentRetriever = Depends(get_retriever),
+    hub: WebSocketHub = Depends(get_websocket_hub),
+    answer_cache: AnswerCache = Depends(get_answer_cache)
+):
+    """
+    Chat qua WebSocket, xác thực một lần cho cả kết nối, nhiều session song song
+    - Xác thực: header `Authorization: Bearer` / `X-API-Key`, hoặc message đầu `{"type": "auth", "token"|"api_key": ...}`
+    - Client gửi: `{"type": "chat", "id", "session_id", "question"}`, `{"type": "cancel", "id"}`, `{"type": "pong"}`
+    - Server gửi: `ready`, `token` {id, delta}, `done` {id, response: ChatResponse}, `error` {id, status, detail},
+      `cancelled` {id}, `ping`, `shutdown`
+    - Tối đa `WS_MAX_INFLIGHT` request chạy đồng thời mỗi kết nối; huỷ / ngắt kết nối giữa chừng: không lưu gì
+    """
+    if not hub.can_accept():
+        await websocket.close(CLOSE_TRY_AGAIN_LATER)
+        return
+    await websocket.accept()
+    try:
+        user = await authenticate_websocket(websocket)
+    except WebSocketDisconnect:
+        return
+    except (HTTPException, asyncio.TimeoutError, ValueError, KeyError) as e:
+        detail = e.detail if isinstance(e, HTTPException) else "Cần xác thực"
+        await websocket.send_text(json.dumps({"type": "error", "status": 401, "detail": detail}, ensure_ascii=False))
+        await websocket.close(CLOSE_UNAUTHORIZED)
+        return
+
+    connection = hub.open(websocket, user)
+    try:
+        await connection.send({"type": "ready", "user_id": user.user_id})
+        while True:
+            text = await websocket.receive_text()
+            connection.touch()
+            if not credentials_still_valid(user):
+                await connection.send({"type": "error", "status": 401, "detail": "Token đã hết hạn hoặc bị thu hồi"})
+                await connection.flush(1.0)
+                await connection.close(CLOSE_UNAUTHORIZED)
+                break
+            try:
+                message = json.loads(text)
+                kind = message.get("type")
+            except (ValueError, AttributeError):
+                await connection.send({"type": "error", "status": 400, "detail": "Message phải là JSON object"})
+                continue
+
+            if kind == "chat":
+                request_id = str(message.get("id", ""))
+                try:
+                    chat_message = ChatMessage(session_id=message.get("session_id"), question=message.get("question"))
+                except ValidationError as e:
+                    await connection.send({"type": "error", "id": request_id, "status": 422, "detail": e.errors()})
+                    continue
+                if hub.closing:
+                    await connection.send({"type": "error", "id": request_id, "status": 503, "detail": "Server đang tắt"})
+                elif not request_id or request_id in connection.inflight:
+                    await connection.send({"type": "error", "id": request_id, "status": 409,
+                                           "detail": "Thiếu id hoặc id đang được dùng"})
+                elif len(connection.inflight) >= WS_MAX_INFLIGHT:
+                    await connection.send({"type": "error", "id": request_id, "status": 429,
+                                           "detail": f"Tối đa {WS_MAX_INFLIGHT} request đồng thời mỗi kết nối"})
+                else:
+                    hub.requests += 1
+                    connection.inflight[request_id] = asyncio.create_task(
+                        websocket_chat_turn(
+                            connection, request_id, chat_message, repo, scheduler, retriever, answer_cache
+                        )
+                    )
+            elif kind == "cancel":
+                request_id = str(message.get("id", ""))
+                task = connection.inflight.get(request_id)
+                if task is not None:
+                    task.cancel()
+                    await connection.send({"type": "cancelled", "id": request_id})
+            elif kind == "ping":
+                await connection.send({"type": "pong"})
+            elif kind != "pong":
+                await connection.send({"type": "error", "status": 400, "detail": f"Không hỗ trợ message {kind!r}"})
+    except (WebSocketDisconnect, ConnectionClosed, RuntimeError, KeyError):
+        # RuntimeError: socket đã bị đóng phía server (drain, idle, slow consumer); KeyError: frame nhị phân
+        pass
+    finally:
+        await hub.release(connection)
@@ -1,23 +1,43 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, APIRouter, Depends
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, APIRouter, Depends, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
 from pathlib import Path
-import shutil
 
+from app.models.blob_store import FileTooLarge, QuotaExceeded, blob_store
 from app.models.file_processor import *
-from app.models.security import get_current_active_user, TokenData
+from app.models.ingestion import IngestionJob, IngestionQueueFull, TERMINAL_STATUSES, ingestion_queue
+from app.models.security import get_current_user_or_api_key, TokenData
+from app.models.sse import SSE_HEADERS, sse_event
 
 router = APIRouter(prefix="/file", tags=["file"])
 
+# Định nghĩa kích thước tối đa (5MB)
+MAX_SIZE = 5 * 1024 * 1024  # 5MB
+
+
+def get_user_job(job_id: str, current_user: TokenData) -> IngestionJob:
+    job = ingestion_queue.get(job_id)
+    if job is None or job.user_id != current_user.user_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 
 @router.post("/upload-file/")
 async def upload_file(file: UploadFile = File(...),
-        current_user: TokenData = Depends(get_current_active_user)):
+        background: bool = Query(False, description="Trả về job_id ngay, trích xuất chạy nền"),
+        current_user: TokenData = Depends(get_current_user_or_api_key)):
+    """
+    Upload file và trích xuất nội dung
+    - Mặc định: chờ trích xuất xong rồi trả về `file_info`
+    - `background=true`: trả về 202 + `job_id` ngay; theo dõi qua `/file/jobs/{job_id}`
+      hoặc stream trạng thái qua `/file/jobs/{job_id}/events`
+    - Trích xuất luôn chạy trong process pool, hàng đợi đầy -> 503
+    - File lưu theo SHA-256 nội dung: upload lại tài liệu đã có thì không ghi đĩa
+      và dùng lại kết quả trích xuất đã cache
+    """
     try:
-        # Định nghĩa kích thước tối đa (5MB)
-        MAX_SIZE = 5 * 1024 * 1024  # 5MB
-
         # Kiểm tra kích thước file
-        if file.size > MAX_SIZE:
+        if file.size is not None and file.size > MAX_SIZE:
             raise HTTPException(
                 status_code=400,
                 detail=f"File too large. Max size is {MAX_SIZE / (1024 * 1024)}MB."
@@ -30,47 +50,91 @@ async def upload_file(file: UploadFile = File(...),
                 detail="Invalid file format. Only .pdf, .doc, .docx, and .txt are allowed."
             )
 
-        # Tạo thư mục uploads
-        upload_dir = Path("uploads")
-        upload_dir.mkdir(exist_ok=True)
-        
-        # Lưu file
-        file_path = upload_dir / file.filename
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Trích xuất nội dung
-        content = ""
-        if file_path.suffix.lower() == ".pdf":
-            content = extract_pdf_content(file_path)
-        elif file_path.suffix.lower() in [".doc", ".docx"]:
-            content = extract_docx_content(file_path)
-        elif file_path.suffix.lower() == ".txt":
-            content = extract_txt_content(file_path)
-        
-        # Thông tin file
-        file_info = {
-            "filename": file.filename,
-            "size": file_path.stat().st_size,
-            "content_type": file.content_type,
-            "path": str(file_path),
-            "extracted_content": content
-        }
-        
+        # Nhận file (tính SHA-256 trong lúc đọc) rồi gắn blob vào user
+        received = await blob_store.receive(file, MAX_SIZE)
+        # Job giữ blob (pin) tới khi xong: upload đè cùng filename không xoá file job đang đọc
+        stored = await run_in_threadpool(
+            blob_store.commit, current_user.user_id, file.filename, file.content_type, received, True
+        )
+
+        job = IngestionJob(
+            current_user.user_id, file.filename, stored.path, file.content_type, stored.size, stored.blob_id,
+            pinned=True,
+        )
+        cached = await run_in_threadpool(blob_store.get_extracted, stored.blob_id)
+        if cached is not None:
+            await ingestion_queue.complete(job, cached)
+        else:
+            # Đưa vào hàng đợi trích xuất nội dung
+            try:
+                ingestion_queue.submit(job)
+            except IngestionQueueFull:
+                await ingestion_queue.release(job)
+                raise
+
+        if background:
+            return JSONResponse(
+                status_code=202,
+                content={
+                    "message": "File uploaded, processing in background",
+                    "job_id": job.id,
+                    "status_url": f"/file/jobs/{job.id}"
+                }
+            )
+
+        while job.status not in TERMINAL_STATUSES:
+            await job.wait_for_change()
+
+        if job.status == "failed":
+            raise HTTPException(status_code=500, detail=job.error)
+
         return JSONResponse(
             status_code=200,
             content={
                 "message": "File uploaded successfully",
-                "file_info": file_info
+                "file_info": job.file_info(),
+                "deduplicated": stored.deduplicated,
+                "extraction_cached": cached is not None
             }
         )
-    
+
+    except HTTPException:
+        raise
+    except FileTooLarge as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except QuotaExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except IngestionQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
-    
+
     finally:
         await file.close()
 
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, current_user: TokenData = Depends(get_current_user_or_api_key)):
+    """Trạng thái job ingest: queued / running / done / failed"""
+    return get_user_job(job_id, current_user).to_dict()
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job(job_id: str, current_user: TokenData = Depends(get_current_user_or_api_key)):
+    """Stream trạng thái job (Server-Sent Events) đến khi done/failed"""
+    job = get_user_job(job_id, current_user)
+
+    async def generate():
+        sent_status = None
+        while True:
+            if job.status != sent_status:
+                sent_status = job.status
+                yield sse_event("status", job.to_dict())
+            if sent_status in TERMINAL_STATUSES:
+                break
+            if job.status == sent_status:
+                await job.wait_for_change()
+
+    return StreamingResponse(generate(), media_type="text/event-stream", headers=SSE_HEADERS)
+
 @router.get("/health")
 async def health_check():
-    return {"status": "API is running"}
\ No newline at end of file
+    return {"status": "API is running"}
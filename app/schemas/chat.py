@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import AliasChoices, BaseModel, EmailStr, Field
 from typing import Optional, List
 from datetime import datetime
 from uuid import uuid4
@@ -62,20 +62,74 @@ class ChatMessage(BaseModel):
     session_id: str
     question: str
 
+class ChatSource(BaseModel):
+    filename: str
+    chunk_index: int
+    score: float
+
 class ChatResponse(BaseModel):
     question_id: str
     answer_id: str
     question: str
     answer: str
     created_at: datetime
+    sources: List[ChatSource] = []
 
 # Conversation Models
 class ConversationItem(BaseModel):
-    question_id: str
-    question: str
-    question_time: datetime
+    # Alias tên cột của questions: validate thẳng từ dòng repository (chỉ khi đọc vào)
+    question_id: str = Field(validation_alias=AliasChoices("question_id", "id"))
+    question: str = Field(validation_alias=AliasChoices("question", "content"))
+    question_time: datetime = Field(validation_alias=AliasChoices("question_time", "created_at"))
     answers: List[Answer]
 
 class ConversationHistory(BaseModel):
     session_id: str
-    conversation: List[ConversationItem]
\ No newline at end of file
+    conversation: List[ConversationItem]
+    next_cursor: Optional[str] = None
+
+# Batch Models
+MAX_BATCH_ITEMS = 100
+
+class ChatBatchRequest(BaseModel):
+    session_id: str
+    questions: List[str] = Field(min_length=1, max_length=MAX_BATCH_ITEMS)
+
+class ChatBatchItem(BaseModel):
+    index: int
+    status: int  # mã HTTP của riêng câu này (200 hoặc lỗi)
+    result: Optional[ChatResponse] = None
+    detail: Optional[str] = None
+
+class ChatBatchResponse(BaseModel):
+    session_id: str
+    succeeded: int
+    failed: int
+    results: List[ChatBatchItem]
+
+class AnswerBatchRequest(BaseModel):
+    question_ids: List[str] = Field(min_length=1, max_length=MAX_BATCH_ITEMS)
+
+class AnswerBatchItem(BaseModel):
+    question_id: str
+    status: int
+    answers: List[Answer] = []
+    detail: Optional[str] = None
+
+class AnswerBatchResponse(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[AnswerBatchItem]
+
+class SessionBatchDelete(BaseModel):
+    session_ids: List[str] = Field(min_length=1, max_length=MAX_BATCH_ITEMS)
+
+class SessionDeleteItem(BaseModel):
+    session_id: str
+    status: int
+    detail: Optional[str] = None
+
+class SessionBatchDeleteResponse(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[SessionDeleteItem]
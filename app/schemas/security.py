@@ -12,6 +12,8 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     user_id: Optional[str] = None
     email: Optional[str] = None
+    jti: Optional[str] = None  # id của JWT (None với API key / token cũ)
+    exp: Optional[int] = None
 
 class UserLogin(BaseModel):
     email: EmailStr
@@ -29,8 +31,13 @@ class RateLimitConfig(BaseModel):
     max_requests: int = 100
     window_seconds: int = 3600  # 1 hour
     
+class APIKeyCreate(BaseModel):
+    name: Optional[str] = None
+    rate_limit: Optional[RateLimitConfig] = None
+
 class APIKeyModel(BaseModel):
-    key: str
+    id: Optional[str] = None
+    key: str  # key đầy đủ chỉ trả về lúc tạo, các lần sau chỉ còn phần đầu
     user_id: str
     name: Optional[str] = None
     is_active: bool = True
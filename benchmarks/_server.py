@@ -0,0 +1,43 @@
+"""
+Tiện ích chung cho benchmark: chạy fake PostgREST trên cổng local.
+"""
+import os
+import socket
+import threading
+import time
+
+import uvicorn
+
+from app.models.fake_postgrest import create_fake_postgrest
+
+FAKE_API_KEY = "fake.fake.fake"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_fake_postgrest(latency_ms: float = 0.0):
+    """Chạy fake PostgREST trong thread nền, trả về (url, app)"""
+    app = create_fake_postgrest(latency_ms=latency_ms)
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", timeout_keep_alive=60))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+
+    url = f"http://127.0.0.1:{port}"
+    os.environ["Supabase_Project_URL"] = url
+    os.environ["Supabase_API_Key"] = FAKE_API_KEY
+    # Benchmark gửi dồn dập từ một client -> tắt rate limit trừ khi chỉ định
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    return url, app
+
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
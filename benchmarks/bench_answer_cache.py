@@ -0,0 +1,128 @@
+"""
+Benchmark cache câu trả lời: tắt / trùng khớp (sau chuẩn hoá) / thêm tầng gần trùng.
+
+App in-process (SUPABASE_FAKE + answer backend giả có độ trễ
+`--llm-latency-ms` mỗi lần gọi model). `--requests` lượt `POST /chat/` từ
+`--users` user (chưa upload tài liệu nên cùng fingerprint), câu hỏi chọn theo
+phân phối Zipf trên `--topics` chủ đề; mỗi chủ đề có vài cách hỏi: khác hoa
+thường / dấu / dấu câu (tầng trùng khớp bắt được) và diễn đạt lại (chỉ tầng
+gần trùng bắt được). In hit ratio, thời gian sinh tiết kiệm được, p50/p95.
+
+Chạy:
+    python -m benchmarks.bench_answer_cache --requests 2000 --topics 200 --llm-latency-ms 200
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import tempfile
+import time
+import unicodedata
+import uuid
+
+import httpx
+
+from benchmarks._server import percentile
+
+SUBJECTS = ["thanh toán", "bảo hành", "giao hàng", "bồi thường", "chấm dứt hợp đồng", "bảo mật thông tin",
+            "phạt vi phạm", "nghiệm thu", "đặt cọc", "gia hạn", "bàn giao tài liệu", "thuế", "bảo hiểm",
+            "tranh chấp", "quyền sở hữu trí tuệ", "hoàn tiền", "khiếu nại", "vận chuyển", "lắp đặt", "đào tạo"]
+OBJECTS = ["hợp đồng mua bán", "hợp đồng dịch vụ", "hợp đồng thuê nhà", "phụ lục số 1", "đơn đặt hàng",
+           "hợp đồng lao động", "thoả thuận khung", "biên bản ghi nhớ", "hợp đồng đại lý", "hợp đồng vay"]
+
+
+def variants(subject: str, obj: str) -> list:
+    base = f"Điều khoản {subject} của {obj} là gì?"
+    plain = unicodedata.normalize("NFD", base.lower().replace("đ", "d"))
+    plain = "".join(char for char in plain if unicodedata.category(char) != "Mn")
+    return [
+        base,
+        base.upper(),
+        f"  {base[:-1]}   ??",
+        plain,
+        f"Điều khoản {subject} trong {obj} là gì?",        # diễn đạt lại
+        f"Cho tôi hỏi điều khoản {subject} của {obj} là gì?",  # diễn đạt lại
+    ]
+
+
+async def run(client: httpx.AsyncClient, users: list, questions: list, concurrency: int) -> list:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(index: int, question: str):
+        headers, session_id = users[index % len(users)]
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post("/chat/", json={"session_id": session_id, "question": question},
+                                         headers=headers)
+            response.raise_for_status()
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(one(index, question) for index, question in enumerate(questions)))
+    return latencies
+
+
+async def main(args):
+    # Cấu hình phải có trước khi import app
+    os.environ["SUPABASE_FAKE"] = "true"
+    os.environ["SUPABASE_FAKE_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["FAKE_ANSWER_CALL_LATENCY_MS"] = str(args.llm_latency_ms)
+    os.environ.setdefault("LLM_MAX_CONCURRENCY", str(args.concurrency))
+    os.environ.setdefault("LLM_MAX_CONCURRENCY_PER_USER", str(args.concurrency))
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    upload_dir = None if "UPLOAD_DIR" in os.environ else tempfile.mkdtemp(prefix="bench-answer-cache-")
+    if upload_dir:
+        os.environ["UPLOAD_DIR"] = upload_dir
+    from app.main import app
+    from app.models.answer_cache import AnswerCache, get_answer_cache
+
+    rng = random.Random(args.seed)
+    topics = [(subject, obj) for obj in OBJECTS for subject in SUBJECTS][:args.topics]
+    weights = [1 / (rank + 1) ** args.zipf for rank in range(len(topics))]
+    questions = [rng.choice(variants(*topic)) for topic in rng.choices(topics, weights, k=args.requests)]
+
+    try:
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+                users = []
+                for _ in range(args.users):
+                    credentials = {"email": f"ac-{uuid.uuid4().hex[:8]}@example.com", "password": "bench-password"}
+                    await client.post("/auth/register", json=credentials)
+                    token = (await client.post("/auth/login", json=credentials)).json()["access_token"]
+                    headers = {"Authorization": f"Bearer {token}"}
+                    user_id = (await client.get("/auth/me", headers=headers)).json()["id"]
+                    session = await client.post("/chat/sessions/", json={"user_id": user_id}, headers=headers)
+                    users.append((headers, session.json()["id"]))
+
+                print(f"requests={args.requests} topics={len(topics)} users={args.users} "
+                      f"concurrency={args.concurrency} llm_latency_ms={args.llm_latency_ms}")
+                for label, enabled, near in (("tắt", False, False), ("trùng khớp", True, False),
+                                             ("+ gần trùng", True, True)):
+                    answer_cache = AnswerCache(enabled=enabled, near_duplicates=near)
+                    app.dependency_overrides[get_answer_cache] = lambda: answer_cache
+                    started = time.perf_counter()
+                    latencies = await run(client, users, questions, args.concurrency)
+                    elapsed = time.perf_counter() - started
+                    stats = answer_cache.stats()
+                    print(f"cache {label:<11} {args.requests / elapsed:>7.1f} req/s  "
+                          f"p50={percentile(latencies, 50):>7.1f} ms p95={percentile(latencies, 95):>7.1f} ms  "
+                          f"hit={stats['hit_ratio']:.1%} (exact {stats['exact_hits']}, near {stats['near_hits']})  "
+                          f"tiết kiệm {stats['saved_generation_seconds']:.1f}s sinh câu trả lời")
+    finally:
+        if upload_dir:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--topics", type=int, default=200)
+    parser.add_argument("--zipf", type=float, default=1.0, help="Số mũ phân phối Zipf của chủ đề")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
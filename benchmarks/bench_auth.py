@@ -0,0 +1,61 @@
+"""
+Microbenchmark chuỗi dependency xác thực: get_current_user -> get_current_active_user.
+
+So sánh có / không có cache token đã verify, và chi phí kiểm tra danh sách
+token thu hồi khi danh sách có `--revoked` jti (exp rải đều trong 30 phút).
+
+Chạy:
+    python -m benchmarks.bench_auth --iterations 50000
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+from fastapi.security import HTTPAuthorizationCredentials
+
+from app.models.revocation import revocation_list
+from app.models.security import SecurityUtils, get_current_active_user, get_current_user, token_cache
+
+
+async def auth_chain(credentials):
+    return await get_current_active_user(await get_current_user(credentials))
+
+
+async def measure(credentials, iterations: int, cached: bool) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        if not cached:
+            token_cache.clear()
+        await auth_chain(credentials)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+async def main(args):
+    token = SecurityUtils.create_access_token({"sub": "bench-user", "email": "bench@example.com"})
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+    uncached = await measure(credentials, args.iterations, cached=False)
+    cached = await measure(credentials, args.iterations, cached=True)
+
+    print(f"iterations={args.iterations}")
+    print(f"jwt.decode every request : {uncached:7.2f} us/request")
+    print(f"verified-token cache     : {cached:7.2f} us/request  (x{uncached / cached:.1f})")
+    print(f"cache stats: {token_cache.stats()}")
+
+    now = int(time.time())
+    for i in range(args.revoked):
+        revocation_list.add(uuid.uuid4().hex, now + 60 + i * 1800 // max(args.revoked, 1))
+    revoked = await measure(credentials, args.iterations, cached=True)
+    started = time.perf_counter()
+    for _ in range(args.iterations):
+        revocation_list.is_revoked("b1585ade70bd46d49e79993d1ecbf4c5", now + 900)
+    check = (time.perf_counter() - started) / args.iterations * 1e6
+    print(f"cache + {args.revoked} revoked  : {revoked:7.2f} us/request  (is_revoked {check:.2f} us)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=50000)
+    parser.add_argument("--revoked", type=int, default=100000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,154 @@
+"""
+Benchmark endpoint batch so với gọi từng item.
+
+Mỗi vòng một user (app in-process, SUPABASE_FAKE với độ trễ `--latency-ms`
+cho mỗi lần gọi PostgREST):
+1. chat: `--items` lần `POST /chat/` vs một `POST /chat/batch`
+2. answers: `--items` lần `GET /chat/questions/{id}/answers` vs một
+   `POST /chat/answers/batch` (cache owner/question của repository xoá trước
+   mỗi lượt để đo cả bước kiểm tra quyền)
+3. xoá session: `--items` lần `DELETE /chat/sessions/{id}` vs một
+   `POST /chat/sessions/batch-delete`
+
+In item/s, số lần gọi PostgREST mỗi item và thời gian mỗi request của hai cách.
+
+Chạy:
+    python -m benchmarks.bench_batch --items 50 --rounds 5 --latency-ms 5
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+
+import httpx
+
+
+def postgrest_calls() -> int:
+    from app.models.repository import POSTGREST_SECONDS
+    return sum(sum(child.counts) for child in POSTGREST_SECONDS._children.values())
+
+
+class Tally:
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.items = defaultdict(int)
+        self.requests = defaultdict(int)
+        self.calls = defaultdict(int)
+
+    async def measure(self, name: str, items: int, requests: int, work):
+        from app.models.repository import repository
+        repository.session_owners.clear()
+        repository.question_sessions.clear()
+        repository.versions.clear()
+        calls = postgrest_calls()
+        started = time.perf_counter()
+        await work()
+        self.seconds[name] += time.perf_counter() - started
+        self.calls[name] += postgrest_calls() - calls
+        self.items[name] += items
+        self.requests[name] += requests
+
+    def report(self, pairs):
+        print(f"{'step':<22} {'items':>6} {'items/s':>9} {'ms/req':>8} {'PostgREST/item':>15}")
+        for single, batch in pairs:
+            for name in (single, batch):
+                print(f"{name:<22} {self.items[name]:>6} {self.items[name] / self.seconds[name]:>9.1f} "
+                      f"{self.seconds[name] * 1000 / self.requests[name]:>8.1f} "
+                      f"{self.calls[name] / self.items[name]:>15.2f}")
+            print(f"  -> batch nhanh hơn {self.seconds[single] / self.seconds[batch]:.1f}x")
+
+
+async def one_round(client: httpx.AsyncClient, headers: dict, user_id: str, args, tally: Tally):
+    def check(response: httpx.Response) -> httpx.Response:
+        response.raise_for_status()
+        return response
+
+    async def new_session() -> str:
+        return check(await client.post("/chat/sessions/", json={"user_id": user_id}, headers=headers)).json()["id"]
+
+    questions = [f"Câu hỏi {i} về điều khoản thanh toán?" for i in range(args.items)]
+    single_session, batch_session = await new_session(), await new_session()
+    question_ids = []
+
+    async def chat_single():
+        for question in questions:
+            response = check(await client.post("/chat/", json={"session_id": single_session, "question": question},
+                                               headers=headers))
+            question_ids.append(response.json()["question_id"])
+
+    async def chat_batch():
+        response = check(await client.post("/chat/batch", json={"session_id": batch_session, "questions": questions},
+                                           headers=headers))
+        assert response.json()["failed"] == 0, response.json()
+
+    await tally.measure("chat", args.items, args.items, chat_single)
+    await tally.measure("chat/batch", args.items, 1, chat_batch)
+
+    async def answers_single():
+        for question_id in question_ids:
+            check(await client.get(f"/chat/questions/{question_id}/answers", headers=headers))
+
+    async def answers_batch():
+        check(await client.post("/chat/answers/batch", json={"question_ids": question_ids}, headers=headers))
+
+    await tally.measure("answers", args.items, args.items, answers_single)
+    await tally.measure("answers/batch", args.items, 1, answers_batch)
+
+    single_sessions = [await new_session() for _ in range(args.items)]
+    batch_sessions = [await new_session() for _ in range(args.items)]
+
+    async def delete_single():
+        for session_id in single_sessions:
+            check(await client.delete(f"/chat/sessions/{session_id}", headers=headers))
+
+    async def delete_batch():
+        response = check(await client.post("/chat/sessions/batch-delete", json={"session_ids": batch_sessions},
+                                           headers=headers))
+        assert response.json()["failed"] == 0, response.json()
+
+    await tally.measure("delete", args.items, args.items, delete_single)
+    await tally.measure("delete/batch", args.items, 1, delete_batch)
+    for session_id in (single_session, batch_session):
+        check(await client.delete(f"/chat/sessions/{session_id}", headers=headers))
+
+
+async def main(args):
+    # Cấu hình phải có trước khi import app
+    os.environ["SUPABASE_FAKE"] = "true"
+    os.environ["SUPABASE_FAKE_LATENCY_MS"] = str(args.latency_ms)
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    upload_dir = None if "UPLOAD_DIR" in os.environ else tempfile.mkdtemp(prefix="bench-batch-")
+    if upload_dir:
+        os.environ["UPLOAD_DIR"] = upload_dir
+    from app.main import app
+
+    tally = Tally()
+    try:
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+                credentials = {"email": f"batch-{uuid.uuid4().hex[:8]}@example.com", "password": "bench-password"}
+                await client.post("/auth/register", json=credentials)
+                token = (await client.post("/auth/login", json=credentials)).json()["access_token"]
+                headers = {"Authorization": f"Bearer {token}"}
+                user_id = (await client.get("/auth/me", headers=headers)).json()["id"]
+                for _ in range(args.rounds):
+                    await one_round(client, headers, user_id, args, tally)
+    finally:
+        if upload_dir:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+
+    print(f"items={args.items} rounds={args.rounds} latency_ms={args.latency_ms}")
+    tally.report([("chat", "chat/batch"), ("answers", "answers/batch"), ("delete", "delete/batch")])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=50, help="Số item mỗi batch (tối đa MAX_BATCH_ITEMS)")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    asyncio.run(main(parser.parse_args()))
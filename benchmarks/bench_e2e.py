@@ -0,0 +1,181 @@
+"""
+Benchmark end-to-end các luồng chính của API.
+
+Mỗi user ảo chạy tuần tự: register -> login -> me -> tạo session -> N lượt
+chat -> lấy conversation -> upload file (+ chờ ingest xong); `--concurrency`
+user chạy đồng thời. In throughput và p50/p95/p99 cho từng bước.
+
+Mặc định chạy app in-process (httpx.ASGITransport) với Supabase giả lập
+in-process (SUPABASE_FAKE, độ trễ `--latency-ms` cho mỗi lần gọi PostgREST),
+nên client, app và fake cùng chia CPU của một process. `--url` để bắn vào
+server đang chạy (vd `SUPABASE_FAKE=true uvicorn app.main:app --workers 4`).
+
+`--max-p95-ms` / `--max-error-rate`: thoát mã 1 nếu vượt ngưỡng (dùng trong CI).
+
+Chạy:
+    python -m benchmarks.bench_e2e --users 40 --concurrency 10 --turns 5 --latency-ms 5
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Dict, List
+
+import httpx
+
+from benchmarks._server import percentile
+
+STEPS = ["register", "login", "me", "create_session", "chat", "conversation", "upload", "ingestion"]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    @asynccontextmanager
+    async def step(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.errors[name] += 1
+            raise
+        finally:
+            self.latencies[name].append((time.perf_counter() - started) * 1000)
+
+    async def request(self, name: str, client: httpx.AsyncClient, method: str, url: str, **kwargs) -> httpx.Response:
+        async with self.step(name):
+            response = await client.request(method, url, **kwargs)
+            response.raise_for_status()
+            return response
+
+
+async def user_flow(client: httpx.AsyncClient, recorder: Recorder, args, document: bytes):
+    email = f"bench-{uuid.uuid4().hex[:12]}@example.com"
+    credentials = {"email": email, "password": "bench-password"}
+    await recorder.request("register", client, "POST", "/auth/register", json={**credentials, "full_name": "Bench"})
+    token = (await recorder.request("login", client, "POST", "/auth/login", json=credentials)).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    user_id = (await recorder.request("me", client, "GET", "/auth/me", headers=headers)).json()["id"]
+    session_id = (await recorder.request(
+        "create_session", client, "POST", "/chat/sessions/", json={"user_id": user_id}, headers=headers
+    )).json()["id"]
+
+    for turn in range(args.turns):
+        await recorder.request("chat", client, "POST", "/chat/", headers=headers,
+                               json={"session_id": session_id, "question": f"Câu hỏi số {turn} về tài liệu?"})
+    await recorder.request("conversation", client, "GET", f"/chat/sessions/{session_id}/conversation",
+                           headers=headers)
+
+    if not args.upload_bytes:
+        return
+    job = (await recorder.request(
+        "upload", client, "POST", "/file/upload-file/", headers=headers, params={"background": "true"},
+        files={"file": (f"{uuid.uuid4().hex}.txt", document + uuid.uuid4().hex.encode(), "text/plain")},
+    )).json()
+    async with recorder.step("ingestion"):
+        deadline = time.perf_counter() + args.ingestion_timeout
+        status = None
+        while status not in ("done", "failed"):
+            if time.perf_counter() > deadline:
+                raise TimeoutError(job["job_id"])
+            await asyncio.sleep(0.02)
+            response = await client.get(f"/file/jobs/{job['job_id']}", headers=headers)
+            response.raise_for_status()
+            status = response.json()["status"]
+        if status == "failed":
+            raise RuntimeError(job["job_id"])
+
+
+async def drive(client: httpx.AsyncClient, args) -> tuple:
+    recorder = Recorder()
+    words = "hợp đồng điều khoản thanh toán bảo hành giao hàng trách nhiệm bồi thường ".split()
+    document = " ".join(words[i % len(words)] for i in range(args.upload_bytes // 8)).encode()[:args.upload_bytes]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    failed_flows = 0
+
+    async def one_user():
+        nonlocal failed_flows
+        async with semaphore:
+            try:
+                await user_flow(client, recorder, args, document)
+            except Exception:
+                failed_flows += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one_user() for _ in range(args.users)))
+    return recorder, time.perf_counter() - started, failed_flows
+
+
+def report(recorder: Recorder, elapsed: float, failed_flows: int, args) -> bool:
+    total = sum(len(values) for values in recorder.latencies.values())
+    errors = sum(recorder.errors.values())
+    print(f"users={args.users} concurrency={args.concurrency} turns={args.turns} "
+          f"latency_ms={args.latency_ms} upload_bytes={args.upload_bytes}")
+    print(f"{'step':<15} {'count':>6} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    ok = True
+    for step in STEPS:
+        values = recorder.latencies.get(step)
+        if not values:
+            continue
+        p95 = percentile(values, 95)
+        print(f"{step:<15} {len(values):>6} {recorder.errors[step]:>6} {len(values) / elapsed:>8.1f} "
+              f"{percentile(values, 50):>8.1f} {p95:>8.1f} {percentile(values, 99):>8.1f}")
+        if args.max_p95_ms is not None and step not in ("register", "login", "ingestion") and p95 > args.max_p95_ms:
+            print(f"  !! p95 của {step} vượt {args.max_p95_ms} ms")
+            ok = False
+    error_rate = errors / total if total else 0.0
+    print(f"total: {total} requests in {elapsed:.2f}s = {total / elapsed:.1f} req/s, "
+          f"{args.users / elapsed:.2f} flows/s, failed flows={failed_flows}, error rate={error_rate:.2%}")
+    if error_rate > args.max_error_rate:
+        print(f"  !! error rate vượt {args.max_error_rate:.2%}")
+        ok = False
+    return ok
+
+
+async def main(args) -> bool:
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+            recorder, elapsed, failed = await drive(client, args)
+        return report(recorder, elapsed, failed, args)
+
+    # Cấu hình phải có trước khi import app
+    os.environ["SUPABASE_FAKE"] = "true"
+    os.environ["SUPABASE_FAKE_LATENCY_MS"] = str(args.latency_ms)
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    upload_dir = None if "UPLOAD_DIR" in os.environ else tempfile.mkdtemp(prefix="bench-e2e-")
+    if upload_dir:
+        os.environ["UPLOAD_DIR"] = upload_dir
+    from app.main import app
+
+    try:
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout) as client:
+                recorder, elapsed, failed = await drive(client, args)
+    finally:
+        if upload_dir:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+    return report(recorder, elapsed, failed, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--upload-bytes", type=int, default=20000, help="0 = bỏ qua bước upload")
+    parser.add_argument("--ingestion-timeout", type=float, default=60.0)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--url", help="Bắn vào server đang chạy thay vì app in-process")
+    parser.add_argument("--max-p95-ms", type=float, help="Ngưỡng p95 (trừ register/login/ingestion)")
+    parser.add_argument("--max-error-rate", type=float, default=0.0)
+    sys.exit(0 if asyncio.run(main(parser.parse_args())) else 1)
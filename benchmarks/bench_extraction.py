@@ -0,0 +1,101 @@
+"""
+Benchmark trích xuất nội dung: thời gian + peak RSS trên bộ file tổng hợp (PDF/DOCX/TXT).
+
+Mỗi phép đo chạy trong một process riêng để peak RSS không bị cộng dồn.
+
+Chạy:
+    python -m benchmarks.bench_extraction --sizes 10 100 1000
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+LINE = "Noi dung mau de do toc do trich xuat van ban tu tai lieu tong hop {}"
+
+
+def write_pdf(path: Path, pages: int, lines_per_page: int = 40):
+    """Ghi PDF tối giản (mỗi trang một content stream chứa text) mà không cần thư viện ngoài"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page in range(pages):
+        lines = " ".join(f"({LINE.format(page * lines_per_page + i)}) '" for i in range(lines_per_page))
+        stream = f"BT /F1 10 Tf 12 TL 40 800 Td {lines} ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        content_id = len(objects)
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    path.write_bytes(bytes(out))
+
+
+def write_docx(path: Path, pages: int, lines_per_page: int = 40):
+    import docx
+
+    document = docx.Document()
+    for i in range(pages * lines_per_page):
+        document.add_paragraph(LINE.format(i))
+    document.save(path)
+
+
+def write_txt(path: Path, pages: int, lines_per_page: int = 40):
+    with path.open("w", encoding="utf-8") as file:
+        for i in range(pages * lines_per_page):
+            file.write(LINE.format(i) + "\n")
+
+
+def measure_single(path: str):
+    from app.models.file_processor import extract_file_content
+
+    started = time.perf_counter()
+    content = extract_file_content(path)
+    elapsed = time.perf_counter() - started
+    # VmHWM thay vì ru_maxrss của chính process: ru_maxrss giữ lại giá trị từ process cha qua exec
+    with open("/proc/self/status") as status:
+        own_kb = next(int(line.split()[1]) for line in status if line.startswith("VmHWM"))
+    peak_kb = max(own_kb, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    print(json.dumps({"seconds": elapsed, "chars": len(content), "peak_rss_mb": peak_kb / 1024}))
+
+
+def main(args):
+    writers = {"pdf": write_pdf, "docx": write_docx, "txt": write_txt}
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"{'file':<12} {'pages':>6} {'size MB':>8} {'seconds':>8} {'chars':>9} {'peak RSS MB':>12}")
+        for kind in args.kinds:
+            for pages in args.sizes:
+                path = Path(workdir) / f"corpus_{pages}.{kind}"
+                writers[kind](path, pages)
+                output = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_extraction", "--single", str(path)],
+                    capture_output=True, text=True, check=True,
+                ).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                print(f"{kind:<12} {pages:>6} {path.stat().st_size / 2**20:>8.2f} {result['seconds']:>8.3f} "
+                      f"{result['chars']:>9} {result['peak_rss_mb']:>12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 500, 2000])
+    parser.add_argument("--kinds", nargs="+", default=["pdf", "docx", "txt"])
+    parser.add_argument("--single", help=argparse.SUPPRESS)
+    parsed = parser.parse_args()
+    if parsed.single:
+        measure_single(parsed.single)
+    else:
+        main(parsed)
@@ -0,0 +1,69 @@
+"""
+Benchmark GenerationScheduler: throughput có / không micro-batching.
+
+Fake backend tốn `--call-latency-ms` cho mỗi lần gọi model (một câu hay cả
+batch đều như nhau), số lần gọi đồng thời bị giới hạn bởi `--max-concurrency`.
+
+Chạy:
+    python -m benchmarks.bench_generation --requests 2000 --users 200
+"""
+import argparse
+import asyncio
+import time
+
+from app.models.answer_backend import FakeAnswerBackend
+from app.models.generation import GenerationOverloaded, GenerationScheduler
+
+
+async def run(args, max_batch_size: int) -> dict:
+    scheduler = GenerationScheduler(
+        FakeAnswerBackend(call_latency=args.call_latency_ms / 1000),
+        max_concurrency=args.max_concurrency,
+        max_concurrency_per_user=args.per_user,
+        max_queue=args.max_queue,
+        queue_timeout=args.queue_timeout,
+        batch_window=args.batch_window_ms / 1000,
+        max_batch_size=max_batch_size,
+    )
+    completed = rejected = 0
+
+    async def one(i: int):
+        nonlocal completed, rejected
+        try:
+            await scheduler.generate(f"Câu hỏi {i}", user_id=f"user-{i % args.users}")
+            completed += 1
+        except GenerationOverloaded:
+            rejected += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - started
+    return {
+        "completed": completed,
+        "rejected": rejected,
+        "throughput": completed / elapsed,
+        "avg_batch_size": scheduler.stats()["avg_batch_size"],
+    }
+
+
+async def main(args):
+    print(f"requests={args.requests} users={args.users} call_latency={args.call_latency_ms}ms "
+          f"max_concurrency={args.max_concurrency} max_queue={args.max_queue}")
+    for label, size in (("unbatched", 1), ("batched", args.max_batch_size)):
+        result = await run(args, size)
+        print(f"{label:<10} {result['throughput']:8.1f} answers/s  completed={result['completed']} "
+              f"rejected={result['rejected']} avg_batch={result['avg_batch_size']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--per-user", type=int, default=2)
+    parser.add_argument("--call-latency-ms", type=float, default=50)
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    parser.add_argument("--max-queue", type=int, default=4096)
+    parser.add_argument("--queue-timeout", type=float, default=30)
+    parser.add_argument("--batch-window-ms", type=float, default=5)
+    parser.add_argument("--max-batch-size", type=int, default=16)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,79 @@
+"""
+Benchmark: độ trễ POST /chat/ khi có bão đăng nhập (bcrypt) trên cùng worker.
+
+So sánh bcrypt chạy inline trên event loop (cũ) và trên password pool (mới).
+
+Chạy:
+    python -m benchmarks.bench_login_storm --logins 40 --chats 50
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks._server import percentile, start_fake_postgrest
+
+
+async def chat_latencies(client, headers, session_id, count):
+    latencies = []
+    for i in range(count):
+        started = time.perf_counter()
+        response = await client.post("/chat/", json={"session_id": session_id, "question": f"Q{i}"}, headers=headers)
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+async def run(app, args, storm: bool):
+    credentials = {"email": "storm@example.com", "password": "storm-password"}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        token = (await client.post("/auth/login", json=credentials)).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        user_id = (await client.get("/auth/me", headers=headers)).json()["id"]
+        session_id = (await client.post("/chat/sessions/", json={"user_id": user_id}, headers=headers)).json()["id"]
+
+        async def login():
+            await client.post("/auth/login", json=credentials)
+
+        logins = [asyncio.create_task(login()) for _ in range(args.logins)] if storm else []
+        await asyncio.sleep(0)
+        latencies = await chat_latencies(client, headers, session_id, args.chats)
+        await asyncio.gather(*logins)
+        return latencies
+
+
+def report(label, latencies):
+    print(f"{label:<28} p50={percentile(latencies, 50):7.1f}ms p95={percentile(latencies, 95):7.1f}ms "
+          f"max={max(latencies):7.1f}ms")
+
+
+async def main(args):
+    start_fake_postgrest(latency_ms=args.latency_ms)
+    from app.main import app
+    from app.models.security import password_hasher
+
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            await client.post("/auth/register", json={"email": "storm@example.com", "password": "storm-password"})
+
+        report("idle", await run(app, args, storm=False))
+        report("login storm (pool)", await run(app, args, storm=True))
+
+        async def inline(fn, *fn_args):
+            return fn(*fn_args)
+
+        pooled = password_hasher._run
+        password_hasher._run = inline
+        try:
+            report("login storm (inline bcrypt)", await run(app, args, storm=True))
+        finally:
+            password_hasher._run = pooled
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency-ms", type=float, default=5)
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--chats", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
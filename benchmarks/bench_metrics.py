@@ -0,0 +1,81 @@
+"""
+Benchmark chi phí của metrics trên đường nóng.
+
+- `Histogram.observe` (child đã cache) và `Histogram.time()` context manager
+- `MetricsMiddleware` quanh một ASGI app tối giản (có route giả trong scope)
+- Thời gian render `/metrics` khi đã có nhiều series
+
+Chạy:
+    python -m benchmarks.bench_metrics --iterations 200000
+"""
+import argparse
+import asyncio
+import time
+
+from app.models.metrics import Histogram, MetricsMiddleware, Registry
+
+
+class FakeRoute:
+    path = "/chat/sessions/{session_id}"
+
+
+async def endpoint(scope, receive, send):
+    scope["route"] = FakeRoute
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+async def measure_app(app, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await app({"type": "http", "method": "GET", "path": "/chat/sessions/x", "headers": []}, receive, send)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def per_call(fn, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main(args):
+    registry = Registry()
+    histogram = Histogram("bench_seconds", "bench", ("route",), registry=registry)
+    child = histogram.labels("/x")
+
+    def timed():
+        with histogram.time("/x"):
+            pass
+
+    print(f"observe (child cached)   : {per_call(lambda: child.observe(0.003), args.iterations):6.3f} us")
+    print(f"labels(...).observe      : {per_call(lambda: histogram.labels('/x').observe(0.003), args.iterations):6.3f} us")
+    print(f"with histogram.time(...) : {per_call(timed, args.iterations):6.3f} us")
+
+    requests = Histogram("bench_request_seconds", "bench", ("method", "route", "status"), registry=registry)
+    baseline = asyncio.run(measure_app(endpoint, args.iterations))
+    instrumented = asyncio.run(measure_app(MetricsMiddleware(endpoint, requests), args.iterations))
+    print(f"middleware overhead      : {instrumented - baseline:6.3f} us/request "
+          f"({baseline:.2f} -> {instrumented:.2f})")
+
+    for i in range(args.series):
+        requests.labels("GET", f"/route/{i}", "200").observe(0.01)
+    started = time.perf_counter()
+    text = registry.render()
+    print(f"render {args.series} series      : {(time.perf_counter() - started) * 1000:6.2f} ms "
+          f"({len(text) / 1024:.0f} KiB)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--series", type=int, default=200)
+    main(parser.parse_args())
@@ -0,0 +1,70 @@
+"""
+Benchmark chi phí của RateLimitMiddleware trên mỗi request.
+
+Gọi trực tiếp ASGI app tối giản (không qua mạng) có và không có middleware,
+với key theo IP, theo user (JWT, token cache hit) và khi có nhiều key khác nhau.
+
+Chạy:
+    python -m benchmarks.bench_rate_limit --requests 100000
+"""
+import argparse
+import asyncio
+import time
+
+from app.models.rate_limit import MemoryRateLimitBackend, RateLimitMiddleware, RateLimiter
+from app.models.security import SecurityUtils
+from app.schemas.security import RateLimitConfig
+
+
+async def endpoint(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+def make_scope(headers, client):
+    return {"type": "http", "method": "POST", "path": "/chat/", "headers": headers, "client": client}
+
+
+async def measure(app, scopes, requests: int) -> float:
+    started = time.perf_counter()
+    for i in range(requests):
+        await app(scopes[i % len(scopes)], receive, send)
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+async def main(args):
+    limiter = RateLimiter(MemoryRateLimitBackend(),
+                          RateLimitConfig(max_requests=10**9, window_seconds=args.window_seconds))
+    limited = RateLimitMiddleware(endpoint, limiter)
+    token = SecurityUtils.create_access_token({"sub": "bench-user", "email": "bench@example.com"})
+
+    cases = {
+        "ip, 1 key": [make_scope([], ("10.0.0.1", 1234))],
+        "jwt user, 1 key": [make_scope([(b"authorization", f"Bearer {token}".encode())], ("10.0.0.1", 1234))],
+        f"ip, {args.keys} keys": [make_scope([], (f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}", 1234))
+                                  for i in range(args.keys)],
+    }
+
+    baseline = await measure(endpoint, cases["ip, 1 key"], args.requests)
+    print(f"{'case':<22} {'us/request':>11} {'overhead us':>12}")
+    print(f"{'no middleware':<22} {baseline:>11.2f} {0:>12.2f}")
+    for label, scopes in cases.items():
+        cost = await measure(limited, scopes, args.requests)
+        print(f"{label:<22} {cost:>11.2f} {cost - baseline:>12.2f}")
+    print(f"tracked keys={len(limiter.backend)} evicted={limiter.backend.evicted}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=100000)
+    parser.add_argument("--keys", type=int, default=50000)
+    parser.add_argument("--window-seconds", type=int, default=60)
+    asyncio.run(main(parser.parse_args()))
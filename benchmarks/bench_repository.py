@@ -0,0 +1,75 @@
+"""
+Benchmark requests/s trên 1 worker: client Supabase sync (cũ) vs repository async (mới).
+
+Cả hai handler đều `async def` và gọi cùng một query `sessions` tới fake
+PostgREST có độ trễ cố định. Client sync chặn event loop nên các request
+chạy nối tiếp; repository async cho phép I/O chồng lên nhau.
+
+Chạy:
+    python -m benchmarks.bench_repository --latency-ms 20 --concurrency 50 --requests 500
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from benchmarks._server import FAKE_API_KEY, start_fake_postgrest
+
+
+def build_apps(url: str, user_id: str):
+    from supabase import create_client
+    from app.models.repository import repository
+
+    sync_client = create_client(url, FAKE_API_KEY)
+    before, after = FastAPI(), FastAPI()
+
+    @before.get("/sessions")
+    async def sessions_sync():
+        result = sync_client.table("sessions").select("*").eq("user_id", user_id).order("started_at", desc=True).execute()
+        return result.data
+
+    @after.get("/sessions")
+    async def sessions_async():
+        return await repository.list_sessions(user_id)
+
+    return before, after
+
+
+async def drive(app: FastAPI, total: int, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    remaining = iter(range(total))
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def worker():
+            for _ in remaining:
+                response = await client.get("/sessions")
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return total / (time.perf_counter() - started)
+
+
+async def main(args):
+    url, fake = start_fake_postgrest(latency_ms=args.latency_ms)
+    user = fake.state.store.insert("users", {"email": "bench@example.com", "password_hash": "x"})
+    for i in range(10):
+        fake.state.store.insert("sessions", {"user_id": user["id"], "session_title": f"Session {i}"})
+
+    before, after = build_apps(url, user["id"])
+    sync_rps = await drive(before, args.requests, args.concurrency)
+    async_rps = await drive(after, args.requests, args.concurrency)
+
+    print(f"latency={args.latency_ms}ms concurrency={args.concurrency} requests={args.requests}")
+    print(f"sync supabase client : {sync_rps:8.1f} req/s")
+    print(f"async repository     : {async_rps:8.1f} req/s  (x{async_rps / sync_rps:.1f})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,112 @@
+"""
+Benchmark retrieval: recall + độ trễ search của LocalVectorStore với HashingEmbedder.
+
+Corpus tổng hợp: mỗi đoạn gồm `--words` từ lấy theo phân phối Zipf từ bộ từ
+vựng giả; query là `--query-words` từ liên tiếp trích từ một đoạn ngẫu nhiên.
+Recall@k = tỉ lệ query có đoạn gốc nằm trong top-k.
+
+Chạy:
+    python -m benchmarks.bench_retrieval --sizes 10000 100000 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.models.embeddings import HashingEmbedder
+from benchmarks._server import percentile
+from app.models.vector_store import LocalVectorStore, PointStruct, SearchRequest, VectorParams
+
+BATCH = 10000
+
+
+def make_vocabulary(size: int, rng: np.random.Generator) -> np.ndarray:
+    syllables = np.array(["an", "ba", "cu", "do", "em", "ga", "hi", "kho", "la", "mi", "ngu", "ph", "qu", "ro",
+                          "sa", "th", "u", "vi", "xe", "y"])
+    parts = rng.integers(0, len(syllables), size=(size, 3))
+    return np.array(["".join(syllables[row]) + str(index) for index, row in enumerate(parts)])
+
+
+def chunk_words(rng: np.random.Generator, count: int, words: int, vocabulary: int) -> np.ndarray:
+    return (rng.zipf(1.3, size=(count, words)) - 1) % vocabulary
+
+
+def build(args, size: int, vocabulary: np.ndarray, rng: np.random.Generator):
+    embedder = HashingEmbedder(dim=args.dim)
+    store = LocalVectorStore()
+    store.create_collection("bench", vectors_config=VectorParams(size=args.dim))
+    corpus = np.empty((size, args.words), dtype=np.int32)
+
+    embed_seconds = 0.0
+    for start in range(0, size, BATCH):
+        ids = chunk_words(rng, min(BATCH, size - start), args.words, len(vocabulary))
+        corpus[start:start + len(ids)] = ids
+        texts = [" ".join(vocabulary[row]) for row in ids]
+        started = time.perf_counter()
+        vectors = embedder.embed(texts)
+        embed_seconds += time.perf_counter() - started
+        store.upsert("bench", points=[PointStruct(id=start + i, vector=vector) for i, vector in enumerate(vectors)])
+    return embedder, store, corpus, embed_seconds
+
+
+def evaluate(args, size: int, vocabulary: np.ndarray, rng: np.random.Generator) -> dict:
+    embedder, store, corpus, embed_seconds = build(args, size, vocabulary, rng)
+
+    targets = rng.integers(0, size, args.queries)
+    offsets = rng.integers(0, args.words - args.query_words + 1, args.queries)
+    queries = [" ".join(vocabulary[corpus[target, offset:offset + args.query_words]])
+               for target, offset in zip(targets, offsets)]
+
+    latencies = []
+    hits_at_1 = hits_at_k = 0
+    for query, target in zip(queries, targets):
+        started = time.perf_counter()
+        points = store.search("bench", query_vector=embedder.embed([query])[0], limit=args.k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        ids = [point.id for point in points]
+        hits_at_1 += bool(ids) and ids[0] == target
+        hits_at_k += target in ids
+
+    vectors = embedder.embed(queries)
+    started = time.perf_counter()
+    for start in range(0, len(queries), args.batch_size):
+        store.search_batch("bench", [SearchRequest(vector, limit=args.k)
+                                     for vector in vectors[start:start + args.batch_size]])
+    batch_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+    return {
+        "embed_per_sec": size / embed_seconds,
+        "index_mb": store.collections["bench"].vectors.nbytes / 2**20,
+        "recall_1": hits_at_1 / len(queries),
+        "recall_k": hits_at_k / len(queries),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "batch_ms": batch_ms,
+    }
+
+
+def main(args):
+    rng = np.random.default_rng(args.seed)
+    vocabulary = make_vocabulary(args.vocabulary, rng)
+    print(f"dim={args.dim} words/chunk={args.words} query_words={args.query_words} k={args.k} "
+          f"queries={args.queries} batch={args.batch_size}")
+    print(f"{'chunks':>9} {'embed/s':>9} {'index MB':>9} {'recall@1':>9} {f'recall@{args.k}':>9} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'batch ms/q':>11}")
+    for size in args.sizes:
+        result = evaluate(args, size, vocabulary, rng)
+        print(f"{size:>9} {result['embed_per_sec']:>9.0f} {result['index_mb']:>9.1f} {result['recall_1']:>9.3f} "
+              f"{result['recall_k']:>9.3f} {result['p50']:>8.2f} {result['p95']:>8.2f} {result['batch_ms']:>11.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--words", type=int, default=60)
+    parser.add_argument("--query-words", type=int, default=8)
+    parser.add_argument("--vocabulary", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
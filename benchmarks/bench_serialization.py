@@ -0,0 +1,116 @@
+"""
+Benchmark serialize lịch sử chat dài (mặc định 10k lượt hỏi/đáp).
+
+- `models + response_model`: đường cũ — dựng từng ConversationItem/Answer
+  (isoparse created_at), FastAPI validate lại theo response_model,
+  `serialize(mode="json")` rồi JSONResponse (`json.dumps`)
+- `... + orjson`: như trên nhưng render bằng ORJSONResponse (default
+  response class mới của app)
+- `TypeAdapter.to_json`: đường mới — dòng repository validate một lượt bằng
+  TypeAdapter rồi `dump_json` ra bytes
+
+Chạy:
+    python -m benchmarks.bench_serialization --turns 10000 --repeat 5
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from dateutil.parser import isoparse
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from app.models.serialization import FastSerializer
+from app.schemas.chat import Answer, ConversationHistory, ConversationItem
+
+
+def make_rows(turns: int) -> list:
+    """Dòng giống kết quả `list_conversation` (questions kèm answers lồng nhau)"""
+    started = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    rows = []
+    for turn in range(turns):
+        question_id = str(uuid.uuid4())
+        moment = started + timedelta(seconds=turn * 7, microseconds=turn)
+        rows.append({
+            "id": question_id,
+            "content": f"Câu hỏi số {turn}: điều khoản thanh toán trong hợp đồng là gì?",
+            "created_at": moment.isoformat(),
+            "answers": [{
+                "id": str(uuid.uuid4()),
+                "question_id": question_id,
+                "content": "Theo tài liệu, bên mua thanh toán trong vòng 30 ngày kể từ ngày nhận hàng. " * 3,
+                "generated_by": "chatbot",
+                "created_at": (moment + timedelta(seconds=2)).isoformat(),
+            }],
+        })
+    return rows
+
+
+def legacy_history(session_id: str, rows: list) -> ConversationHistory:
+    conversation = [
+        ConversationItem(
+            question_id=row["id"],
+            question=row["content"],
+            question_time=isoparse(row["created_at"]),
+            answers=[Answer(**answer) for answer in row.get("answers", [])],
+        )
+        for row in rows
+    ]
+    return ConversationHistory(session_id=session_id, conversation=conversation, next_cursor=None)
+
+
+async def legacy_body(field, session_id: str, rows: list, response_class) -> bytes:
+    content = await serialize_response(field=field, response_content=legacy_history(session_id, rows))
+    return response_class(content).body
+
+
+def fast_body(serializer: FastSerializer, session_id: str, rows: list) -> bytes:
+    return serializer.to_json({"session_id": session_id, "conversation": rows, "next_cursor": None})
+
+
+def best_of(repeat: int, fn) -> tuple:
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, result
+
+
+def main(args):
+    session_id = str(uuid.uuid4())
+    rows = make_rows(args.turns)
+    field = create_model_field("Response_bench", ConversationHistory, mode="serialization")
+    serializer = FastSerializer(ConversationHistory)
+    loop = asyncio.new_event_loop()
+
+    cases = [
+        ("models + response_model", lambda: loop.run_until_complete(legacy_body(field, session_id, rows, JSONResponse))),
+        ("models + response_model + orjson",
+         lambda: loop.run_until_complete(legacy_body(field, session_id, rows, ORJSONResponse))),
+        ("TypeAdapter.to_json", lambda: fast_body(serializer, session_id, rows)),
+    ]
+    print(f"turns={args.turns} repeat={args.repeat}")
+    results = {}
+    for name, fn in cases:
+        ms, body = best_of(args.repeat, fn)
+        results[name] = (ms, body)
+        print(f"{name:<34} {ms:8.1f} ms  {len(body) / 1e6:6.2f} MB  {args.turns / ms * 1000:10.0f} turns/s")
+    loop.close()
+
+    # Cùng một nội dung JSON (chỉ khác khoảng trắng giữa các đường render)
+    bodies = [json.loads(body) for _, body in results.values()]
+    assert all(body == bodies[0] for body in bodies), "output khác nhau giữa các đường serialize"
+    baseline = results["models + response_model"][0]
+    print(f"speedup: {baseline / results['TypeAdapter.to_json'][0]:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    main(parser.parse_args())
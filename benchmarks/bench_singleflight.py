@@ -0,0 +1,101 @@
+"""
+Benchmark single-flight: nhiều tab của cùng user đọc cùng lúc.
+
+App in-process (SUPABASE_FAKE, độ trễ `--latency-ms` mỗi lần gọi PostgREST).
+Mỗi vòng, `--users` user mỗi người mở `--tabs` tab, mỗi tab gọi đồng thời
+`GET /chat/sessions/` và `GET /chat/sessions/{id}/conversation`. Cache version
+và response cache xoá trước mỗi vòng để mọi request đều xuống tới repository.
+Chạy hai lượt: single-flight tắt / bật, in số lần gọi PostgREST, số lần gộp
+được và req/s.
+
+Chạy:
+    python -m benchmarks.bench_singleflight --users 20 --tabs 5 --rounds 10 --latency-ms 5
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+import httpx
+
+
+def postgrest_calls() -> int:
+    from app.models.repository import POSTGREST_SECONDS
+    return sum(sum(child.counts) for child in POSTGREST_SECONDS._children.values())
+
+
+async def create_user(client: httpx.AsyncClient, turns: int) -> tuple:
+    credentials = {"email": f"sf-{uuid.uuid4().hex[:8]}@example.com", "password": "bench-password"}
+    await client.post("/auth/register", json=credentials)
+    token = (await client.post("/auth/login", json=credentials)).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    user_id = (await client.get("/auth/me", headers=headers)).json()["id"]
+    session_id = (await client.post("/chat/sessions/", json={"user_id": user_id}, headers=headers)).json()["id"]
+    for turn in range(turns):
+        await client.post("/chat/", json={"session_id": session_id, "question": f"Câu hỏi {turn}?"}, headers=headers)
+    return headers, session_id
+
+
+async def run(client: httpx.AsyncClient, users: list, args) -> tuple:
+    from app.models.conditional import response_cache
+    from app.models.repository import repository
+
+    requests = 0
+    calls = postgrest_calls()
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        repository.versions.clear()
+        repository.session_owners.clear()
+        response_cache.clear()
+        responses = await asyncio.gather(*(
+            client.get(url, headers=headers)
+            for headers, session_id in users
+            for _ in range(args.tabs)
+            for url in ("/chat/sessions/", f"/chat/sessions/{session_id}/conversation")
+        ))
+        for response in responses:
+            response.raise_for_status()
+        requests += len(responses)
+    return requests, postgrest_calls() - calls, time.perf_counter() - started
+
+
+async def main(args):
+    # Cấu hình phải có trước khi import app
+    os.environ["SUPABASE_FAKE"] = "true"
+    os.environ["SUPABASE_FAKE_LATENCY_MS"] = str(args.latency_ms)
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    upload_dir = None if "UPLOAD_DIR" in os.environ else tempfile.mkdtemp(prefix="bench-sf-")
+    if upload_dir:
+        os.environ["UPLOAD_DIR"] = upload_dir
+    from app.main import app
+    from app.models.repository import repository
+    from app.models.singleflight import SingleFlight
+
+    try:
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+                users = [await create_user(client, args.turns) for _ in range(args.users)]
+                print(f"users={args.users} tabs={args.tabs} rounds={args.rounds} latency_ms={args.latency_ms}")
+                for label, single_flight in (("tắt", None), ("bật", SingleFlight())):
+                    repository.single_flight = single_flight
+                    requests, calls, elapsed = await run(client, users, args)
+                    saved = single_flight.coalesced if single_flight is not None else 0
+                    print(f"single-flight {label}: {requests} requests, {calls} lần gọi PostgREST "
+                          f"({calls / requests:.2f}/request), gộp {saved}, {requests / elapsed:.1f} req/s")
+    finally:
+        if upload_dir:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--tabs", type=int, default=5)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=5, help="Số lượt chat có sẵn trong session của mỗi user")
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    asyncio.run(main(parser.parse_args()))
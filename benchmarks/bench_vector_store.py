@@ -0,0 +1,132 @@
+"""
+Benchmark lưu trữ vector: float32 trên heap (LocalVectorStore) so với
+MmapVectorStore lượng tử hoá int8 / float16.
+
+Vector ngẫu nhiên (Gaussian, chuẩn hoá) — trường hợp khó cho lượng tử hoá.
+Mỗi store được đo trong một process riêng: RSS ẩn danh (heap, riêng từng
+worker) và RSS file (page cache, các worker dùng chung) sau khi search,
+quy đổi ra MB cho mỗi triệu đoạn; độ trễ search; overlap@k so với float32.
+
+Chạy:
+    python -m benchmarks.bench_vector_store --sizes 100000 1000000
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks._server import percentile
+
+BATCH = 50000
+
+
+def rss_mb() -> dict:
+    with open("/proc/self/status") as status:
+        fields = dict(line.split(":", 1) for line in status)
+    return {key: int(fields[key].split()[0]) / 1024 for key in ("RssAnon", "RssFile")}
+
+
+def build_mmap(directory: Path, vectors: np.ndarray, quantization: str):
+    from app.models.mmap_vector_store import MmapVectorStore
+    from app.models.vector_store import PointStruct, VectorParams
+
+    store = MmapVectorStore(directory, quantization)
+    store.create_collection("bench", vectors_config=VectorParams(size=vectors.shape[1]))
+    for start in range(0, len(vectors), BATCH):
+        store.upsert("bench", points=[PointStruct(id=start + i, vector=vector)
+                                      for i, vector in enumerate(vectors[start:start + BATCH])])
+    collection = store.collections["bench"]
+    while collection._compacting:
+        time.sleep(0.1)
+    collection.compact()
+
+
+def measure_single(kind: str, workdir: Path, k: int):
+    from app.models.mmap_vector_store import MmapVectorStore
+    from app.models.vector_store import LocalVectorStore, PointStruct, VectorParams
+
+    queries = np.load(workdir / "queries.npy")
+    before = rss_mb()
+    if kind == "float32":
+        vectors = np.load(workdir / "vectors.npy")
+        store = LocalVectorStore()
+        store.create_collection("bench", vectors_config=VectorParams(size=vectors.shape[1]))
+        for start in range(0, len(vectors), BATCH):
+            store.upsert("bench", points=[PointStruct(id=start + i, vector=vector)
+                                          for i, vector in enumerate(vectors[start:start + BATCH])])
+        del vectors
+    else:
+        store = MmapVectorStore(workdir / kind, kind)
+
+    results, latencies = [], []
+    for query in queries:
+        started = time.perf_counter()
+        points = store.search("bench", query_vector=query, limit=k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        results.append([point.id for point in points])
+    after = rss_mb()
+    print(json.dumps({
+        "anon_mb": after["RssAnon"] - before["RssAnon"],
+        "file_mb": after["RssFile"] - before["RssFile"],
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "results": results,
+    }))
+
+
+def main(args):
+    rng = np.random.default_rng(args.seed)
+    print(f"dim={args.dim} k={args.k} queries={args.queries}")
+    print(f"{'chunks':>9} {'store':<8} {'disk MB/M':>10} {'anon MB/M':>10} {'file MB/M':>10} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {f'overlap@{args.k}':>11}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            workdir = Path(tmp)
+            vectors = rng.standard_normal((size, args.dim), dtype=np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            np.save(workdir / "vectors.npy", vectors)
+            np.save(workdir / "queries.npy", rng.standard_normal((args.queries, args.dim), dtype=np.float32))
+            for quantization in ("int8", "float16"):
+                build_mmap(workdir / quantization, vectors, quantization)
+            del vectors
+
+            baseline = None
+            per_million = 1e6 / size
+            for kind in ("float32", "int8", "float16"):
+                output = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_vector_store", "--single", kind,
+                     "--workdir", str(workdir), "--k", str(args.k)],
+                    capture_output=True, text=True, check=True,
+                ).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                if kind == "float32":
+                    baseline = result["results"]
+                    disk_mb = 0.0
+                else:
+                    disk_mb = sum(path.stat().st_size for path in (workdir / kind).rglob("*")
+                                  if path.suffix in (".codes", ".scales")) / 2**20
+                overlap = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(result["results"], baseline)])
+                print(f"{size:>9} {kind:<8} {disk_mb * per_million:>10.1f} {result['anon_mb'] * per_million:>10.1f} "
+                      f"{result['file_mb'] * per_million:>10.1f} {result['p50']:>8.2f} {result['p95']:>8.2f} "
+                      f"{overlap:>11.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--single", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parsed = parser.parse_args()
+    if parsed.single:
+        measure_single(parsed.single, Path(parsed.workdir), parsed.k)
+    else:
+        main(parsed)
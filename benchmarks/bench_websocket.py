@@ -0,0 +1,201 @@
+"""
+Benchmark kênh chat WebSocket (`/chat/ws`): bộ nhớ mỗi kết nối và độ trễ.
+
+Chạy app thật (uvicorn, một worker, SUPABASE_FAKE) trong process con rồi:
+1. Mở `--idle` kết nối đã xác thực, không gửi gì -> RSS của worker tăng thêm
+   bao nhiêu cho mỗi kết nối
+2. `--active` kết nối, mỗi kết nối gửi `--turns` lượt chat, `--multiplex`
+   lượt song song trên các session khác nhau -> first token / done p50/p95
+   và RSS lúc tải (cộng dồn với các kết nối idle vẫn mở)
+
+Chạy:
+    python -m benchmarks.bench_websocket --idle 2000 --active 200 --turns 3 --multiplex 2
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+import websockets
+
+from benchmarks._server import free_port, percentile
+
+STATS_TOKEN = uuid.uuid4().hex
+
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def start_server(args, port: int, upload_dir: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "SUPABASE_FAKE": "true",
+        "SUPABASE_FAKE_LATENCY_MS": str(args.latency_ms),
+        "RATE_LIMIT_ENABLED": "false",
+        "STATS_TOKEN": STATS_TOKEN,
+        "UPLOAD_DIR": upload_dir,
+        "WS_MAX_CONNECTIONS": str(args.idle + args.active + 100),
+        "LLM_MAX_CONCURRENCY": str(args.llm_concurrency),
+        "LLM_MAX_CONCURRENCY_PER_USER": str(args.llm_concurrency),
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--ws", args.ws, "--ws-ping-interval", "0", "--backlog", "4096"],
+        env=env, stdout=subprocess.DEVNULL,
+    )
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        if time.monotonic() > deadline:
+            raise TimeoutError("server không lên")
+        await asyncio.sleep(0.1)
+
+
+async def open_socket(url: str, token: str):
+    ws = await websockets.connect(url, additional_headers={"Authorization": f"Bearer {token}"},
+                                  ping_interval=None, max_queue=None)
+    ready = json.loads(await ws.recv())
+    assert ready["type"] == "ready", ready
+    return ws
+
+
+async def open_many(url: str, token: str, count: int, concurrency: int = 100) -> list:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            return await open_socket(url, token)
+
+    return await asyncio.gather(*(one() for _ in range(count)))
+
+
+async def active_socket(ws, sessions: list, turns: int, first_token: list, done: list, errors: list):
+    """`turns` vòng, mỗi vòng gửi song song một câu hỏi cho mỗi session rồi chờ đủ `done`"""
+    for turn in range(turns):
+        started = {}
+        for session_id in sessions:
+            request_id = uuid.uuid4().hex[:8]
+            started[request_id] = time.perf_counter()
+            await ws.send(json.dumps({"type": "chat", "id": request_id, "session_id": session_id,
+                                      "question": f"Câu hỏi {turn} về điều khoản thanh toán?"}))
+        seen = set()
+        while started:
+            message = json.loads(await ws.recv())
+            request_id = message.get("id")
+            if request_id not in started:
+                continue
+            elapsed = (time.perf_counter() - started[request_id]) * 1000
+            if message["type"] == "token" and request_id not in seen:
+                seen.add(request_id)
+                first_token.append(elapsed)
+            elif message["type"] == "done":
+                done.append(elapsed)
+                del started[request_id]
+            elif message["type"] == "error":
+                errors.append(message)
+                del started[request_id]
+
+
+async def main(args):
+    port = free_port()
+    upload_dir = tempfile.mkdtemp(prefix="bench-ws-")
+    server = start_server(args, port, upload_dir)
+    base_url = f"http://127.0.0.1:{port}"
+    ws_url = f"ws://127.0.0.1:{port}/chat/ws"
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+            await wait_ready(client)
+            credentials = {"email": f"ws-{uuid.uuid4().hex[:8]}@example.com", "password": "bench-password"}
+            await client.post("/auth/register", json=credentials)
+            token = (await client.post("/auth/login", json=credentials)).json()["access_token"]
+            headers = {"Authorization": f"Bearer {token}"}
+            user_id = (await client.get("/auth/me", headers=headers)).json()["id"]
+            sessions = [
+                (await client.post("/chat/sessions/", json={"user_id": user_id}, headers=headers)).json()["id"]
+                for _ in range(args.active * args.multiplex)
+            ]
+
+            # Khởi động: nạp code đường WebSocket trước khi lấy mốc RSS
+            warm = await open_socket(ws_url, token)
+            await active_socket(warm, sessions[:1], 1, [], [], [])
+            await warm.close()
+            await asyncio.sleep(0.5)
+            baseline = rss_mb(server.pid)
+
+            started = time.perf_counter()
+            idle = await open_many(ws_url, token, args.idle)
+            connect_seconds = time.perf_counter() - started
+            await asyncio.sleep(1.0)
+            idle_rss = rss_mb(server.pid)
+            per_idle_kb = (idle_rss - baseline) * 1024 / args.idle if args.idle else 0.0
+            print(f"idle: {args.idle} sockets mở trong {connect_seconds:.2f}s, "
+                  f"RSS {baseline:.1f} -> {idle_rss:.1f} MB = {per_idle_kb:.1f} KB/kết nối")
+
+            active = await open_many(ws_url, token, args.active)
+            first_token, done, errors = [], [], []
+            started = time.perf_counter()
+            sampler_peak = idle_rss
+
+            async def sample():
+                nonlocal sampler_peak
+                while True:
+                    sampler_peak = max(sampler_peak, rss_mb(server.pid))
+                    await asyncio.sleep(0.05)
+
+            sampler = asyncio.create_task(sample())
+            await asyncio.gather(*(
+                active_socket(ws, sessions[i * args.multiplex:(i + 1) * args.multiplex],
+                              args.turns, first_token, done, errors)
+                for i, ws in enumerate(active)
+            ))
+            elapsed = time.perf_counter() - started
+            sampler.cancel()
+            total_sockets = args.idle + args.active
+            print(f"active: {args.active} sockets x {args.multiplex} session x {args.turns} lượt = "
+                  f"{len(done)} done, {len(errors)} lỗi trong {elapsed:.2f}s ({len(done) / elapsed:.1f} lượt/s)")
+            print(f"  first token p50={percentile(first_token, 50):.1f} ms p95={percentile(first_token, 95):.1f} ms")
+            print(f"  done        p50={percentile(done, 50):.1f} ms p95={percentile(done, 95):.1f} ms "
+                  f"p99={percentile(done, 99):.1f} ms")
+            print(f"  RSS đỉnh {sampler_peak:.1f} MB với {total_sockets} sockets "
+                  f"= {(sampler_peak - baseline) * 1024 / total_sockets:.1f} KB/kết nối (gồm buffer lúc tải)")
+            if errors:
+                print(f"  lỗi đầu tiên: {errors[0]}")
+            print(json.dumps((await client.get("/stats", headers={"X-Stats-Token": STATS_TOKEN})).json()["websocket"]))
+
+            await asyncio.gather(*(ws.close() for ws in idle + active), return_exceptions=True)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--idle", type=int, default=2000)
+    parser.add_argument("--active", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--multiplex", type=int, default=2, help="Số session chat song song trên mỗi kết nối")
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    parser.add_argument("--llm-concurrency", type=int, default=64)
+    parser.add_argument("--ws", default="websockets-sansio",
+                        help="Implementation WebSocket của uvicorn (auto|websockets|websockets-sansio)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,40 @@
+-- Lưu một lượt chat (question + answer) trong một round trip: POST /rest/v1/rpc/chat_turn
+-- Kiểm tra quyền sở hữu session trong cùng transaction; lỗi trả về HTTP 404/403 qua PostgREST.
+create or replace function public.chat_turn(
+    p_session_id uuid,
+    p_user_id uuid,
+    p_question text,
+    p_answer text,
+    p_generated_by text default 'chatbot'
+) returns json
+language plpgsql
+as $$
+declare
+    v_owner uuid;
+    v_question public.questions%rowtype;
+    v_answer public.answers%rowtype;
+begin
+    select user_id into v_owner from public.sessions where id = p_session_id;
+    if not found then
+        raise sqlstate 'PT404' using message = 'Session không tồn tại';
+    end if;
+    if v_owner <> p_user_id then
+        raise sqlstate 'PT403' using message = 'Không có quyền truy cập session này';
+    end if;
+
+    insert into public.questions (session_id, content)
+    values (p_session_id, p_question)
+    returning * into v_question;
+
+    insert into public.answers (question_id, content, generated_by)
+    values (v_question.id, p_answer, p_generated_by)
+    returning * into v_answer;
+
+    return json_build_object(
+        'question_id', v_question.id,
+        'answer_id', v_answer.id,
+        'created_at', v_question.created_at,
+        'answer_created_at', v_answer.created_at
+    );
+end;
+$$;
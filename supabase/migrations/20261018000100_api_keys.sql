@@ -0,0 +1,15 @@
+-- API key cho client máy: chỉ lưu sha256(key), key gốc chỉ trả về một lần lúc tạo.
+-- last_used được app gom lại và ghi theo lô (PATCH id=in.(...)), không ghi mỗi request.
+create table if not exists public.api_keys (
+    id uuid primary key default gen_random_uuid(),
+    user_id uuid not null references public.users (id) on delete cascade,
+    key_hash text not null unique,
+    key_prefix text not null,
+    name text,
+    is_active boolean not null default true,
+    rate_limit jsonb,
+    created_at timestamptz not null default now(),
+    last_used timestamptz
+);
+
+create index if not exists api_keys_user_id_idx on public.api_keys (user_id, created_at);
@@ -0,0 +1,64 @@
+-- Ghi theo lô cho write-behind (app/models/write_behind.py): POST /rest/v1/rpc/apply_deferred_updates
+-- p_rows = [{"id": ..., "<cột>": <giá trị>, ...}, ...]; mỗi dòng có thể đổi các cột khác nhau.
+-- Chỉ nhận các bảng và cột trong danh sách cho phép (users.last_login, api_keys.last_used);
+-- trả về số dòng đã cập nhật.
+create or replace function public.apply_deferred_updates(
+    p_table text,
+    p_rows jsonb
+) returns integer
+language plpgsql
+as $$
+declare
+    v_columns text[];
+    v_invalid text;
+    v_group record;
+    v_sets text;
+    v_updated integer;
+    v_total integer := 0;
+begin
+    v_columns := case p_table
+        when 'users' then array['last_login']
+        when 'api_keys' then array['last_used']
+    end;
+    if v_columns is null then
+        raise sqlstate 'PT400' using message = format('Bảng %s không hỗ trợ write-behind', p_table);
+    end if;
+
+    -- Kiểm tra cột của cả lô một lần, trước khi ghi
+    select string_agg(distinct key, ', ')
+    into v_invalid
+    from jsonb_array_elements(p_rows) as row_data(value), jsonb_object_keys(row_data.value) as key
+    where key <> 'id' and key <> all(v_columns);
+
+    if v_invalid is not null then
+        raise sqlstate 'PT400' using message = format('Cột %s không hỗ trợ write-behind', v_invalid);
+    end if;
+
+    -- Mỗi tập cột thay đổi một câu UPDATE cho mọi dòng của nó (write-behind gộp theo id
+    -- nên mỗi id chỉ xuất hiện một lần trong lô)
+    for v_group in
+        select keys, jsonb_agg(value) as group_rows
+        from (
+            select value, array(
+                select key from jsonb_object_keys(value) as key where key <> 'id' order by key
+            ) as keys
+            from jsonb_array_elements(p_rows)
+        ) as changed
+        where cardinality(keys) > 0
+        group by keys
+    loop
+        select string_agg(format('%I = r.%I', key, key), ', ')
+        into v_sets
+        from unnest(v_group.keys) as key;
+
+        execute format(
+            'update public.%I t set %s from jsonb_populate_recordset(null::public.%I, $1) r where t.id = r.id',
+            p_table, v_sets, p_table
+        ) using v_group.group_rows;
+        get diagnostics v_updated = row_count;
+        v_total := v_total + v_updated;
+    end loop;
+
+    return v_total;
+end;
+$$;
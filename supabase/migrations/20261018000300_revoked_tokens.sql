@@ -0,0 +1,11 @@
+-- Token đã thu hồi (logout) theo jti, giữ tới khi token hết hạn (exp, epoch giây).
+-- Các worker poll các dòng mới theo revoked_at; dòng hết hạn được app xoá định kỳ.
+create table if not exists public.revoked_tokens (
+    jti text primary key,
+    user_id uuid references public.users (id) on delete cascade,
+    exp bigint not null,
+    revoked_at timestamptz not null default now()
+);
+
+create index if not exists revoked_tokens_revoked_at_idx on public.revoked_tokens (revoked_at);
+create index if not exists revoked_tokens_exp_idx on public.revoked_tokens (exp);
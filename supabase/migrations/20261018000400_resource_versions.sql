@@ -0,0 +1,111 @@
+-- Version cho ETag / conditional GET (app/models/conditional.py).
+-- sessions.version: tăng khi session hoặc question/answer của nó thay đổi (lịch sử chat).
+-- users.sessions_version: tăng khi danh sách session của user thay đổi (tạo/sửa/xoá session).
+-- Trigger nên mọi đường ghi (RPC chat_turn, PATCH/DELETE qua PostgREST...) đều tăng version.
+alter table public.sessions add column if not exists version bigint not null default 1;
+alter table public.users add column if not exists sessions_version bigint not null default 1;
+
+create or replace function public.bump_session_version() returns trigger
+language plpgsql
+as $$
+declare
+    v_row record;
+    v_session_id uuid;
+begin
+    if tg_op = 'DELETE' then
+        v_row := old;
+    else
+        v_row := new;
+    end if;
+
+    if tg_table_name = 'questions' then
+        v_session_id := v_row.session_id;
+    else
+        select session_id into v_session_id from public.questions where id = v_row.question_id;
+    end if;
+
+    update public.sessions set version = version + 1 where id = v_session_id;
+    return null;
+end;
+$$;
+
+drop trigger if exists questions_bump_session_version on public.questions;
+create trigger questions_bump_session_version
+    after insert or update or delete on public.questions
+    for each row execute function public.bump_session_version();
+
+drop trigger if exists answers_bump_session_version on public.answers;
+create trigger answers_bump_session_version
+    after insert or update or delete on public.answers
+    for each row execute function public.bump_session_version();
+
+-- Sửa cột khác `version` của session: tăng cả version của session lẫn danh sách session của user
+create or replace function public.bump_sessions_list_version() returns trigger
+language plpgsql
+as $$
+begin
+    if tg_op = 'UPDATE' then
+        if (to_jsonb(new) - 'version') is not distinct from (to_jsonb(old) - 'version') then
+            return new;
+        end if;
+        new.version := old.version + 1;
+    end if;
+
+    update public.users set sessions_version = sessions_version + 1
+    where id = case when tg_op = 'DELETE' then old.user_id else new.user_id end;
+
+    if tg_op = 'DELETE' then
+        return old;
+    end if;
+    return new;
+end;
+$$;
+
+drop trigger if exists sessions_bump_list_version on public.sessions;
+create trigger sessions_bump_list_version
+    before insert or update or delete on public.sessions
+    for each row execute function public.bump_sessions_list_version();
+
+-- chat_turn trả thêm version mới của session để worker ghi nhận ngay (không cần đọc lại)
+create or replace function public.chat_turn(
+    p_session_id uuid,
+    p_user_id uuid,
+    p_question text,
+    p_answer text,
+    p_generated_by text default 'chatbot'
+) returns json
+language plpgsql
+as $$
+declare
+    v_owner uuid;
+    v_question public.questions%rowtype;
+    v_answer public.answers%rowtype;
+    v_version bigint;
+begin
+    select user_id into v_owner from public.sessions where id = p_session_id;
+    if not found then
+        raise sqlstate 'PT404' using message = 'Session không tồn tại';
+    end if;
+    if v_owner <> p_user_id then
+        raise sqlstate 'PT403' using message = 'Không có quyền truy cập session này';
+    end if;
+
+    insert into public.questions (session_id, content)
+    values (p_session_id, p_question)
+    returning * into v_question;
+
+    insert into public.answers (question_id, content, generated_by)
+    values (v_question.id, p_answer, p_generated_by)
+    returning * into v_answer;
+
+    select version into v_version from public.sessions where id = p_session_id;
+
+    return json_build_object(
+        'question_id', v_question.id,
+        'answer_id', v_answer.id,
+        'created_at', v_question.created_at,
+        'answer_created_at', v_answer.created_at,
+        'version', v_version
+    );
+end;
+$$;
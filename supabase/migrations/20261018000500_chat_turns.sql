@@ -0,0 +1,53 @@
+-- Lưu nhiều lượt chat của một session trong một round trip: POST /rest/v1/rpc/chat_turns
+-- p_turns = [{"question": ..., "answer": ..., "generated_by": ...}, ...]; question và answer
+-- được insert theo lô (mỗi bảng một câu lệnh), cùng một transaction: lưu hết hoặc không lưu gì.
+-- created_at tăng dần theo thứ tự trong lô để lịch sử (order by created_at, id) giữ đúng thứ tự.
+create or replace function public.chat_turns(
+    p_session_id uuid,
+    p_user_id uuid,
+    p_turns jsonb
+) returns json
+language plpgsql
+as $$
+declare
+    v_owner uuid;
+    v_now timestamptz := now();
+    v_ids uuid[];
+    v_turns json;
+begin
+    select user_id into v_owner from public.sessions where id = p_session_id;
+    if not found then
+        raise sqlstate 'PT404' using message = 'Session không tồn tại';
+    end if;
+    if v_owner <> p_user_id then
+        raise sqlstate 'PT403' using message = 'Không có quyền truy cập session này';
+    end if;
+
+    select array_agg(gen_random_uuid()) into v_ids from jsonb_array_elements(p_turns);
+
+    insert into public.questions (id, session_id, content, created_at)
+    select v_ids[t.position], p_session_id, t.value->>'question', v_now + t.position * interval '1 microsecond'
+    from jsonb_array_elements(p_turns) with ordinality as t(value, position);
+
+    insert into public.answers (question_id, content, generated_by, created_at)
+    select v_ids[t.position], t.value->>'answer', coalesce(t.value->>'generated_by', 'chatbot'),
+           v_now + t.position * interval '1 microsecond'
+    from jsonb_array_elements(p_turns) with ordinality as t(value, position);
+
+    select json_agg(json_build_object(
+        'question_id', q.id,
+        'answer_id', a.id,
+        'created_at', q.created_at,
+        'answer_created_at', a.created_at
+    ) order by q.created_at)
+    into v_turns
+    from public.questions q
+    join public.answers a on a.question_id = q.id
+    where q.id = any(v_ids);
+
+    return json_build_object(
+        'turns', coalesce(v_turns, '[]'::json),
+        'version', (select version from public.sessions where id = p_session_id)
+    );
+end;
+$$;
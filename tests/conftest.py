@@ -0,0 +1,51 @@
+import asyncio
+import os
+import tempfile
+
+import httpx
+import pytest
+
+# Cấu hình phải có trước khi import app: PostgREST giả lập in-process, không cần Supabase
+os.environ.setdefault("SUPABASE_FAKE", "true")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+os.environ.setdefault("UPLOAD_DIR", tempfile.mkdtemp(prefix="tests-uploads-"))
+
+
+@pytest.fixture
+def fake_repository():
+    """(repository, store) chạy trên một fake PostgREST riêng cho mỗi test"""
+    from app.models.fake_postgrest import create_fake_postgrest
+    from app.models.repository import SupabaseRepository
+
+    fake = create_fake_postgrest()
+    client = httpx.AsyncClient(base_url="http://fake-supabase/rest/v1", transport=httpx.ASGITransport(app=fake))
+    return SupabaseRepository(client=client), fake.state.store
+
+
+@pytest.fixture
+def api(fake_repository):
+    """
+    Gọi app qua ASGI trên repository giả (không chạy lifespan).
+    `api("GET", url, user_id=...)` trả về httpx.Response; `api.overrides` để thay thêm dependency.
+    """
+    from app.main import app
+    from app.models.repository import get_repository
+    from app.models.security import get_current_user_or_api_key
+    from app.schemas.security import TokenData
+
+    repo, _ = fake_repository
+
+    def call(method: str, url: str, user_id: str = "owner", **kwargs) -> httpx.Response:
+        app.dependency_overrides[get_repository] = lambda: repo
+        app.dependency_overrides[get_current_user_or_api_key] = lambda: TokenData(user_id=user_id)
+
+        async def send():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.request(method, url, **kwargs)
+
+        return asyncio.run(send())
+
+    call.overrides = app.dependency_overrides
+    yield call
+    app.dependency_overrides.clear()
@@ -0,0 +1,168 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app.models.answer_cache import CACHE_GENERATED_BY, AnswerCache, get_answer_cache
+
+CONTEXT = ["Sản phẩm được bảo hành 12 tháng."]
+
+
+def test_exact_tier_ignores_case_diacritics_and_punctuation():
+    cache = AnswerCache(enabled=True)
+    cache.put("u1", "Thời hạn bảo hành là bao lâu?", CONTEXT, "12 tháng")
+
+    assert cache.get("u1", "  thoi HAN bao hanh la bao lau ", CONTEXT) == "12 tháng"
+    assert cache.stats()["exact_hits"] == 1
+
+
+def test_different_documents_do_not_share_answers():
+    cache = AnswerCache(enabled=True)
+    cache.put("u1", "Thời hạn bảo hành?", CONTEXT, "12 tháng")
+
+    assert cache.get("u2", "Thời hạn bảo hành?", ["Tài liệu khác."]) is None
+    assert cache.get("u2", "Thời hạn bảo hành?", []) is None
+
+
+def test_opted_out_users_neither_read_nor_write():
+    cache = AnswerCache(enabled=True, opt_out=["private"])
+    cache.put("private", "Câu hỏi?", CONTEXT, "trả lời")
+    assert len(cache) == 0
+
+    cache.put("u1", "Câu hỏi?", CONTEXT, "trả lời")
+    assert cache.get("private", "Câu hỏi?", CONTEXT) is None
+    assert cache.stats()["skipped"] == 1
+
+
+def test_expired_entries_are_misses():
+    cache = AnswerCache(enabled=True, ttl=0)
+    cache.put("u1", "Câu hỏi?", CONTEXT, "trả lời")
+
+    assert cache.get("u1", "Câu hỏi?", CONTEXT) is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_evicts_least_recently_used_when_over_budget():
+    cache = AnswerCache(enabled=True, max_bytes=1500)
+    cache.put("u1", "một", CONTEXT, "a" * 200)
+    cache.put("u1", "hai", CONTEXT, "b" * 200)
+    assert cache.get("u1", "một", CONTEXT) is not None
+    cache.put("u1", "ba", CONTEXT, "c" * 200)
+
+    assert cache.get("u1", "hai", CONTEXT) is None
+    assert cache.get("u1", "một", CONTEXT) is not None
+    assert cache.stats()["evictions"] == 1
+    assert cache.bytes <= cache.max_bytes
+
+
+@pytest.fixture
+def near_cache():
+    cache = AnswerCache(enabled=True, near_duplicates=True, similarity=0.7)
+    cache.put("u1", "Chính sách bảo hành sản phẩm", CONTEXT, "12 tháng")
+    return cache
+
+
+def test_near_tier_matches_filler_word_variants(near_cache):
+    assert near_cache.get("u1", "Cho tôi hỏi chính sách bảo hành sản phẩm với ạ", CONTEXT) == "12 tháng"
+    assert near_cache.stats()["near_hits"] == 1
+
+
+def test_near_tier_uses_jaccard_threshold_not_exact_word_sets(near_cache):
+    # Thêm một từ nội dung: tập từ khác nhưng Jaccard 9/11 >= 0.7
+    assert near_cache.get("u1", "Chính sách bảo hành sản phẩm mới", CONTEXT) == "12 tháng"
+
+
+def test_near_tier_rejects_questions_below_threshold(near_cache):
+    assert near_cache.get("u1", "Chính sách bảo hiểm sản phẩm", CONTEXT) is None
+    assert near_cache.get("u1", "Chính sách đổi trả", CONTEXT) is None
+    assert near_cache.get("u1", "Cho tôi hỏi chính sách bảo hành sản phẩm", ["Tài liệu khác."]) is None
+    assert near_cache.stats()["near_hits"] == 0
+
+
+def test_near_tier_is_off_by_default():
+    cache = AnswerCache(enabled=True)
+    cache.put("u1", "Chính sách bảo hành sản phẩm", CONTEXT, "12 tháng")
+    assert cache.get("u1", "Cho tôi hỏi chính sách bảo hành sản phẩm", CONTEXT) is None
+
+
+# Chat stream dùng chung cache với POST /chat/
+class CountingScheduler:
+    backend = SimpleNamespace(name="fake")
+
+    def __init__(self):
+        self.streams = 0
+
+    async def stream(self, question, user_id, context):
+        self.streams += 1
+        for token in ("Mười ", "hai ", "tháng"):
+            yield token
+
+
+class EmptyRetriever:
+    def retrieve(self, user_id, question):
+        return []
+
+
+def sse_events(text: str):
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_chat_stream_reads_and_fills_answer_cache(fake_repository, api):
+    from app.models.generation import get_generation_scheduler
+    from app.models.retrieval import get_retriever
+
+    _, store = fake_repository
+    session_id = store.insert("sessions", {"user_id": "owner", "session_title": "t"})["id"]
+    scheduler = CountingScheduler()
+    cache = AnswerCache(enabled=True)
+    api.overrides[get_generation_scheduler] = lambda: scheduler
+    api.overrides[get_retriever] = EmptyRetriever
+    api.overrides[get_answer_cache] = lambda: cache
+
+    body = {"session_id": session_id, "question": "Bảo hành bao lâu?"}
+    first = sse_events(api("POST", "/chat/stream", json=body).text)
+    second = sse_events(api("POST", "/chat/stream", json={**body, "question": "bao hanh bao lau"}).text)
+
+    assert scheduler.streams == 1
+    assert [event for event, _ in first] == ["token", "token", "token", "done"]
+    assert second == [("token", {"delta": "Mười hai tháng"}), ("done", second[-1][1])]
+    assert second[-1][1]["answer"] == "Mười hai tháng"
+    assert sorted(answer["generated_by"] for answer in store.table("answers").values()) == [
+        CACHE_GENERATED_BY, "fake",
+    ]
+
+
+def test_websocket_chat_reads_and_fills_answer_cache(fake_repository, api):
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+    from app.models.generation import get_generation_scheduler
+    from app.models.repository import get_repository
+    from app.models.retrieval import get_retriever
+    from app.models.security import SecurityUtils
+
+    repo, store = fake_repository
+    session_id = store.insert("sessions", {"user_id": "owner", "session_title": "t"})["id"]
+    scheduler = CountingScheduler()
+    cache = AnswerCache(enabled=True)
+    api.overrides[get_repository] = lambda: repo
+    api.overrides[get_generation_scheduler] = lambda: scheduler
+    api.overrides[get_retriever] = EmptyRetriever
+    api.overrides[get_answer_cache] = lambda: cache
+    token = SecurityUtils.create_access_token({"sub": "owner", "email": "owner@example.com"})
+
+    deltas = []
+    with TestClient(app).websocket_connect("/chat/ws", headers={"Authorization": f"Bearer {token}"}) as ws:
+        assert ws.receive_json()["type"] == "ready"
+        for request_id in ("1", "2"):
+            ws.send_json({"type": "chat", "id": request_id, "session_id": session_id, "question": "Bảo hành?"})
+            while (message := ws.receive_json())["type"] == "token":
+                deltas.append(message["delta"])
+            assert message["type"] == "done"
+
+    assert scheduler.streams == 1
+    assert deltas == ["Mười ", "hai ", "tháng", "Mười hai tháng"]
@@ -0,0 +1,122 @@
+import asyncio
+import hashlib
+import threading
+
+import pytest
+
+from app.models import ingestion as ingestion_module
+from app.models.blob_store import BlobStore, QuotaExceeded, ReceivedUpload
+from app.models.ingestion import IngestionJob, IngestionQueue
+
+
+def upload(data: bytes) -> ReceivedUpload:
+    return ReceivedUpload(hashlib.sha256(data).hexdigest(), data)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(tmp_path, quota_bytes=1000, cache_max_bytes=100)
+
+
+def refcount(store: BlobStore, blob_id: str):
+    row = store.db.execute("select refcount from blobs where id = ?", (blob_id,)).fetchone()
+    return row[0] if row else None
+
+
+def test_same_content_is_stored_once(store):
+    first = store.commit("alice", "a.txt", "text/plain", upload(b"hello"))
+    second = store.commit("bob", "b.txt", "text/plain", upload(b"hello"))
+
+    assert second.blob_id == first.blob_id
+    assert not first.deduplicated and second.deduplicated
+    assert refcount(store, first.blob_id) == 2
+    assert store.usage("alice") == store.usage("bob") == 5
+    assert store.stats()["dedup_hits"] == 1
+
+
+def test_replacing_a_file_frees_the_old_blob_and_counts_quota_once(store):
+    old = store.commit("alice", "a.txt", "text/plain", upload(b"x" * 600))
+    new = store.commit("alice", "a.txt", "text/plain", upload(b"y" * 700))
+
+    assert not old.path.exists()
+    assert refcount(store, old.blob_id) is None
+    assert new.path.exists()
+    assert store.usage("alice") == 700
+    with pytest.raises(QuotaExceeded):
+        store.commit("alice", "b.txt", "text/plain", upload(b"z" * 400))
+
+
+def test_pinned_blob_survives_replacement_until_unpinned(store):
+    pinned = store.commit("alice", "a.txt", "text/plain", upload(b"old"), pin=True)
+    store.commit("alice", "a.txt", "text/plain", upload(b"new"))
+
+    assert pinned.path.read_bytes() == b"old"
+    assert refcount(store, pinned.blob_id) == 1
+
+    store.unpin(pinned.blob_id)
+    assert not pinned.path.exists()
+    assert refcount(store, pinned.blob_id) is None
+
+
+def test_extraction_cache_evicts_least_recently_used(store):
+    store.put_extracted("a", "a" * 40)
+    store.put_extracted("b", "b" * 40)
+    assert store.get_extracted("a") == "a" * 40   # a mới dùng -> b cũ nhất
+    store.put_extracted("c", "c" * 40)
+
+    assert store.get_extracted("b") is None
+    assert store.get_extracted("a") is not None
+    assert store.get_extracted("c") is not None
+    assert store.stats()["extraction_cache_evictions"] == 1
+
+
+def test_cache_counters_are_consistent_across_threads(store):
+    store.put_extracted("a", "content")
+    threads = [
+        threading.Thread(target=lambda: [store.get_extracted(key) for key in ("a", "missing") * 50])
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = store.stats()
+    assert stats["extraction_cache_hits"] == 400
+    assert stats["extraction_cache_misses"] == 400
+
+
+class NullRetriever:
+    def index_document(self, *args):
+        pass
+
+
+def test_ingestion_job_keeps_its_blob_until_finished(store, monkeypatch):
+    monkeypatch.setattr(ingestion_module, "blob_store", store)
+    monkeypatch.setattr(ingestion_module, "get_retriever", NullRetriever)
+    pinned = store.commit("alice", "a.txt", "text/plain", upload(b"noi dung cu"), pin=True)
+    job = IngestionJob("alice", "a.txt", pinned.path, "text/plain", pinned.size, pinned.blob_id, pinned=True)
+    # User upload đè cùng filename trước khi worker kịp đọc file
+    store.commit("alice", "a.txt", "text/plain", upload(b"noi dung moi"))
+
+    async def run():
+        queue = IngestionQueue(workers=1, queue_size=1, job_timeout=30)
+        await queue.start()
+        try:
+            queue.submit(job)
+            while job.status not in ("done", "failed"):
+                await job.wait_for_change()
+            for _ in range(100):
+                if refcount(store, pinned.blob_id) is None:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await queue.stop()
+
+    asyncio.run(run())
+
+    assert job.status == "done"
+    assert job.content == "noi dung cu"
+    assert not job.pinned
+    assert not pinned.path.exists()
+    assert store.get_extracted(pinned.blob_id) == "noi dung cu"
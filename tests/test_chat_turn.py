@@ -0,0 +1,68 @@
+"""
+Test offline cho luồng lưu lượt chat qua RPC `chat_turn` (fake PostgREST).
+"""
+import asyncio
+
+import pytest
+
+from app.models.repository import RepositoryError
+
+
+def seed_session(store, user_id: str = "owner") -> str:
+    store.insert("users", {"id": user_id, "email": f"{user_id}@example.com"})
+    return store.insert("sessions", {"user_id": user_id, "session_title": "t"})["id"]
+
+
+def test_chat_turn_saves_question_and_answer(fake_repository):
+    repo, store = fake_repository
+    session_id = seed_session(store)
+
+    turn = asyncio.run(repo.create_chat_turn(session_id, "owner", "Câu hỏi?", "Trả lời.", "fake"))
+
+    question = store.table("questions")[turn["question_id"]]
+    answer = store.table("answers")[turn["answer_id"]]
+    assert question["session_id"] == session_id and question["content"] == "Câu hỏi?"
+    assert answer["question_id"] == question["id"] and answer["generated_by"] == "fake"
+    assert repo.session_owners.get(session_id) == "owner"
+    assert repo.question_sessions.get(turn["question_id"]) == session_id
+
+
+@pytest.mark.parametrize("user_id, session_exists, status_code", [
+    ("intruder", True, 403),
+    ("owner", False, 404),
+])
+def test_chat_turn_rejects_without_writing(fake_repository, user_id, session_exists, status_code):
+    repo, store = fake_repository
+    session_id = seed_session(store) if session_exists else "00000000-0000-0000-0000-000000000000"
+
+    with pytest.raises(RepositoryError) as error:
+        asyncio.run(repo.create_chat_turn(session_id, user_id, "Câu hỏi?", "Trả lời."))
+
+    assert error.value.status_code == status_code
+    assert store.table("questions") == {} and store.table("answers") == {}
+
+
+class FailingScheduler:
+    """Không được gọi tới: session sai phải bị từ chối trước khi sinh câu trả lời"""
+
+    async def generate(self, *args, **kwargs):
+        raise AssertionError("generate() called for a rejected session")
+
+
+@pytest.mark.parametrize("user_id, session_exists, status_code", [
+    ("intruder", True, 403),
+    ("owner", False, 404),
+])
+def test_chat_checks_session_owner_before_generation(fake_repository, api, user_id, session_exists, status_code):
+    from app.models.generation import get_generation_scheduler
+
+    repo, store = fake_repository
+    session_id = seed_session(store) if session_exists else "00000000-0000-0000-0000-000000000000"
+    api.overrides[get_generation_scheduler] = FailingScheduler
+
+    # Cache owner trống: endpoint phải tự tra session
+    assert repo.session_owners.get(session_id) is None
+    response = api("POST", "/chat/", user_id=user_id, json={"session_id": session_id, "question": "Câu hỏi?"})
+
+    assert response.status_code == status_code
+    assert store.table("questions") == {}
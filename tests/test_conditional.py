@@ -0,0 +1,90 @@
+import pytest
+
+from app.models.conditional import RenderedResponseCache, etag_matches, get_response_cache, make_etag
+
+
+def test_etag_is_scoped_to_resource_version_and_query():
+    etag = make_etag("sessions", "u1", 3)
+
+    assert etag != make_etag("sessions", "u2", 3)
+    assert etag != make_etag("sessions", "u1", 4)
+    assert etag != make_etag("sessions", "u1", 3, "limit=10")
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches('"other"', etag)
+
+
+def test_rendered_cache_evicts_by_bytes_and_skips_oversized_bodies():
+    cache = RenderedResponseCache(max_bytes=10, max_item_bytes=8)
+    cache.set("a", b"aaaa")
+    cache.set("b", b"bbbb")
+    assert cache.get("a") is not None   # a mới dùng -> b bị đẩy ra trước
+    cache.set("c", b"cccc")
+    cache.set("big", b"x" * 9)
+
+    assert cache.get("b") is None
+    assert cache.get("big") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.bytes == 8
+    assert cache.stats()["evictions"] == 1
+
+
+@pytest.fixture
+def session(fake_repository, api):
+    """Session của owner, cache response riêng cho test; đếm số lần gọi PostgREST"""
+    repo, store = fake_repository
+    api.overrides[get_response_cache] = RenderedResponseCache
+    store.insert("users", {"id": "owner", "email": "owner@example.com"})
+    session_id = store.insert("sessions", {"user_id": "owner", "session_title": "t"})["id"]
+    question = store.insert("questions", {"session_id": session_id, "content": "q"})
+    store.insert("answers", {"question_id": question["id"], "content": "a", "generated_by": "fake"})
+
+    calls = []
+    send = repo._send
+
+    async def counting_send(method, path, *args, **kwargs):
+        calls.append((method, path))
+        return await send(method, path, *args, **kwargs)
+
+    repo._send = counting_send
+    return session_id, calls
+
+
+def test_matching_if_none_match_returns_304_without_database_reads(api, session):
+    session_id, calls = session
+    url = f"/chat/sessions/{session_id}/conversation"
+    first = api("GET", url)
+    etag = first.headers["etag"]
+    calls.clear()
+
+    again = api("GET", url, headers={"If-None-Match": etag})
+
+    assert first.status_code == 200
+    assert first.headers["cache-control"] == "private, no-cache"
+    assert again.status_code == 304
+    assert again.headers["etag"] == etag
+    assert calls == []
+
+
+@pytest.mark.parametrize("path", ["/chat/sessions/", "/chat/sessions/{id}/conversation", "/chat/sessions/{id}/questions"])
+def test_update_session_changes_etag(api, session, path):
+    session_id, _ = session
+    url = path.format(id=session_id)
+    etag = api("GET", url).headers["etag"]
+
+    assert api("PUT", f"/chat/sessions/{session_id}", json={"session_title": "mới"}).status_code == 200
+    after = api("GET", url, headers={"If-None-Match": etag})
+
+    assert after.status_code == 200
+    assert after.headers["etag"] != etag
+
+
+def test_etag_of_one_user_does_not_match_another(api, session):
+    etag = api("GET", "/chat/sessions/").headers["etag"]
+
+    other = api("GET", "/chat/sessions/", user_id="other", headers={"If-None-Match": etag})
+
+    assert other.status_code == 200
+    assert other.json() == []
@@ -0,0 +1,85 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from app.models import ingestion as ingestion_module
+from app.models.file_processor import MAX_CONTENT_CHARS
+from app.models.ingestion import IngestionPool, IngestionQueue, terminate_pool
+
+
+def test_pool_records_worker_pids():
+    pool = IngestionPool(2)
+    try:
+        pids = {pool.submit(os.getpid).result(timeout=30) for _ in range(4)}
+        assert pids <= pool.worker_pids()
+        assert os.getpid() not in pids
+    finally:
+        terminate_pool(pool)
+
+
+def test_terminate_pool_kills_running_task():
+    pool = IngestionPool(1)
+    pool.submit(os.getpid).result(timeout=30)
+    (pid,) = pool.worker_pids()
+    hung = pool.submit(time.sleep, 60)
+
+    terminate_pool(pool)
+
+    with pytest.raises(BrokenProcessPool):
+        hung.result(timeout=30)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            break
+        time.sleep(0.05)
+    else:
+        pytest.fail("process con vẫn còn sống sau terminate_pool")
+
+
+class FakeRanges:
+    """Thay extract_pdf_range (chạy trên thread pool): mỗi khoảng trả `chars_per_range` ký tự"""
+
+    def __init__(self, chars_per_range: int):
+        self.chars_per_range = chars_per_range
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, path, start, stop, max_chars):
+        with self._lock:
+            self.calls.append((start, stop, max_chars))
+        time.sleep(0.01)
+        return str(start // 80) * min(self.chars_per_range, max_chars)
+
+
+def extract_ranges(monkeypatch, fake: FakeRanges, page_count: int, workers: int = 2) -> str:
+    monkeypatch.setattr(ingestion_module, "extract_pdf_range", fake)
+    queue = IngestionQueue(workers=workers)
+    with ThreadPoolExecutor(workers) as pool:
+        return asyncio.run(queue._extract_pdf_ranges(pool, "doc.pdf", page_count))
+
+
+def test_pdf_ranges_stop_once_combined_text_reaches_cap(monkeypatch):
+    fake = FakeRanges(MAX_CONTENT_CHARS // 3 + 1)
+
+    content = extract_ranges(monkeypatch, fake, page_count=640)
+
+    assert len(content) == MAX_CONTENT_CHARS
+    # 3 khoảng đầu đã đủ: chỉ thêm tối đa một khoảng đang chạy song song, không chạy cả 8 khoảng
+    assert len(fake.calls) <= 4
+    assert [start for start, _, _ in sorted(fake.calls)][:3] == [0, 80, 160]
+
+
+def test_pdf_ranges_are_joined_in_page_order(monkeypatch):
+    fake = FakeRanges(3)
+
+    content = extract_ranges(monkeypatch, fake, page_count=640)
+
+    assert len(fake.calls) == 8
+    assert content == "".join(str(index) * 3 for index in range(8))
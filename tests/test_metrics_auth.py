@@ -0,0 +1,39 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.models import security
+
+
+def get(url: str, **headers) -> httpx.Response:
+    from app.main import app
+
+    async def send():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get(url, headers=headers)
+
+    return asyncio.run(send())
+
+
+@pytest.mark.parametrize("url", ["/metrics", "/stats"])
+def test_requires_stats_token(monkeypatch, url):
+    monkeypatch.setattr(security, "STATS_TOKEN", "secret")
+
+    assert get(url).status_code == 401
+    assert get(url, **{"X-Stats-Token": "wrong"}).status_code == 401
+
+
+def test_metrics_with_token(monkeypatch):
+    monkeypatch.setattr(security, "STATS_TOKEN", "secret")
+
+    response = get("/metrics", **{"X-Stats-Token": "secret"})
+
+    assert response.status_code == 200
+    assert "http_request_duration_seconds" in response.text
+
+
+def test_metrics_hidden_without_configured_token(monkeypatch):
+    monkeypatch.setattr(security, "STATS_TOKEN", "")
+    assert get("/metrics", **{"X-Stats-Token": ""}).status_code == 404
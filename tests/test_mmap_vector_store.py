@@ -0,0 +1,125 @@
+"""
+Test cho MmapVectorStore: tạo collection đồng thời, index trường payload, compaction.
+"""
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.models.mmap_vector_store import MmapVectorStore, Segment
+from app.models.retrieval import match
+from app.models.vector_store import PointStruct, VectorParams
+
+DIM = 8
+
+
+def points(ids, filename="a.pdf", blob_id="blob-a", seed=0):
+    rng = np.random.default_rng(seed)
+    return [PointStruct(id=point_id, vector=rng.normal(size=DIM).tolist(),
+                        payload={"filename": filename, "blob_id": blob_id, "text": f"đoạn {point_id}"})
+            for point_id in ids]
+
+
+def wait_compaction(store, name="c"):
+    collection = store.collections[name]
+    while collection._compacting:
+        time.sleep(0.01)
+    return collection
+
+
+def test_create_collection_keeps_data_written_by_another_worker(tmp_path):
+    first, second = MmapVectorStore(tmp_path), MmapVectorStore(tmp_path)
+    assert first.create_collection("c", VectorParams(size=DIM)) is True
+    first.upsert("c", points(["p1", "p2"]))
+
+    # Worker thứ hai đã thấy collection_exists() == False trước khi worker đầu ghi
+    assert second.create_collection("c", VectorParams(size=DIM)) is False
+    assert second.count("c").count == 2
+    assert first.count("c").count == 2
+
+
+def test_concurrent_create_and_upsert_loses_nothing(tmp_path):
+    stores = [MmapVectorStore(tmp_path) for _ in range(4)]
+    barrier = threading.Barrier(len(stores))
+
+    def worker(index, store):
+        barrier.wait()
+        if not store.collection_exists("c"):
+            store.create_collection("c", VectorParams(size=DIM))
+        store.upsert("c", points([f"w{index}-{i}" for i in range(5)], seed=index))
+
+    threads = [threading.Thread(target=worker, args=(index, store)) for index, store in enumerate(stores)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert MmapVectorStore(tmp_path).count("c").count == 20
+
+
+def test_filtered_count_and_delete_use_field_index(tmp_path, monkeypatch):
+    store = MmapVectorStore(tmp_path)
+    store.create_collection("c", VectorParams(size=DIM))
+    store.upsert("c", points(range(10), "a.pdf", "blob-a"))
+    store.upsert("c", points(range(10, 15), "b.pdf", "blob-b"))
+
+    def no_payload_parsing(self, row):
+        raise AssertionError("payload parsed for an indexed filter")
+
+    monkeypatch.setattr(Segment, "record", no_payload_parsing)
+    assert store.count("c", match(filename="a.pdf", blob_id="blob-a")).count == 10
+    assert store.count("c", match(filename="a.pdf", blob_id="blob-b")).count == 0
+    store.delete("c", match(filename="a.pdf"))
+    assert store.count("c", match(filename="a.pdf")).count == 0
+    assert store.count("c").count == 5
+
+
+def test_unindexed_filter_and_legacy_segment_fall_back_to_payload(tmp_path):
+    store = MmapVectorStore(tmp_path)
+    store.create_collection("c", VectorParams(size=DIM))
+    store.upsert("c", points(range(6), "a.pdf"))
+    assert store.count("c", match(text="đoạn 3")).count == 1
+
+    for path in (tmp_path / "c").glob("*.fields"):
+        path.unlink()  # segment ghi trước khi có index
+    legacy = MmapVectorStore(tmp_path)
+    assert legacy.count("c", match(filename="a.pdf")).count == 6
+
+
+def test_compaction_keeps_live_points_and_remaps_field_index(tmp_path):
+    store = MmapVectorStore(tmp_path)
+    store.create_collection("c", VectorParams(size=DIM))
+    store.upsert("c", points(range(10), "a.pdf", "blob-a"))
+    store.upsert("c", points(range(10, 20), "b.pdf", "blob-b"))
+    store.delete("c", [0, 1, 2, 15])
+    store.upsert("c", points([3], "c.pdf", "blob-c", seed=7))  # ghi đè điểm 3 sang file khác
+    collection = wait_compaction(store)
+
+    collection.compact()
+
+    assert len(collection.segments) == 1
+    assert store.count("c").count == 16
+    assert store.count("c", match(filename="a.pdf")).count == 6
+    assert store.count("c", match(filename="b.pdf")).count == 9
+    assert store.count("c", match(filename="c.pdf", blob_id="blob-c")).count == 1
+    query = np.asarray(points([3], seed=7)[0].vector)
+    best = store.search("c", query_vector=query, limit=1)[0]
+    assert best.id == 3 and best.payload["filename"] == "c.pdf"
+
+
+def test_create_collection_is_idempotent_in_process(tmp_path):
+    store = MmapVectorStore(tmp_path)
+    assert store.create_collection("c", VectorParams(size=DIM)) is True
+    store.upsert("c", points(["x"]))
+    assert store.create_collection("c", VectorParams(size=DIM)) is False
+    assert store.count("c").count == 1
+
+
+@pytest.mark.parametrize("quantization", ["int8", "float16"])
+def test_search_returns_nearest_point(tmp_path, quantization):
+    store = MmapVectorStore(tmp_path, quantization)
+    store.create_collection("c", VectorParams(size=DIM))
+    stored = points(range(50))
+    store.upsert("c", stored)
+    assert store.search("c", query_vector=stored[17].vector, limit=1)[0].id == 17
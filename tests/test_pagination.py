@@ -0,0 +1,95 @@
+"""
+Test keyset pagination: cursor do client gửi phải hợp lệ trước khi thành filter PostgREST.
+"""
+import asyncio
+import base64
+import json
+
+import pytest
+
+import app.models.repository as repository_module
+from app.models.pagination import InvalidCursor, decode_cursor, encode_cursor
+
+ROW = {"created_at": "2026-10-18T19:10:57.320921+00:00", "id": "c49ed427-c2e3-4ea6-8382-d392e4cb87fa"}
+
+
+def raw_cursor(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip("=")
+
+
+BAD_CURSORS = [
+    "không-phải-base64!",
+    raw_cursor([ROW["created_at"]]),                        # thiếu id
+    raw_cursor([]),                                         # thiếu cả hai
+    raw_cursor({"created_at": ROW["created_at"]}),
+    raw_cursor(['x",id.neq."1', ROW["id"]]),                # giá trị sắp xếp không phải timestamp
+    raw_cursor([ROW["created_at"], 'a"),or(id.gt.0']),      # id không phải UUID
+    raw_cursor([ROW["created_at"], None]),
+]
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(ROW, "created_at")) == (ROW["created_at"], ROW["id"])
+
+
+@pytest.mark.parametrize("cursor", BAD_CURSORS)
+def test_decode_cursor_rejects_malformed_fields(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+@pytest.fixture
+def keyset_spy(monkeypatch):
+    calls = []
+    original = repository_module.keyset_filter
+
+    def spy(*args):
+        calls.append(args)
+        return original(*args)
+
+    monkeypatch.setattr(repository_module, "keyset_filter", spy)
+    return calls
+
+
+def seed_conversation(store, turns: int = 5) -> str:
+    session_id = store.insert("sessions", {"user_id": "owner", "session_title": "t"})["id"]
+    for turn in range(turns):
+        question = store.insert("questions", {"session_id": session_id, "content": f"Câu hỏi {turn}?"})
+        store.insert("answers", {"question_id": question["id"], "content": f"Trả lời {turn}."})
+    return session_id
+
+
+@pytest.mark.parametrize("cursor", BAD_CURSORS)
+def test_conversation_with_bad_cursor_returns_400_before_filter(fake_repository, api, keyset_spy, cursor):
+    _, store = fake_repository
+    session_id = seed_conversation(store)
+
+    response = api("GET", f"/chat/sessions/{session_id}/conversation", params={"limit": 2, "after": cursor})
+
+    assert response.status_code == 400
+    assert "Cursor không hợp lệ" in response.json()["detail"]
+    assert keyset_spy == []
+
+
+def test_conversation_pages_follow_next_cursor(fake_repository, api, keyset_spy):
+    _, store = fake_repository
+    session_id = seed_conversation(store)
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"after": cursor} if cursor else {})}
+        page = api("GET", f"/chat/sessions/{session_id}/conversation", params=params).json()
+        seen.extend(item["question"] for item in page["conversation"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+    assert seen == [f"Câu hỏi {turn}?" for turn in range(5)]
+    assert len(keyset_spy) == 2
+
+
+def test_select_page_rejects_before_and_after_together(fake_repository):
+    repo, _ = fake_repository
+    cursor = encode_cursor(ROW, "created_at")
+    with pytest.raises(InvalidCursor):
+        asyncio.run(repo.list_conversation_page("s", 2, before=cursor, after=cursor))
@@ -0,0 +1,126 @@
+import asyncio
+import builtins
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from app.models import security as security_module
+from app.models.rate_limit import (
+    MemoryRateLimitBackend, RateLimiter, RateLimitMiddleware, RedisRateLimitBackend, evaluate,
+)
+from app.models.security import SecurityUtils, get_current_user_or_api_key
+from app.schemas.security import RateLimitConfig, TokenData
+
+CONFIG = RateLimitConfig(max_requests=2, window_seconds=60)
+
+
+def test_previous_window_is_weighted_by_its_remaining_overlap():
+    # 15s vào cửa sổ mới: cửa sổ trước còn phủ 3/4 khoảng -> 4 * 0.75 = 3 request
+    config = RateLimitConfig(max_requests=5, window_seconds=60)
+    assert evaluate(prev=4, curr=1, now=6015, config=config).allowed
+    assert not evaluate(prev=4, curr=2, now=6015, config=config).allowed
+    # Cuối cửa sổ, phần cửa sổ trước gần như không còn tính
+    assert evaluate(prev=4, curr=2, now=6059, config=config).allowed
+
+
+def test_memory_backend_counts_within_window_and_carries_into_next():
+    limiter = RateLimiter(MemoryRateLimitBackend(shards=1), CONFIG)
+
+    async def hits(*times):
+        return [await limiter.hit("user:a", now=now) for now in times]
+
+    first, second, third, next_start, next_late = asyncio.run(hits(6000, 6010, 6020, 6060, 6115))
+
+    assert first.allowed and second.allowed and not third.allowed
+    assert third.remaining == 0 and third.retry_after > 0
+    # Đầu cửa sổ sau: 2 request của cửa sổ trước vẫn tính gần đủ
+    assert not next_start.allowed
+    # Gần hết cửa sổ sau: phần cửa sổ trước còn ~0.17 request
+    assert next_late.allowed
+    assert limiter.stats()["limited"] == 2
+
+
+def test_rejected_requests_are_not_counted():
+    backend = MemoryRateLimitBackend(shards=1)
+    limiter = RateLimiter(backend, CONFIG)
+
+    async def hits():
+        return [(await limiter.hit("user:a", now=now)).allowed for now in range(6000, 6005)]
+
+    assert asyncio.run(hits()) == [True, True, False, False, False]
+    window_index, prev, curr, _ = backend.shards[0]["user:a"]
+    assert (window_index, prev, curr) == (100, 0, 2)
+
+
+def test_retry_after_points_to_when_a_request_fits_again():
+    limiter = RateLimiter(MemoryRateLimitBackend(shards=1), CONFIG)
+
+    async def retry_after():
+        await limiter.hit("user:a", now=6000)
+        await limiter.hit("user:a", now=6000)
+        rejected = await limiter.hit("user:a", now=6030)
+        later = await limiter.hit("user:a", now=6030 + rejected.retry_after + 0.01)
+        return rejected, later
+
+    rejected, later = asyncio.run(retry_after())
+
+    assert not rejected.allowed
+    assert later.allowed
+
+
+@pytest.fixture
+def limited_app():
+    """App nhỏ chỉ có một route bị giới hạn; đếm số lần verify JWT"""
+    app = FastAPI()
+
+    @app.post("/chat/")
+    async def chat(current_user: TokenData = Depends(get_current_user_or_api_key)):
+        return {"user_id": current_user.user_id}
+
+    limiter = RateLimiter(MemoryRateLimitBackend(shards=1), CONFIG)
+    return RateLimitMiddleware(app, limiter=limiter, routes=frozenset({("POST", "/chat/")}))
+
+
+def test_middleware_rejects_with_retry_after_and_ratelimit_headers(limited_app):
+    client = TestClient(limited_app)
+
+    responses = [client.post("/chat/") for _ in range(3)]
+
+    assert [response.status_code for response in responses] == [401, 401, 429]
+    assert responses[0].headers["x-ratelimit-limit"] == "2"
+    assert responses[0].headers["x-ratelimit-remaining"] == "1"
+    rejected = responses[2]
+    assert rejected.headers["x-ratelimit-remaining"] == "0"
+    assert int(rejected.headers["retry-after"]) >= 1
+
+
+def test_middleware_verifies_bearer_token_once_per_request(limited_app, monkeypatch):
+    calls = []
+    verify_token = SecurityUtils.verify_token
+
+    def counting_verify(token):
+        calls.append(token)
+        return verify_token(token)
+
+    monkeypatch.setattr(SecurityUtils, "verify_token", staticmethod(counting_verify))
+    token = SecurityUtils.create_access_token({"sub": "owner", "email": "owner@example.com"})
+
+    response = TestClient(limited_app).post("/chat/", headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 200
+    assert response.json() == {"user_id": "owner"}
+    assert len(calls) == 1
+
+
+def test_redis_backend_without_package_fails_clearly(monkeypatch):
+    real_import = builtins.__import__
+
+    def no_redis(name, *args, **kwargs):
+        if name.startswith("redis"):
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, "__import__", no_redis)
+    with pytest.raises(RuntimeError, match="redis"):
+        RedisRateLimitBackend()
@@ -0,0 +1,70 @@
+"""
+Repository async trên fake PostgREST: CRUD qua HTTP, lỗi PostgREST -> RepositoryError,
+và các lần gọi đồng thời chạy chồng nhau thay vì chặn event loop.
+"""
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.models.fake_postgrest import create_fake_postgrest
+from app.models.repository import RepositoryError, SupabaseRepository
+
+
+def test_sessions_round_trip(fake_repository):
+    repo, store = fake_repository
+    user = store.insert("users", {"email": "owner@example.com"})
+
+    async def scenario():
+        session = await repo.create_session({"user_id": user["id"], "session_title": "Đầu tiên"})
+        await repo.update_session(session["id"], {"session_title": "Đã đổi tên"})
+        listed = await repo.list_sessions(user["id"])
+        deleted = await repo.delete_session(session["id"])
+        return session, listed, deleted, await repo.get_session(session["id"])
+
+    session, listed, deleted, after = asyncio.run(scenario())
+
+    assert [row["session_title"] for row in listed] == ["Đã đổi tên"]
+    assert [row["id"] for row in deleted] == [session["id"]]
+    assert after is None
+    assert asyncio.run(repo.get_session_owner(session["id"])) is None
+
+
+def test_user_lookup_by_email(fake_repository):
+    repo, _ = fake_repository
+    created = asyncio.run(repo.create_user({"email": "a@example.com", "full_name": "A"}))
+
+    found = asyncio.run(repo.get_user_by_email("a@example.com", "id,email"))
+
+    assert found == {"id": created["id"], "email": "a@example.com"}
+    assert asyncio.run(repo.get_user_by_email("missing@example.com")) is None
+
+
+def test_postgrest_error_raises_repository_error(fake_repository):
+    repo, _ = fake_repository
+
+    with pytest.raises(RepositoryError) as raised:
+        asyncio.run(repo.rpc("does_not_exist", {}))
+
+    assert raised.value.status_code == 404
+    assert raised.value.code == "PGRST202"
+
+
+def test_concurrent_calls_overlap_their_io():
+    latency = 0.1
+    fake = create_fake_postgrest(latency_ms=latency * 1000)
+    ids = [fake.state.store.insert("sessions", {"user_id": f"u{i}", "session_title": "s"})["id"] for i in range(10)]
+
+    async def scenario():
+        client = httpx.AsyncClient(base_url="http://fake-supabase/rest/v1", transport=httpx.ASGITransport(app=fake))
+        repo = SupabaseRepository(client=client)
+        started = time.perf_counter()
+        sessions = await asyncio.gather(*(repo.get_session(session_id) for session_id in ids))
+        return sessions, time.perf_counter() - started
+
+    sessions, elapsed = asyncio.run(scenario())
+
+    assert [session["id"] for session in sessions] == ids
+    # Tuần tự sẽ mất 10 * latency
+    assert elapsed < 4 * latency
@@ -0,0 +1,23 @@
+"""
+Test offline cho filter PostgREST do repository dựng (fake PostgREST).
+"""
+import asyncio
+
+from app.models.repository import SupabaseRepository, quote_value
+
+
+def test_quote_value_escapes_quotes_and_backslashes():
+    assert quote_value('a"b') == '"a\\"b"'
+    assert quote_value("a\\b") == '"a\\\\b"'
+    assert SupabaseRepository._eq({"id": ["x", 'y"),or(id.neq.0']}) == {"id": 'in.("x","y\\"),or(id.neq.0")'}
+
+
+def test_in_filter_matches_values_with_special_characters(fake_repository):
+    repo, store = fake_repository
+    titles = ['có "ngoặc kép"', "có \\ gạch chéo", "có, dấu phẩy (và ngoặc)", "khác"]
+    for title in titles:
+        store.insert("sessions", {"user_id": "owner", "session_title": title})
+
+    rows = asyncio.run(repo.select("sessions", "session_title", {"session_title": titles[:3]}))
+
+    assert sorted(row["session_title"] for row in rows) == sorted(titles[:3])
@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+from app.models.revocation import RevocationList
+from app.models.security import SecurityUtils, credentials_still_valid
+
+
+def test_tokens_carry_unique_jti():
+    first = SecurityUtils.verify_token(SecurityUtils.create_access_token({"sub": "u1"}))
+    second = SecurityUtils.verify_token(SecurityUtils.create_access_token({"sub": "u1"}))
+
+    assert first.jti and second.jti and first.jti != second.jti
+    assert first.exp is not None
+
+
+def test_revoked_jti_is_found_only_until_exp():
+    revocations = RevocationList(bucket_seconds=60)
+    exp = int(time.time()) + 120
+    revocations.add("a", exp)
+    revocations.add("expired", int(time.time()) - 1)
+
+    assert revocations.is_revoked("a", exp)
+    assert not revocations.is_revoked("b", exp)
+    assert not revocations.is_revoked("expired", int(time.time()) - 1)
+    assert len(revocations) == 1
+
+    revocations.prune(now=exp + 60)
+    assert not revocations.buckets
+    assert not revocations.is_revoked("a", exp)
+
+
+def test_credentials_still_valid_checks_revocation(monkeypatch):
+    from app.models import security as security_module
+
+    revocations = RevocationList()
+    monkeypatch.setattr(security_module, "revocation_list", revocations)
+    data = SecurityUtils.verify_token(SecurityUtils.create_access_token({"sub": "u1"}))
+    assert credentials_still_valid(data)
+
+    revocations.add(data.jti, data.exp)
+    assert not credentials_still_valid(data)
+
+
+def test_revocation_reaches_other_workers_through_sync(fake_repository):
+    repo, store = fake_repository
+    worker_a = RevocationList(repo=repo)
+    worker_b = RevocationList(repo=repo)
+    exp = int(time.time()) + 600
+
+    async def scenario():
+        await worker_b.sync()
+        await worker_a.revoke("jti-1", exp, None)
+        before = worker_b.is_revoked("jti-1", exp)
+        await worker_b.sync()
+        return before
+
+    assert asyncio.run(scenario()) is False
+    assert worker_b.is_revoked("jti-1", exp)
+    assert len(store.table("revoked_tokens")) == 1
+
+
+def test_sync_drops_expired_rows_from_database(fake_repository, monkeypatch):
+    from app.models import revocation as revocation_module
+
+    repo, store = fake_repository
+    store.insert("revoked_tokens", {"jti": "old", "exp": int(time.time()) - 10})
+    store.insert("revoked_tokens", {"jti": "new", "exp": int(time.time()) + 600})
+    monkeypatch.setattr(revocation_module, "REVOCATION_CLEANUP_INTERVAL", 0)
+    revocations = RevocationList(repo=repo)
+
+    asyncio.run(revocations.sync())
+
+    assert len(revocations) == 1
+    assert [row["jti"] for row in store.table("revoked_tokens").values()] == ["new"]
@@ -0,0 +1,106 @@
+"""
+Single-flight của repository: đọc trùng đang bay gộp thành một lần gọi PostgREST,
+nhưng chỉ trong phạm vi một user, và lệnh ghi bỏ các lần đọc đang bay.
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from app.models.fake_postgrest import create_fake_postgrest
+from app.models.repository import SupabaseRepository
+
+
+class GatedTransport(httpx.AsyncBaseTransport):
+    """Giữ mọi GET cho tới khi `release()`; đếm số GET thật sự tới upstream"""
+
+    def __init__(self, app):
+        self.inner = httpx.ASGITransport(app=app)
+        self.gets = 0
+        self.arrived = asyncio.Event()
+        self.gate = asyncio.Event()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.method == "GET":
+            self.gets += 1
+            self.arrived.set()
+            await self.gate.wait()
+        return await self.inner.handle_async_request(request)
+
+    def release(self):
+        self.gate.set()
+
+
+@pytest.fixture
+def gated():
+    """(make, session_id): `make()` tạo (repository, transport) trong event loop của test"""
+    fake = create_fake_postgrest()
+    session = fake.state.store.insert("sessions", {"user_id": "owner", "session_title": "s"})
+    fake.state.store.insert("questions", {"session_id": session["id"], "content": "q1"})
+
+    def make():
+        transport = GatedTransport(fake)
+        client = httpx.AsyncClient(base_url="http://fake-supabase/rest/v1", transport=transport)
+        return SupabaseRepository(client=client), transport
+
+    return make, session["id"]
+
+
+def test_concurrent_identical_reads_share_one_upstream_call(gated):
+    make, session_id = gated
+
+    async def scenario():
+        repo, transport = make()
+        reads = [asyncio.create_task(repo.list_questions(session_id, user_id="owner")) for _ in range(5)]
+        await transport.arrived.wait()
+        transport.release()
+        return transport.gets, await asyncio.gather(*reads)
+
+    gets, results = asyncio.run(scenario())
+
+    assert gets == 1
+    assert all(result == results[0] for result in results)
+    # Mỗi caller nhận object riêng
+    assert len({id(result) for result in results}) == len(results)
+
+
+def test_reads_of_different_users_are_not_shared(gated):
+    make, session_id = gated
+
+    async def scenario():
+        repo, transport = make()
+        reads = [
+            asyncio.create_task(repo.list_questions(session_id, user_id=user_id))
+            for user_id in ("owner", "other", "owner")
+        ]
+        await transport.arrived.wait()
+        await asyncio.sleep(0)
+        transport.release()
+        await asyncio.gather(*reads)
+        return transport.gets, repo.single_flight.stats()
+
+    gets, stats = asyncio.run(scenario())
+
+    assert gets == 2
+    assert stats["coalesced"] == 1
+
+
+def test_write_invalidates_inflight_reads(gated):
+    make, session_id = gated
+
+    async def scenario():
+        repo, transport = make()
+        before = asyncio.create_task(repo.list_questions(session_id, user_id="owner"))
+        await transport.arrived.wait()
+        await repo.create_question({"session_id": session_id, "content": "q2"})
+        after = asyncio.create_task(repo.list_questions(session_id, user_id="owner"))
+        await asyncio.sleep(0)
+        transport.release()
+        await before
+        return transport.gets, await after, repo.single_flight.stats()
+
+    gets, after, stats = asyncio.run(scenario())
+
+    assert gets == 2
+    assert stats["invalidated"] >= 1
+    assert [question["content"] for question in after] == ["q1", "q2"]
@@ -0,0 +1,67 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.models.revocation import revocation_list
+from app.models.security import SecurityUtils, token_cache
+
+
+@pytest.fixture
+def revocations(fake_repository, monkeypatch):
+    """Danh sách thu hồi toàn cục ghi vào fake PostgREST, trạng thái trả lại sau test"""
+    repo, store = fake_repository
+    monkeypatch.setattr(revocation_list, "_repo", repo)
+    monkeypatch.setattr(revocation_list, "buckets", {})
+    return store
+
+
+def send(*requests):
+    from app.main import app
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return [await client.request(method, url, headers=headers) for method, url, headers in requests]
+
+    return asyncio.run(run())
+
+
+def issue_token(user_id: str = "user-1") -> str:
+    return SecurityUtils.create_access_token({"sub": user_id, "email": f"{user_id}@example.com"})
+
+
+def test_verified_token_is_cached():
+    token = issue_token()
+    first = SecurityUtils.verify_token(token)
+    assert token_cache.get(SecurityUtils.token_digest(token)) is first
+    assert SecurityUtils.verify_token(token) is first
+
+
+def test_logout_purges_cache_and_next_request_is_rejected(revocations):
+    token = issue_token()
+    digest = SecurityUtils.token_digest(token)
+    SecurityUtils.verify_token(token)
+    assert token_cache.get(digest) is not None
+
+    headers = {"Authorization": f"Bearer {token}"}
+    logout, after = send(("POST", "/auth/logout", headers), ("POST", "/auth/refresh", headers))
+
+    assert logout.status_code == 200
+    assert after.status_code == 401
+    assert token_cache.get(digest) is None
+    assert len(revocations.table("revoked_tokens")) == 1
+
+
+def test_revoked_cache_hit_drops_entry(revocations):
+    """Token bị thu hồi ở worker khác (qua đồng bộ) vẫn còn trong cache của worker này"""
+    token = issue_token()
+    digest = SecurityUtils.token_digest(token)
+    data = SecurityUtils.verify_token(token)
+
+    revocation_list.add(data.jti, data.exp)
+
+    with pytest.raises(Exception) as raised:
+        SecurityUtils.verify_token(token)
+    assert raised.value.status_code == 401
+    assert token_cache.get(digest) is None
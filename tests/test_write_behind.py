@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+from app.models.repository import RepositoryError
+from app.models.write_behind import WriteBehindQueue
+
+
+class CountingRepository:
+    """Bọc repository thật, đếm số lần gọi RPC write-behind theo bảng"""
+
+    def __init__(self, repo):
+        self.repo = repo
+        self.calls = []
+
+    async def apply_deferred_updates(self, table, rows):
+        self.calls.append((table, len(rows)))
+        return await self.repo.apply_deferred_updates(table, rows)
+
+
+class FailingRepository:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+    async def apply_deferred_updates(self, table, rows):
+        await asyncio.sleep(0)
+        raise RepositoryError(self.status_code, "lỗi", None)
+
+
+def test_flush_coalesces_rows_and_sends_one_rpc_per_table(fake_repository):
+    repo, store = fake_repository
+    users = [store.insert("users", {"email": f"u{i}@example.com"}) for i in range(3)]
+    key = store.insert("api_keys", {"user_id": users[0]["id"], "name": "k"})
+    counting = CountingRepository(repo)
+    queue = WriteBehindQueue(repo=counting)
+
+    for user in users:
+        queue.enqueue("users", user["id"], {"last_login": "2026-01-01T00:00:00Z"})
+    queue.enqueue("users", users[0]["id"], {"last_login": "2026-01-02T00:00:00Z"})
+    queue.enqueue("api_keys", key["id"], {"last_used": "2026-01-03T00:00:00Z"})
+    asyncio.run(queue.flush())
+
+    assert sorted(counting.calls) == [("api_keys", 1), ("users", 3)]
+    assert store.table("users")[users[0]["id"]]["last_login"] == "2026-01-02T00:00:00Z"
+    assert store.table("users")[users[2]["id"]]["last_login"] == "2026-01-01T00:00:00Z"
+    assert store.table("api_keys")[key["id"]]["last_used"] == "2026-01-03T00:00:00Z"
+    assert len(queue) == 0
+    assert queue.stats()["coalesced"] == 1
+
+
+def test_enqueue_rejects_tables_and_columns_outside_whitelist():
+    queue = WriteBehindQueue(repo=FailingRepository(500))
+    with pytest.raises(ValueError):
+        queue.enqueue("sessions", "id", {"session_title": "x"})
+    with pytest.raises(ValueError):
+        queue.enqueue("users", "id", {"password_hash": "x"})
+    assert len(queue) == 0
+
+
+def test_rpc_validates_whole_batch_before_writing(fake_repository):
+    repo, store = fake_repository
+    user = store.insert("users", {"email": "u@example.com", "last_login": None})
+    rows = [{"id": user["id"], "last_login": "2026-01-01T00:00:00Z"}, {"id": user["id"], "email": "x"}]
+
+    with pytest.raises(RepositoryError) as raised:
+        asyncio.run(repo.apply_deferred_updates("users", rows))
+
+    assert raised.value.status_code == 400
+    assert store.table("users")[user["id"]]["last_login"] is None
+
+
+def test_server_error_requeues_batch_keeping_newer_changes():
+    queue = WriteBehindQueue(repo=FailingRepository(503))
+    queue.enqueue("users", "u1", {"last_login": "old"})
+
+    async def flush_while_enqueueing():
+        flush = asyncio.create_task(queue.flush())
+        await asyncio.sleep(0)
+        queue.enqueue("users", "u1", {"last_login": "new"})
+        await flush
+
+    asyncio.run(flush_while_enqueueing())
+
+    assert queue.pending == {("users", "u1"): {"last_login": "new"}}
+    assert queue.stats()["errors"] == 1
+    assert queue.stats()["dropped"] == 0
+
+
+def test_client_error_drops_batch():
+    queue = WriteBehindQueue(repo=FailingRepository(400))
+    queue.enqueue("users", "u1", {"last_login": "x"})
+    asyncio.run(queue.flush())
+    assert len(queue) == 0
+    assert queue.stats()["dropped"] == 1
+
+
+def test_stop_flushes_pending_changes(fake_repository):
+    repo, store = fake_repository
+    user = store.insert("users", {"email": "u@example.com"})
+    queue = WriteBehindQueue(repo=repo, flush_interval=3600)
+
+    async def scenario():
+        await queue.start()
+        queue.enqueue("users", user["id"], {"last_login": "2026-01-01T00:00:00Z"})
+        await queue.stop()
+
+    asyncio.run(scenario())
+
+    assert store.table("users")[user["id"]]["last_login"] == "2026-01-01T00:00:00Z"